@@ -7,9 +7,10 @@ from .models import User
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'role','is_staff', 'is_active')
     list_filter = ('role', 'is_staff', 'is_active')
+    readonly_fields = ('employee',)
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
-        ('Personal info', {'fields': ('first_name', 'last_name')}),
+        ('Personal info', {'fields': ('first_name', 'last_name', 'employee')}),
         ('Permissions', {'fields': ('role', 'is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
 
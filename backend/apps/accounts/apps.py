@@ -6,3 +6,6 @@ from apps import accounts
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.accounts'
+
+    def ready(self):
+        import apps.accounts.signals  # Import signals when app is ready
@@ -0,0 +1,132 @@
+"""
+stateless jwt authentication.
+
+request.user is built from the token claims (role / is_staff / is_superuser
+are added at login by CustomTokenObtainPairSerializer) instead of loading
+the user row on every request. deactivated and changed accounts are caught
+by a small auth state cache: a per process TTL / LRU layer in front of the
+shared django cache, in front of one narrow query. saving or deleting a
+user evicts its entry (signals), other processes pick the change up
+within AUTH_USER_CACHE_TTL seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+
+# user fields the permission checks rely on
+STATE_FIELDS = ('is_active', 'is_staff', 'is_superuser', 'role')
+
+
+class ClaimsUser(TokenUser):
+    """
+    token backed user exposing the role claim next to is_staff / is_superuser
+    """
+
+    @cached_property
+    def role(self):
+        return self.token.get('role', '')
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+
+class UserStateCache:
+    """
+    thread safe in process LRU of user auth states with a time to live
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, state = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return state
+
+    def set(self, user_id, state):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, state)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_states = UserStateCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+def _state_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def user_state(user_id):
+    """
+    {is_active, is_staff, is_superuser, role} of a user, None if it does not exist
+    """
+    state = user_states.get(user_id)
+    if state is not None:
+        return state
+
+    state = cache.get(_state_key(user_id))
+    if state is None:
+        row = (get_user_model().objects
+               .filter(pk=user_id)
+               .values(*STATE_FIELDS)
+               .first())
+        # deleted users are remembered too, as an empty state
+        state = row or {}
+        cache.set(_state_key(user_id), state, timeout=settings.AUTH_USER_CACHE_SHARED_TTL)
+    user_states.set(user_id, state)
+    return state
+
+
+def invalidate_user_state(user_id):
+    user_states.evict(user_id)
+    cache.delete(_state_key(user_id))
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    jwt authentication without the per request user query: the user comes
+    from the token claims, checked against the cached auth state (an
+    inactive or deleted account is rejected, a changed role / staff flag
+    wins over the claims of older tokens)
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        state = user_state(user.id)
+        if not state:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not state['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        for field in ('is_staff', 'is_superuser', 'role'):
+            user.__dict__[field] = state[field]
+        return user
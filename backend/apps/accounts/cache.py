@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.cache import cache
+from core.cache import company_scope, get_generation
+
+
+def profile_cache_key(user_id):
+    return f'api:me:{user_id}'
+
+
+def cached_profile(user_id):
+    """
+    the cached /auth/me/ payload of a user, None on a miss.
+    an entry with an employee is tied to the generation of its company, so
+    every employee / department / company write of that company expires it
+    """
+    entry = cache.get(profile_cache_key(user_id))
+    if entry is None:
+        return None
+    company_id = entry['company_id']
+    if company_id is not None and entry['generation'] != get_generation(company_scope(company_id)):
+        return None
+    return entry['data']
+
+
+def store_profile(user_id, data, company_id=None):
+    generation = get_generation(company_scope(company_id)) if company_id is not None else None
+    cache.set(profile_cache_key(user_id),
+              {'data': data, 'company_id': company_id, 'generation': generation},
+              timeout=settings.API_CACHE_TIMEOUT)
+
+
+def invalidate_profile(*user_ids):
+    cache.delete_many([profile_cache_key(user_id) for user_id in user_ids])
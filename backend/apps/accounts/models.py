@@ -14,6 +14,16 @@ class User(AbstractUser):
         choices= UserRole.choices,
         default=UserRole.EMPLOYEE,
     )
+    # the employee record behind this login, set when the account is provisioned
+    # (login and /auth/me/ read it without looking the employee up by email)
+    employee = models.OneToOneField(
+        'employees.Employee',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='user',
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
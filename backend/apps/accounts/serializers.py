@@ -1,27 +1,33 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from apps.employees.models import Employee
+from apps.employees.serializers import EmployeeProfileSerializer
 
 User = get_user_model()
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        """
+        the claims the stateless authentication builds request.user from
+        """
+        token = super().get_token(user)
+        token['email'] = user.email
+        token['role'] = user.role
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token['employee_id'] = user.employee_id
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
-        
-        # Get employee ID if it exists
-        try:
-            employee = Employee.objects.get(email=self.user.email)
-            employee_id = employee.id
-        except Employee.DoesNotExist:
-            employee_id = None
-            
-        # Add custom claims
+
+        # Add custom claims (the employee link is a column of the user row, no lookup)
         data['user'] = {
             'id': self.user.id,
             'email': self.user.email,
             'role': self.user.role,
-            'employee_id': employee_id
+            'employee_id': self.user.employee_id
         }
         
         return data
@@ -33,6 +39,18 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class MeSerializer(serializers.ModelSerializer):
+    """
+    the logged in user with their employee profile (null for non employees)
+    """
+    employee = EmployeeProfileSerializer(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'employee')
+        read_only_fields = fields
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
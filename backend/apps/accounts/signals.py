@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .authentication import invalidate_user_state
+from .cache import invalidate_profile
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_auth_state(sender, instance, raw=False, **kwargs):
+    """role / staff / active changes must reach the stateless authentication and /auth/me/"""
+    if raw:
+        return
+
+    user_id = instance.pk  # reset to None once a delete completes
+
+    def invalidate():
+        invalidate_user_state(user_id)
+        invalidate_profile(user_id)
+    transaction.on_commit(invalidate)
@@ -1,3 +1,132 @@
-from django.test import TestCase
+from unittest import skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from apps.employees.models import EmployeeStatus
+from apps.employees.provisioning import link_employee_logins, provision_pending
+from core.testing import bearer_headers, create_admin, create_departments, create_employee, enforce_query_budgets
+from .authentication import StatelessJWTAuthentication, user_states
+from .models import UserRole
 
-# Create your tests here.
+User = get_user_model()
+
+
+class StatelessJWTAuthenticationTests(TestCase):
+    """
+    request.user comes from the token claims, checked against the cached
+    auth state instead of a user query per request
+    """
+
+    def setUp(self):
+        cache.clear()
+        user_states.clear()
+        self.admin = create_admin()
+        self.headers = bearer_headers(self.admin)
+
+    def authenticate(self, headers):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=headers['authorization'])
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        return user
+
+    def user_queries(self, call):
+        with CaptureQueriesContext(connection) as queries:
+            call()
+        return [query['sql'] for query in queries if User._meta.db_table in query['sql']]
+
+    def save(self, **fields):
+        # the signals evict the auth state once the save commits
+        for name, value in fields.items():
+            setattr(self.admin, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.save()
+
+    @skipUnless(settings.JWT_STATELESS_AUTH, 'JWT_STATELESS_AUTH=False loads the user on every request')
+    def test_reads_run_no_auth_queries(self):
+        # the first request loads the auth state, the next ones read it from the cache
+        def read():
+            self.assertEqual(self.client.get('/api/v1/companies/', headers=self.headers).status_code, 200)
+        self.assertEqual(len(self.user_queries(read)), 1)
+        self.assertEqual(self.user_queries(read), [])
+        user_states.clear()  # another process: the shared cache layer answers
+        self.assertEqual(self.user_queries(lambda: self.authenticate(self.headers)), [])
+
+    def test_claims(self):
+        user = self.authenticate(self.headers)
+        self.assertEqual((user.pk, user.email, user.is_staff, user.role),
+                         (self.admin.pk, self.admin.email, True, UserRole.EMPLOYEE))
+
+    def test_state_overrides_the_claims(self):
+        self.save(is_staff=False, role=UserRole.MANAGER)
+        user = self.authenticate(self.headers)
+        self.assertEqual((user.is_staff, user.role), (False, UserRole.MANAGER))
+        # the token still claims is_staff, the demoted user is no admin any more
+        response = self.client.post('/api/v1/companies/', {'name': 'Globex'}, headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+
+    def test_deactivated_and_deleted_users(self):
+        self.assertEqual(self.client.get('/api/v1/companies/', headers=self.headers).status_code, 200)
+        self.save(is_active=False)
+        self.assertEqual(self.client.get('/api/v1/companies/', headers=self.headers).status_code, 401)
+        with self.assertRaisesMessage(AuthenticationFailed, 'User is inactive'):
+            self.authenticate(self.headers)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.delete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User not found'):
+            self.authenticate(self.headers)
+
+
+@enforce_query_budgets
+class MeTests(TestCase):
+    """
+    GET /api/v1/auth/me/: the user and the employee record linked to their
+    login, cached until the user or the employee's company changes
+    """
+
+    def setUp(self):
+        cache.clear()
+        user_states.clear()
+        [self.department] = create_departments()
+        self.employee = create_employee(self.department, 1, status=EmployeeStatus.HIRED, hired_on=timezone.now())
+        self.user = User.objects.create_user(username='employee1', email=self.employee.email, password='x')
+        self.headers = bearer_headers(self.user)
+
+    def me(self):
+        response = self.client.get('/api/v1/auth/me/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_not_an_employee(self):
+        data = self.me()
+        self.assertEqual((data['id'], data['username'], data['employee']), (self.user.pk, 'employee1', None))
+
+    def test_linked_employee(self):
+        self.assertIsNone(self.me()['employee'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(link_employee_logins(), 1)
+        employee = self.me()['employee']
+        self.assertEqual(
+            (employee['id'], employee['company_name'], employee['department_name'], employee['days_employed']),
+            (self.employee.pk, 'Acme', 'Engineering', 0),
+        )
+
+    def test_self_registered_login_is_not_linked(self):
+        # anyone can register with the email of an employee, the worker does not link it
+        self.assertEqual(provision_pending(), (0, 1))
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.employee_id)
+        self.assertIsNone(self.me()['employee'])
+
+    def test_cached_until_the_company_changes(self):
+        User.objects.filter(pk=self.user.pk).update(employee=self.employee)
+        self.me()
+        with self.assertNumQueries(0):
+            self.me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.name = 'Research'
+            self.department.save()
+        self.assertEqual(self.me()['employee']['department_name'], 'Research')
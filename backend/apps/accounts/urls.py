@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import LoginView, RegisterView, UserListView, UserDetailView
+from .views import LoginView, MeView, RegisterView, UserListView, UserDetailView
 
 app_name = 'accounts'
 
@@ -9,6 +9,7 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('register/', RegisterView.as_view(), name='register'),
+    path('me/', MeView.as_view(), name='me'),
 
     # user management endpoints
     path('users/', UserListView.as_view(), name='user_list'),
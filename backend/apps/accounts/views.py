@@ -1,9 +1,12 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.instrumentation import query_budget
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
-from .serializers import UserSerializer, UserCreateSerializer, CustomTokenObtainPairSerializer
+from .cache import cached_profile, store_profile
+from .serializers import MeSerializer, UserSerializer, UserCreateSerializer, CustomTokenObtainPairSerializer
 
 User = get_user_model()
 
@@ -30,6 +33,7 @@ class UserListView(generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAdminUser]
+    keyset_ordering = ('id',)
 
 class UserDetailView(generics.RetrieveAPIView):
     """
@@ -46,3 +50,27 @@ class UserDetailView(generics.RetrieveAPIView):
         if self.request.method in ['PUT', 'PATCH']:
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
+
+
+class MeView(APIView):
+    """
+    profile of the logged in user and their employee record
+    GET /api/v1/auth/me/
+    one joined query, cached per user (dropped when the user changes or
+    when anything of the employee's company does)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @query_budget(2)
+    def get(self, request):
+        data = cached_profile(request.user.pk)
+        if data is not None:
+            return Response(data)
+
+        user = generics.get_object_or_404(
+            User.objects.select_related('employee__company', 'employee__department'),
+            pk=request.user.pk,
+        )
+        data = MeSerializer(user).data
+        store_profile(user.pk, data, company_id=user.employee.company_id if user.employee else None)
+        return Response(data)
@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import Change
+# Register your models here.
+
+@admin.register(Change)
+class ChangeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model', 'object_id', 'action', 'company_id', 'created_at')
+    list_filter = ('model', 'action')
+    readonly_fields = [field.name for field in Change._meta.fields]
@@ -0,0 +1,189 @@
+"""
+fan out of the change outbox to the change streams of this process.
+
+one poller per event loop reads the new changes for all of its streams
+(one query per CHANGES_POLL_INTERVAL, not one per client) and hands them
+to the subscriptions of their company. the poller runs while there are
+subscriptions, its queries go through a worker thread, so a connected
+client costs a queue, not a thread.
+
+positions are (txid, id) pairs. a change is delivered once no transaction
+with a lower txid can still commit (txid below the xmin of the current
+snapshot), so a transaction that commits late is not skipped, it holds
+back the feed until it is done. a stream resumes from the position of the
+last change it got (Last-Event-ID), first from the table up to the
+position of the feed, then live.
+"""
+import asyncio
+import contextvars
+import logging
+import weakref
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from core.asyncviews import run_on_own_connection
+from .models import Change
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_XMIN = 'SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+BATCH_SIZE = 500
+
+
+def after(queryset, position):
+    """
+    the changes of queryset past position, in feed order
+    """
+    txid, pk = position
+    return (queryset.filter(txid__gte=txid)
+            .filter(Q(txid__gt=txid) | Q(pk__gt=pk))
+            .order_by('txid', 'id'))
+
+
+def up_to(queryset, position):
+    txid, pk = position
+    return queryset.filter(Q(txid__lt=txid) | Q(txid=txid, pk__lte=pk))
+
+
+def snapshot_xmin():
+    with connection.cursor() as cursor:
+        cursor.execute(SNAPSHOT_XMIN)
+        return cursor.fetchone()[0]
+
+
+def read_changes(position):
+    """
+    (changes, position): the deliverable changes past position, at most
+    BATCH_SIZE, and the position the feed is at after them
+    """
+    xmin = snapshot_xmin()
+    changes = list(after(Change.objects.filter(txid__lt=xmin), position)[:BATCH_SIZE])
+    if changes:
+        position = (changes[-1].txid, changes[-1].pk)
+    if len(changes) < BATCH_SIZE:
+        # every change below xmin was read, the next ones start at xmin
+        position = max(position, (xmin, 0))
+    return changes, position
+
+
+def read_backlog(company_id, since, until):
+    """
+    the changes of company (None: all) between since and until, BATCH_SIZE
+    at a time, for the streams that resume
+    """
+    queryset = up_to(Change.objects.all(), until)
+    if company_id is not None:
+        queryset = queryset.filter(company_id=company_id)
+    return list(after(queryset, since)[:BATCH_SIZE])
+
+
+def change_position(pk):
+    """
+    position of the change pk, None when it is unknown (or pruned)
+    """
+    row = Change.objects.filter(pk=pk).values_list('txid', 'id').first()
+    return tuple(row) if row else None
+
+
+class Subscription:
+    """
+    the changes waiting for one stream, at most CHANGES_STREAM_BUFFER of
+    them: a client that reads slower than the changes come is dropped
+    (overflowed) and resumes from the table when it reconnects
+    """
+
+    def __init__(self, company_id):
+        self.company_id = company_id
+        self.changes = deque()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def push(self, change):
+        if len(self.changes) >= settings.CHANGES_STREAM_BUFFER:
+            self.overflowed = True
+        else:
+            self.changes.append(change)
+        self.ready.set()
+
+    async def wait(self, timeout):
+        """
+        the waiting changes, [] when none came within timeout
+        """
+        if not self.changes and not self.overflowed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.ready.clear()
+        changes = list(self.changes)
+        self.changes.clear()
+        return changes
+
+
+class ChangeFeed:
+    """
+    the poller of one event loop and its subscriptions (feed_for_loop())
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.position = None
+        self.task = None
+
+    async def subscribe(self, company_id=None):
+        """
+        (subscription, position): the subscription gets the changes past position
+        """
+        if self.task is None:
+            xmin = await run_on_own_connection(snapshot_xmin)
+            if self.task is None:  # unless another stream started it meanwhile
+                self.position = (xmin, 0)
+                # a context of its own: the poller outlives the request that started it
+                self.task = asyncio.get_running_loop().create_task(
+                    self.poll(), context=contextvars.Context())
+        subscription = Subscription(company_id)
+        self.subscriptions.add(subscription)
+        return subscription, self.position
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def publish(self, changes):
+        for subscription in self.subscriptions:
+            for change in changes:
+                if subscription.company_id in (None, change.company_id):
+                    subscription.push(change)
+
+    async def poll(self):
+        try:
+            while self.subscriptions:
+                try:
+                    changes, position = await run_on_own_connection(lambda: read_changes(self.position))
+                except Exception:
+                    logger.exception('reading the change outbox failed')
+                    changes = []
+                else:
+                    self.publish(changes)
+                    self.position = position
+                if len(changes) < BATCH_SIZE:
+                    await asyncio.sleep(settings.CHANGES_POLL_INTERVAL)
+        finally:
+            self.task = None
+
+
+_feeds = weakref.WeakKeyDictionary()
+
+
+def feed_for_loop():
+    """
+    the change feed of the running event loop (one per loop, asyncio
+    objects cannot be shared between loops)
+    """
+    loop = asyncio.get_running_loop()
+    feed = _feeds.get(loop)
+    if feed is None:
+        feed = _feeds[loop] = ChangeFeed()
+    return feed
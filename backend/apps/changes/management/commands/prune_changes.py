@@ -0,0 +1,25 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.changes.models import Change
+
+
+class Command(BaseCommand):
+    """
+    deletes the old records of the change outbox, run it periodically (cron)
+    usage: python manage.py prune_changes [--hours 24]
+    a stream resuming from a pruned change gets a reset event
+    """
+    help = 'delete the changes older than CHANGES_RETENTION_HOURS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=None,
+                            help='hours of changes to keep (default: CHANGES_RETENTION_HOURS)')
+
+    def handle(self, *args, **options):
+        hours = settings.CHANGES_RETENTION_HOURS if options['hours'] is None else options['hours']
+        if hours < 0:
+            raise CommandError('--hours must not be negative')
+        deleted, _ = Change.objects.filter(created_at__lt=timezone.now() - timedelta(hours=hours)).delete()
+        self.stdout.write(self.style.SUCCESS(f'deleted {deleted} change(s) older than {hours}h'))
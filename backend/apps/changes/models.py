@@ -0,0 +1,55 @@
+from django.db import models
+# Create your models here.
+
+
+class CurrentTransactionId(models.Func):
+    """
+    id of the writing transaction (postgres 13+)
+    """
+    template = 'pg_current_xact_id()::text::bigint'
+    output_field = models.BigIntegerField()
+
+
+class ChangeAction(models.TextChoices):
+    CREATED = 'created', 'created'
+    UPDATED = 'updated', 'updated'
+    # an employee moved to another company, recorded for the company it left
+    MOVED = 'moved', 'moved'
+    DELETED = 'deleted', 'deleted'
+
+
+class Change(models.Model):
+    """
+    outbox of the employee / department / company writes behind the change
+    stream (GET /api/v1/changes/stream/), written in the transaction of the
+    write by the save / delete signals and the bulk operations.
+    - company_id: the company the change belongs to (the company itself for
+      company changes), plain integer, the company may be gone
+    - data: the few fields a dashboard shows, not the whole row
+    - txid: the writing transaction, the stream delivers in (txid, id) order
+      (apps.changes.feed)
+    """
+    txid = models.BigIntegerField(editable=False)
+    company_id = models.BigIntegerField()
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ChangeAction.choices)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "change"
+        verbose_name_plural = "changes"
+        indexes = [
+            models.Index(fields=['txid', 'id'], name='change_position_idx'),
+            models.Index(fields=['company_id', 'txid', 'id'], name='change_company_position_idx'),
+            models.Index(fields=['created_at'], name='change_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} {self.action}"
+
+    def save(self, *args, **kwargs):
+        if self.txid is None:
+            self.txid = CurrentTransactionId()
+        super().save(*args, **kwargs)
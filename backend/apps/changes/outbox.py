@@ -0,0 +1,57 @@
+"""
+writers of the change outbox (apps.changes.models.Change), called in the
+transaction of the write: by the signals for single saves / deletes, by
+the bulk operations and the importer for their sets (one INSERT per set)
+"""
+from apps.companies.models import Company
+from apps.departments.models import Department
+from apps.employees.models import Employee
+from .models import Change, ChangeAction, CurrentTransactionId
+
+# model -> (name in the records, fields a record carries)
+TRACKED = {
+    Employee: ('employee', ('name', 'status', 'department_id')),
+    Department: ('department', ('name',)),
+    Company: ('company', ('name',)),
+}
+# foreign keys are named like in the api payloads
+DATA_NAMES = {'department_id': 'department'}
+
+
+def change_data(model, values):
+    """
+    the tracked fields of values (a dict keyed by attname) that are set
+    """
+    _name, fields = TRACKED[model]
+    return {DATA_NAMES.get(field, field): values[field] for field in fields if field in values}
+
+
+def _change(model, object_id, company_id, action, data):
+    return Change(txid=CurrentTransactionId(), model=TRACKED[model][0], object_id=object_id,
+                  company_id=company_id, action=action, data=data)
+
+
+def record(instance, action):
+    """
+    the change of one saved / deleted instance of a tracked model. an
+    employee that moved to another company is also recorded (moved) for
+    the company it left
+    """
+    model = type(instance)
+    company_id = instance.pk if model is Company else instance.company_id
+    data = {} if action == ChangeAction.DELETED else change_data(model, instance.__dict__)
+    changes = [_change(model, instance.pk, company_id, action, data)]
+    previous_company_id = getattr(instance, '_original_company_id', None)
+    if action == ChangeAction.UPDATED and previous_company_id not in (None, company_id):
+        changes.append(_change(model, instance.pk, previous_company_id, ChangeAction.MOVED,
+                               {'company': company_id}))
+    Change.objects.bulk_create(changes)
+
+
+def record_employees(rows, action):
+    """
+    the changes of a set of employees, rows are (id, company_id, data) tuples
+    """
+    Change.objects.bulk_create([
+        _change(Employee, pk, company_id, action, data) for pk, company_id, data in rows
+    ])
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.companies.models import Company
+from apps.departments.models import Department
+from apps.employees.models import Employee
+from apps.employees.signals import in_bulk_operation
+from .models import ChangeAction
+from .outbox import record
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Company)
+def record_save(sender, instance, created, raw=False, **kwargs):
+    """saves (transitions included) go to the change outbox"""
+    if raw or in_bulk_operation():  # the bulk operations record their sets themselves
+        return
+    record(instance, ChangeAction.CREATED if created else ChangeAction.UPDATED)
+
+
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Company)
+def record_delete(sender, instance, **kwargs):
+    """deletes go to the change outbox"""
+    if in_bulk_operation():
+        return
+    record(instance, ChangeAction.DELETED)
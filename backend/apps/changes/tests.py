@@ -0,0 +1,173 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from apps.employees.importers import EmployeeImporter
+from apps.employees.models import Employee, EmployeeStatus
+from apps.employees.operations import bulk_delete, bulk_move, bulk_transition
+from core.testing import bearer_headers, create_admin, create_departments, create_employee, employee_fields
+from .models import Change, ChangeAction
+
+
+def changes(**filters):
+    return list(Change.objects.filter(**filters).order_by('id')
+                .values_list('model', 'object_id', 'company_id', 'action', 'data'))
+
+
+class ChangeRecordTests(TestCase):
+    """
+    every write path of the tracked models appends its changes to the outbox
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        [cls.engineering] = create_departments()
+        [cls.sales] = create_departments('Sales', company='Globex')
+        cls.company, cls.other = cls.engineering.company, cls.sales.company
+
+    def setUp(self):
+        Change.objects.all().delete()
+
+    def test_saves_and_deletes(self):
+        employee = create_employee(self.engineering, 1, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post(f'/api/v1/employees/{employee.pk}/transition/',
+                               {'status': EmployeeStatus.HIRED}, format='json')
+        self.assertEqual(response.status_code, 200)
+        employee.refresh_from_db()
+        employee.department = self.sales
+        employee.company = self.other
+        employee.save()
+        employee_id = employee.pk
+        employee.delete()
+
+        self.assertEqual(changes(model='employee'), [
+            ('employee', employee_id, self.company.pk, ChangeAction.CREATED,
+             {'name': 'Employee 1', 'status': EmployeeStatus.INTERVIEW_SCHEDULED, 'department': self.engineering.pk}),
+            ('employee', employee_id, self.company.pk, ChangeAction.UPDATED,
+             {'name': 'Employee 1', 'status': EmployeeStatus.HIRED, 'department': self.engineering.pk}),
+            ('employee', employee_id, self.other.pk, ChangeAction.UPDATED,
+             {'name': 'Employee 1', 'status': EmployeeStatus.HIRED, 'department': self.sales.pk}),
+            ('employee', employee_id, self.company.pk, ChangeAction.MOVED, {'company': self.other.pk}),
+            ('employee', employee_id, self.other.pk, ChangeAction.DELETED, {}),
+        ])
+        self.engineering.name = 'Research'
+        self.engineering.save()
+        self.assertEqual(changes(model='department'), [
+            ('department', self.engineering.pk, self.company.pk, ChangeAction.UPDATED, {'name': 'Research'}),
+        ])
+        # every change of a transaction has its id
+        self.assertEqual(len(set(Change.objects.values_list('txid', flat=True))), 1)
+
+    def test_list_rows_carry_the_change_fields(self):
+        """
+        the dashboard patches a listed row in place with the data of an
+        update unless its department changed, a status change must compare
+        equal on the department
+        """
+        employee = create_employee(self.engineering, 1, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        [row] = client.get('/api/v1/employees/').data
+        Change.objects.all().delete()
+        client.post(f'/api/v1/employees/{employee.pk}/transition/', {'status': EmployeeStatus.HIRED}, format='json')
+        [change] = Change.objects.all()
+        self.assertEqual(change.data['department'], row['department'])
+        self.assertEqual({**row, **change.data}, {**row, 'status': EmployeeStatus.HIRED})
+
+    def test_bulk_operations(self):
+        first, second = [create_employee(self.engineering, number, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+                         for number in (1, 2)]
+        Change.objects.all().delete()
+        ids = [first.pk, second.pk]
+        bulk_transition(Employee.objects.all(), EmployeeStatus.HIRED, ids=ids)
+        bulk_move(Employee.objects.all(), self.sales, ids=[first.pk])
+        bulk_delete(Employee.objects.all(), ids=ids)
+        self.assertEqual(changes(), [
+            ('employee', first.pk, self.company.pk, ChangeAction.UPDATED, {'status': EmployeeStatus.HIRED}),
+            ('employee', second.pk, self.company.pk, ChangeAction.UPDATED, {'status': EmployeeStatus.HIRED}),
+            ('employee', first.pk, self.other.pk, ChangeAction.UPDATED, {'department': self.sales.pk}),
+            ('employee', first.pk, self.company.pk, ChangeAction.MOVED, {'company': self.other.pk}),
+            ('employee', first.pk, self.other.pk, ChangeAction.DELETED, {}),
+            ('employee', second.pk, self.company.pk, ChangeAction.DELETED, {}),
+        ])
+
+    def test_import(self):
+        rows = [employee_fields(9, status=EmployeeStatus.HIRED,
+                                company=self.company.pk, department=self.engineering.pk)]
+        EmployeeImporter().run(enumerate(rows, 1))
+        employee = Employee.objects.get(email='employee9@example.com')
+        self.assertEqual(changes(), [
+            ('employee', employee.pk, self.company.pk, ChangeAction.CREATED,
+             {'name': 'Employee 9', 'status': EmployeeStatus.HIRED, 'department': self.engineering.pk}),
+        ])
+
+
+@override_settings(CHANGES_POLL_INTERVAL=0.05, CHANGES_HEARTBEAT_SECONDS=0.2, CHANGES_STREAM_SECONDS=5)
+class ChangeStreamTests(TransactionTestCase):
+    """
+    the stream (GET /api/v1/changes/stream/) delivers committed changes, a
+    test case transaction would never commit them
+    """
+    databases = '__all__'  # outside of a transaction the reads go to the replicas, if any
+
+    def setUp(self):
+        if connection.settings_dict['CONN_MAX_AGE']:
+            self.skipTest('persistent worker connections would outlive the test database')
+        [self.engineering] = create_departments()
+        [self.sales] = create_departments('Sales', company='Globex')
+        self.company = self.engineering.company
+        self.headers = bearer_headers(create_admin())
+
+    async def stream(self, query='', **headers):
+        return await self.async_client.get(f'/api/v1/changes/stream/{query}',
+                                           headers={**self.headers, **headers})
+
+    async def events(self, response, count):
+        """
+        the next count events (heartbeats skipped) as (event, id, data)
+        """
+        events, buffer = [], ''
+        chunks = aiter(response.streaming_content)
+        while len(events) < count:
+            buffer += (await asyncio.wait_for(anext(chunks), 5)).decode()
+            while '\n\n' in buffer:
+                block, buffer = buffer.split('\n\n', 1)
+                fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+                if 'data' in fields:
+                    events.append((fields.get('event'), fields.get('id'), json.loads(fields['data'])))
+        return events
+
+    async def test_live_and_resumed(self):
+        response = await self.stream(f'?company={self.company.pk}')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry: '))
+
+        await sync_to_async(create_employee)(self.sales, 1)  # another company
+        employee = await sync_to_async(create_employee)(self.engineering, 2, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+        [(event, event_id, data)] = await self.events(response, 1)
+        self.assertEqual(event, 'change')
+        self.assertEqual((data['model'], data['object_id'], data['company'], data['action']),
+                         ('employee', employee.pk, self.company.pk, ChangeAction.CREATED))
+
+        # the changes of the company after the last one the client got
+        await sync_to_async(bulk_transition)(Employee.objects.all(), EmployeeStatus.HIRED)
+        response = await self.stream(f'?company={self.company.pk}', **{'Last-Event-ID': event_id})
+        [(event, _, data)] = await self.events(response, 1)
+        self.assertEqual((data['object_id'], data['action'], data['data']),
+                         (employee.pk, ChangeAction.UPDATED, {'status': EmployeeStatus.HIRED}))
+
+        response = await self.stream(**{'Last-Event-ID': '0'})
+        [(event, _, _)] = await self.events(response, 1)
+        self.assertEqual(event, 'reset')
+
+    async def test_rejected(self):
+        response = await self.async_client.get('/api/v1/changes/stream/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.stream('?company=acme')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import ChangeStreamView
+
+app_name = 'changes'
+
+urlpatterns = [
+    path('stream/', ChangeStreamView.as_view(), name='stream'),
+]
@@ -0,0 +1,106 @@
+import asyncio
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import permissions, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from core.asyncviews import AsyncReadView, run_on_own_connection
+from .feed import BATCH_SIZE, change_position, feed_for_loop, read_backlog
+from .renderers import EventStreamRenderer, server_sent_event
+# Create your views here.
+
+
+class ChangeViewSet(viewsets.GenericViewSet):
+    """
+    authentication, permissions and content negotiation of the change
+    stream, the stream itself is ChangeStreamView
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+
+def change_event(change):
+    return server_sent_event({
+        'id': change.pk,
+        'model': change.model,
+        'action': change.action,
+        'object_id': change.object_id,
+        'company': change.company_id,
+        'data': change.data,
+        'at': change.created_at,
+    }, event='change', event_id=change.pk)
+
+
+async def change_stream(company_id, last_event_id):
+    """
+    the events of a stream: the changes missed since last_event_id (if
+    any), then the live ones, with a comment every CHANGES_HEARTBEAT_SECONDS
+    so proxies keep the connection open. ends after CHANGES_STREAM_SECONDS
+    (django 4.2 does not notice a client that went away) or when the client
+    falls behind, the client reconnects with the Last-Event-ID
+    """
+    feed = feed_for_loop()
+    subscription, position = await feed.subscribe(company_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.CHANGES_STREAM_SECONDS
+    try:
+        yield f'retry: {settings.CHANGES_RETRY_MILLISECONDS}\n\n'
+        cursor = position
+        if last_event_id is not None:
+            since = await run_on_own_connection(lambda: change_position(last_event_id))
+            if since is None:
+                # pruned or never existed: the client reloads what it shows
+                yield server_sent_event({'reason': 'unknown Last-Event-ID'}, event='reset')
+            else:
+                cursor = since
+                while True:
+                    backlog = await run_on_own_connection(lambda: read_backlog(company_id, cursor, position))
+                    for change in backlog:
+                        yield change_event(change)
+                    if backlog:
+                        cursor = (backlog[-1].txid, backlog[-1].pk)
+                    if len(backlog) < BATCH_SIZE:
+                        break
+
+        while (remaining := deadline - loop.time()) > 0:
+            changes = await subscription.wait(min(settings.CHANGES_HEARTBEAT_SECONDS, remaining))
+            if not changes and not subscription.overflowed:
+                yield ': ping\n\n'
+            for change in changes:
+                # a client resuming from another process may be ahead of this feed
+                if (change.txid, change.pk) > cursor:
+                    yield change_event(change)
+                    cursor = (change.txid, change.pk)
+            if subscription.overflowed:
+                break
+    finally:
+        feed.unsubscribe(subscription)
+
+
+class ChangeStreamView(AsyncReadView):
+    """
+    server-sent events of the employee / department / company changes
+    GET : /api/v1/changes/stream/ (?company=<id>, Last-Event-ID header to resume)
+    --> serve it with core.asgi, under WSGI every open stream holds a worker thread
+    """
+    viewset = ChangeViewSet
+    action = None
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+    replica_reads = False  # a replica behind the primary would skip changes
+
+    async def respond(self, view, request):
+        company_id = request.query_params.get('company')
+        if company_id is not None:
+            if not company_id.isdigit():
+                raise ValidationError({'company': ['a valid company id is required']})
+            company_id = int(company_id)
+        last_event_id = request.headers.get('Last-Event-ID')
+        if last_event_id is not None:
+            # anything but a change id is answered with a reset
+            last_event_id = int(last_event_id) if last_event_id.isdigit() else 0
+        response = StreamingHttpResponse(
+            change_stream(company_id, last_event_id),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx would buffer the events
+        return response
@@ -7,3 +7,8 @@ class CompanyAdmin(admin.ModelAdmin):
     list_display = ('name', 'number_of_departments', 'number_of_employees', 'created_at')
     search_fields = ['name']
     readonly_fields = ['created_at','updated_at']
+
+    def delete_queryset(self, request, queryset):
+        # one by one: Company.delete removes the employees of a partitioned table first
+        for company in queryset:
+            company.delete()
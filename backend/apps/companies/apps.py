@@ -6,3 +6,6 @@ from apps import companies
 class CompaniesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.companies'
+
+    def ready(self):
+        import apps.companies.signals  # Import signals when app is ready
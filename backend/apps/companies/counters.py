@@ -0,0 +1,82 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .models import Company
+
+
+def _bump(queryset, field, delta):
+    """
+    atomic in-database increment / decrement of a counter column,
+    clamped at zero so a drifted counter never breaks a write.
+    updated_at moves with it, the counters are part of the representation
+    (conditional GET versions are read from updated_at)
+    """
+    if delta:
+        queryset.update(**{field: Greatest(F(field) + delta, 0)}, updated_at=timezone.now())
+
+
+def adjust_employee_count(company_id=None, department_id=None, delta=1):
+    """
+    add delta to the employee counters of a company and / or a department
+    """
+    from apps.departments.models import Department
+
+    if company_id is not None:
+        _bump(Company.objects.filter(pk=company_id), 'employee_count', delta)
+    if department_id is not None:
+        _bump(Department.objects.filter(pk=department_id), 'employee_count', delta)
+
+
+def adjust_department_count(company_id, delta=1):
+    """
+    add delta to the department counter of a company
+    """
+    if company_id is not None:
+        _bump(Company.objects.filter(pk=company_id), 'department_count', delta)
+
+
+def _count_of(model, fk):
+    """
+    correlated subquery counting the rows of model pointing at the outer row
+    """
+    rows = (model.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count('pk'))
+            .values('total'))
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def reconcile_counts(dry_run=False):
+    """
+    recompute every counter column from the source tables in bulk and fix
+    the rows that drifted.
+    returns the number of drifted rows per model
+    """
+    from apps.departments.models import Department
+    from apps.employees.models import Employee
+
+    targets = [
+        (Company, {
+            'department_count': _count_of(Department, 'company'),
+            'employee_count': _count_of(Employee, 'company'),
+        }),
+        (Department, {
+            'employee_count': _count_of(Employee, 'department'),
+        }),
+    ]
+    drifted = {}
+    for model, counters in targets:
+        mismatch = Q()
+        for field in counters:
+            mismatch |= ~Q(**{field: F(f'actual_{field}')})
+        drifted_ids = list(
+            model.objects
+            .annotate(**{f'actual_{field}': value for field, value in counters.items()})
+            .filter(mismatch)
+            .values_list('pk', flat=True)
+        )
+        if drifted_ids and not dry_run:
+            model.objects.filter(pk__in=drifted_ids).update(**counters, updated_at=timezone.now())
+        drifted[model._meta.label] = len(drifted_ids)
+    return drifted
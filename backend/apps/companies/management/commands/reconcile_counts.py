@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.companies.counters import reconcile_counts
+
+
+class Command(BaseCommand):
+    """
+    repairs the company / department counter columns in bulk
+    usage: python manage.py reconcile_counts [--dry-run]
+    """
+    help = 'recompute department_count / employee_count columns and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report drifted rows without fixing them')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = reconcile_counts(dry_run=options['dry_run'])
+        verb = 'found' if options['dry_run'] else 'fixed'
+        for label, total in drifted.items():
+            self.stdout.write(f'{label}: {verb} {total} drifted row(s)')
+        self.stdout.write(self.style.SUCCESS('counters reconciled'))
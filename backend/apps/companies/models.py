@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.core.exceptions import ValidationError
 # Create your models here.
 
@@ -8,8 +8,12 @@ class Company(models.Model):
     - company name
     - number of departments
     - number of employees
+    the two counts are stored as counter columns kept up to date by the
+    department / employee signals (see reconcile_counts command to repair drift)
     """
     name = models.CharField(max_length=255, unique=True)
+    department_count = models.PositiveIntegerField(default=0, editable=False)
+    employee_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -24,16 +28,16 @@ class Company(models.Model):
     @property
     def number_of_departments(self):
         """
-        automatically calculates number of departments
+        number of departments (read from the maintained counter column)
         """
-        return self.departments.count()
+        return self.department_count
 
     @property
     def number_of_employees(self):
         """
-        automatically calculates number of employees
+        number of employees (read from the maintained counter column)
         """
-        return sum(dept.number_of_employees for dept in self.departments.all())
+        return self.employee_count
 
     def clean(self):
         """
@@ -43,6 +47,17 @@ class Company(models.Model):
         if not self.name:
             raise ValidationError({'name':'Company name cannot be empty'})
 
+    def delete(self, *args, **kwargs):
+        """
+        with a partitioned employee table the employees go first, with set
+        based statements (their partition is dropped with the list strategy),
+        instead of one by one through the deletion collector
+        """
+        from apps.employees.partitioning import release_company_employees
+        with transaction.atomic(using=router.db_for_write(Company, instance=self)):
+            release_company_employees(self)
+            return super().delete(*args, **kwargs)
+
 
 
 
@@ -1,9 +1,10 @@
 from rest_framework import serializers
+from core.serializers import SparseFieldsMixin
 from .models import Company
 
-class CompanySerializer(serializers.ModelSerializer):
-    number_of_departments = serializers.IntegerField(read_only=True)
-    number_of_employees = serializers.IntegerField(read_only=True)
+class CompanySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    number_of_departments = serializers.IntegerField(source='department_count', read_only=True)
+    number_of_employees = serializers.IntegerField(source='employee_count', read_only=True)
 
     class Meta:
         model = Company
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.cache import bump_generation
+from .models import Company
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_cached_responses(sender, instance, raw=False, **kwargs):
+    """company writes change its cached responses and the global lists"""
+    if raw:
+        return
+    bump_generation(instance.pk)
@@ -1,3 +1,57 @@
+import io
+from django.core.management import call_command
 from django.test import TestCase
+from apps.departments.models import Department
+from apps.employees.models import Employee
+from core.testing import create_departments, create_employee
+from .models import Company
 
-# Create your tests here.
+
+class CounterTests(TestCase):
+    """
+    the department / employee counter columns follow the writes, and
+    reconcile_counts repairs the ones that drifted
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.engineering, cls.research = create_departments('Engineering', 'Research')
+        [cls.sales] = create_departments('Sales', company='Globex')
+        cls.company, cls.other = cls.engineering.company, cls.sales.company
+
+    def counts(self):
+        companies = dict(Company.objects.values_list('pk', 'department_count'))
+        employees = dict(Company.objects.values_list('pk', 'employee_count'))
+        departments = dict(Department.objects.values_list('pk', 'employee_count'))
+        return ((companies[self.company.pk], employees[self.company.pk], companies[self.other.pk],
+                 employees[self.other.pk]),
+                (departments[self.engineering.pk], departments.get(self.research.pk), departments[self.sales.pk]))
+
+    def test_writes_keep_the_counters(self):
+        self.assertEqual(self.counts(), ((2, 0, 1, 0), (0, 0, 0)))
+        first, second = create_employee(self.engineering, 1), create_employee(self.engineering, 2)
+        self.assertEqual(self.counts(), ((2, 2, 1, 0), (2, 0, 0)))
+        first.department = self.research
+        first.save()
+        second.department, second.company = self.sales, self.other
+        second.save()
+        self.assertEqual(self.counts(), ((2, 1, 1, 1), (0, 1, 1)))
+        first.delete()
+        self.research.delete()
+        self.assertEqual(self.counts(), ((1, 0, 1, 1), (0, None, 1)))
+
+    def test_reconcile(self):
+        create_employee(self.engineering, 1)
+        # writes that skip the signals
+        Employee.objects.filter(department=self.engineering).update(department=self.research)
+        Company.objects.filter(pk=self.other.pk).update(department_count=7)
+        out = io.StringIO()
+        call_command('reconcile_counts', '--dry-run', stdout=out)
+        self.assertIn('companies.Company: found 1 drifted row(s)', out.getvalue())
+        self.assertIn('departments.Department: found 2 drifted row(s)', out.getvalue())
+        self.assertEqual(self.counts(), ((2, 1, 7, 0), (1, 0, 0)))
+
+        call_command('reconcile_counts', stdout=out)
+        self.assertEqual(self.counts(), ((2, 1, 1, 0), (0, 1, 0)))
+        call_command('reconcile_counts', '--dry-run', stdout=out)
+        self.assertIn('departments.Department: found 0 drifted row(s)', out.getvalue())
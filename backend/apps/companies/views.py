@@ -1,17 +1,30 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
+from django.http import Http404
 from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
+from django.db.models import Count
+from core.asyncviews import AsyncListView, AsyncReadView, gather
+from core.cache import CACHED_PREFIXES, cache_response
+from core.conditional import conditional, detail_version, list_version
+from core.instrumentation import query_budget
+from core.serializers import SparseFieldsViewMixin
 from .models import Company
 from .serializers import CompanySerializer
+from apps.departments.models import Department
+from apps.departments.serializers import DepartmentSerializer
+from apps.employees.models import Employee, EmployeeStatus
 # Create your views here.
 
-class CompanyViewSet(viewsets.ModelViewSet):
+class CompanyViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     this will be a viewset for the company model (provides Crud operations)
     """
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
+    keyset_ordering = ('name',) # company names are unique
+    replica_reads = True # GETs read from a replica (core.dbrouter)
 
     def get_permissions(self):
         """
@@ -22,4 +35,71 @@ class CompanyViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAdminUser]
         else:
             permission_classes = [permissions.IsAuthenticated]
-        return [permission() for permission in permission_classes]
\ No newline at end of file
+        return [permission() for permission in permission_classes]
+
+    def get_cache_scope(self):
+        """
+        a company detail is invalidated by its own writes, the list by any write
+        """
+        if self.action == 'retrieve':
+            return self.kwargs.get('pk')
+        return None
+
+    @query_budget(5)
+    @conditional(list_version())
+    @cache_response('companies')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @query_budget(3)
+    @conditional(detail_version())
+    @cache_response('companies')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class AsyncCompanyListView(AsyncListView):
+    """
+    async version of the company list (same pagination, ETag and cache)
+    GET : /api/v1/async/companies/
+    """
+    viewset = CompanyViewSet
+
+
+OVERVIEW_CACHE_PREFIX = 'company-overview'
+CACHED_PREFIXES.add(OVERVIEW_CACHE_PREFIX)
+
+
+class AsyncCompanyOverviewView(AsyncReadView):
+    """
+    a company with its departments and its employees counted by status, the
+    three are read at the same time (core.asyncviews.gather)
+    GET : /api/v1/async/companies/{id}/overview/
+    cached in the company scope, any write to the company invalidates it
+    """
+    viewset = CompanyViewSet
+    action = 'retrieve'
+
+    def get_version(self):
+        return None
+
+    def get_cache_prefix(self):
+        return OVERVIEW_CACHE_PREFIX
+
+    async def respond(self, view, request, pk):
+        if not pk.isdigit():
+            raise Http404
+        company, departments, counts = await gather(
+            lambda: view.get_queryset().filter(pk=pk).first(),
+            lambda: list(Department.objects.filter(company_id=pk).select_related('company').order_by('name', 'id')),
+            lambda: dict(Employee.objects.filter(company_id=pk).order_by()
+                         .values_list('status').annotate(Count('id'))),
+        )
+        if company is None:
+            raise Http404
+        view.check_object_permissions(request, company)
+        return Response({
+            **CompanySerializer(company).data,
+            'departments': DepartmentSerializer(departments, many=True).data,
+            'employees_by_status': {status: counts.get(status, 0) for status in EmployeeStatus.values},
+        })
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 from apps import departments
 
@@ -6,3 +7,7 @@ from apps import departments
 class DepartmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.departments'
+
+    def ready(self):
+        import apps.departments.signals  # Import signals when app is ready
+        post_migrate.connect(apps.departments.signals.install_department_search, sender=self)
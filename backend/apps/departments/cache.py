@@ -0,0 +1,22 @@
+from django.core.cache import cache
+from .models import Department
+
+
+def department_company_cache_key(department_id):
+    return f'api:department-company:{department_id}'
+
+
+def department_company_id(department_id):
+    """
+    company of a department, cached so a cache hit needs no query
+    (the entry is dropped by the department signals on save / delete)
+    """
+    if not str(department_id).isdigit():
+        return None
+    key = department_company_cache_key(department_id)
+    company_id = cache.get(key)
+    if company_id is None:
+        company_id = Department.objects.filter(pk=department_id).values_list('company_id', flat=True).first()
+        if company_id is not None:
+            cache.set(key, company_id, timeout=None)
+    return company_id
@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from apps.companies.models import Company
 # Create your models here.
@@ -8,7 +10,7 @@ class Department(models.Model):
     dept model
     company - select
     dept name
-    number of employees (dynamic calculation)
+    number of employees (maintained counter column, updated by employee signals)
     """
     company = models.ForeignKey(Company,
                                 on_delete=models.CASCADE,
@@ -17,6 +19,9 @@ class Department(models.Model):
                                 # its depts are also gone.
     )
     name = models.CharField(max_length=255)
+    employee_count = models.PositiveIntegerField(default=0, editable=False)
+    # name document, maintained by a database trigger (core.search)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -24,16 +29,31 @@ class Department(models.Model):
         verbose_name = "Department"
         verbose_name_plural = "Departments"
         ordering = ['company', 'name']
+        indexes = [
+            # matches the keyset pagination ordering of the department list
+            models.Index(fields=['company', 'name', 'id'], name='department_company_name_idx'),
+            GinIndex(fields=['search_vector'], name='department_search_vector_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # remember the loaded company so the counter signals can tell when a dept moved
+        self._original_company_id = self.__dict__.get('company_id')
 
     def __str__(self):
         return f"{self.company.name} - {self.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # the post_save signals compared against the previous company
+        self._original_company_id = self.company_id
+
     @property
     def number_of_employees(self):
         """
-        auto calc of number of employees
+        number of employees (read from the maintained counter column)
         """
-        return self.employees.count()
+        return self.employee_count
 
     def clean(self):
         """
@@ -3,16 +3,18 @@ from os.path import exists
 from rest_framework import serializers
 from .models import Department
 from apps.companies.serializers import CompanySerializer
+from core.serializers import SparseFieldsMixin
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     dept serializer
     --> provides nested company details for GET request
     allow company selection by id for post / put requests
     has calc number of employees
+    ?fields= / ?expand=company_details for sparse responses
     """
     company_details = CompanySerializer(source='company',read_only=True)
-    number_of_employees = serializers.IntegerField(read_only=True)
+    number_of_employees = serializers.IntegerField(source='employee_count', read_only=True)
 
     class Meta:
         model = Department
@@ -20,6 +22,7 @@ class DepartmentSerializer(serializers.ModelSerializer):
                   'created_at', 'updated_at']
 
         read_only_fields = ['id','created_at', 'updated_at']
+        expandable_fields = ['company_details']
 
         def validate(self, data):
             """
@@ -0,0 +1,44 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.core.cache import cache
+from apps.companies.counters import adjust_department_count
+from core.cache import bump_generation
+from core.search import install_search_support
+from .models import Department
+from .cache import department_company_cache_key
+
+
+@receiver(post_save, sender=Department)
+def update_company_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    """keep the company department counter in sync on create and move"""
+    if raw:
+        return
+
+    if created:
+        adjust_department_count(instance.company_id, 1)
+    elif instance._original_company_id != instance.company_id:
+        adjust_department_count(instance._original_company_id, -1)
+        adjust_department_count(instance.company_id, 1)
+
+@receiver(post_delete, sender=Department)
+def update_company_counts_on_delete(sender, instance, **kwargs):
+    """decrement the company department counter"""
+    adjust_department_count(instance.company_id, -1)
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def invalidate_cached_responses(sender, instance, raw=False, **kwargs):
+    """department writes change the cached company / department responses"""
+    if raw:
+        return
+    cache.delete(department_company_cache_key(instance.pk))
+    bump_generation(instance.company_id, instance._original_company_id)
+
+def install_department_search(sender, using, **kwargs):
+    """search vector trigger and trigram index of the department table (post_migrate)"""
+    from django.db import connections
+    install_search_support(
+        connections[using], Department,
+        weighted_columns={'name': 'A'},
+        trigram_columns=['name'],
+    )
@@ -1,3 +1,55 @@
+from django.core.cache import cache
 from django.test import TestCase
+from apps.employees.models import Employee, EmployeeStatus
+from core.testing import bearer_headers, create_admin, create_departments, create_employee, enforce_query_budgets
 
-# Create your tests here.
+
+@enforce_query_budgets
+class DepartmentEmployeesTests(TestCase):
+    """
+    GET /api/v1/departments/{id}/employees/: always paginated, with the
+    filters and search of the employee list and the department serialized
+    once next to the rows
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.engineering, cls.research = create_departments('Engineering', 'Research')
+        for number in range(3):
+            create_employee(cls.engineering, number, status=EmployeeStatus.APPLICATION_RECEIVED)
+        create_employee(cls.research, 3)
+        cls.ordered = list(Employee.objects.filter(department=cls.engineering)
+                           .order_by('-created_at', 'id').values_list('pk', flat=True))
+        cls.headers = bearer_headers(create_admin())
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, status=200):
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status)
+        return response.data
+
+    def test_pages(self):
+        url = f'/api/v1/departments/{self.engineering.pk}/employees/'
+        data = self.get(url)
+        self.assertEqual((data['department']['id'], data['department']['name']), (self.engineering.pk, 'Engineering'))
+        self.assertEqual([row['id'] for row in data['results']], self.ordered)
+        self.assertNotIn('department_details', data['results'][0])
+
+        pages, url = [], f'{url}?page_size=2'
+        while url:
+            data = self.get(url)
+            pages.append([row['id'] for row in data['results']])
+            url = data['next']
+        self.assertEqual(pages, [self.ordered[:2], self.ordered[2:]])
+
+    def test_filters_and_search(self):
+        url = f'/api/v1/departments/{self.engineering.pk}/employees/'
+        Employee.objects.filter(pk=self.ordered[0]).update(status=EmployeeStatus.INTERVIEW_SCHEDULED)
+        data = self.get(f'{url}?status={EmployeeStatus.INTERVIEW_SCHEDULED}')
+        self.assertEqual([row['id'] for row in data['results']], self.ordered[:1])
+        self.assertEqual(self.get(f'{url}?search=employee3')['results'], [])  # of another department
+
+    def test_unknown_department(self):
+        self.get('/api/v1/departments/0/employees/', status=404)
@@ -1,26 +1,38 @@
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, permissions, filters
-from rest_framework.response import Response
+from rest_framework import viewsets, permissions
+from rest_framework.generics import get_object_or_404
 from rest_framework.decorators import action
+from core.asyncviews import AsyncListView
+from core.cache import cache_response
+from core.conditional import combined_version, conditional, detail_version, list_version
+from core.instrumentation import query_budget
+from core.search import PostgresSearchFilter
+from core.serializers import SparseFieldsViewMixin
+from .cache import department_company_id
 from .models import Department
 from .serializers import DepartmentSerializer
-from apps.employees.serializers import EmployeeSerializer # will add this later to employees app
+from apps.employees.models import Employee
+from apps.employees.partitioning import prune
+from apps.employees.serializers import DepartmentEmployeeSerializer
+from apps.employees.views import EmployeeViewSet
 # Create your views here.
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     viewset for department model that provides CRUD operations
     1- crud operations
     2- access control via role
     3- filter by companies
-    4- search by department name
+    4- search by department name (?search_mode=prefix|fuzzy|fulltext)
     """
-    queryset = Department.objects.all()
+    queryset = Department.objects.select_related('company')
     serializer_class = DepartmentSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, PostgresSearchFilter]
     filterset_fields = ['company']
     search_fields = ['name']
+    keyset_ordering = ('company_id', 'name', 'id') # served by the department_company_name_idx index
+    replica_reads = True # GETs read from a replica (core.dbrouter)
 
     def get_permissions(self):
         """
@@ -34,14 +46,70 @@ class DepartmentViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def get_cache_scope(self):
+        """
+        department reads are scoped to their company, the list is scoped to
+        the ?company= filter when there is one
+        """
+        if self.action in ('retrieve', 'employees'):
+            return department_company_id(self.kwargs.get('pk'))
+        company = self.request.query_params.get('company', '')
+        return company if company.isdigit() else None
+
+    @query_budget(5)
+    @conditional(list_version('company__updated_at'))
+    @cache_response('departments')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @query_budget(4)
+    @conditional(detail_version('company__updated_at'))
+    @cache_response('departments')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=['get'])
+    @query_budget(8)
+    @conditional(combined_version(
+        detail_version('company__updated_at'),
+        list_version(queryset=lambda view, request: prune(Employee.objects.filter(department_id=view.kwargs['pk']),
+                                                          department_company_id(view.kwargs['pk'])),
+                     daily=True),
+    ))
+    @cache_response('department-employees')
     def employees(self, request, pk=None):
         """
         this is a custom endpoint to GET all employees in a department
         GET /api/v1/departments/{id}/employees
+        --> always paginated (?cursor= / ?page_size=), accepts the filters and
+            search of the employee list (?status= ?search= ?search_mode=)
+        the department (with its company) is serialized once next to the rows
         """
-        department = self.get_object()
-        employees = department.employees.all()
-        serializer = EmployeeSerializer(employees, many=True)
-        return Response(serializer.data)
+        # the department filters / search of this viewset do not apply to the lookup
+        department = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(request, department)
 
+        # same filters, search and ordering as the employee list
+        employee_view = EmployeeViewSet(request=request, action='list', args=(), kwargs={},
+                                        format_kwarg=None)
+        employee_view.always_paginate = True
+        employees = employee_view.filter_queryset(
+            prune(Employee.objects.filter(department=department), department.company_id)
+        )
+
+        page = self.paginator.paginate_queryset(employees, request, view=employee_view)
+        rows = DepartmentEmployeeSerializer(page, many=True, context=self.get_serializer_context())
+        response = self.paginator.get_paginated_response(rows.data)
+        response.data = {
+            'department': DepartmentSerializer(department).data,  # ?fields= shapes the rows only
+            **response.data,
+        }
+        return response
+
+
+class AsyncDepartmentListView(AsyncListView):
+    """
+    async version of the department list (same filters, search, pagination, ETag and cache)
+    GET : /api/v1/async/departments/
+    """
+    viewset = DepartmentViewSet
@@ -5,10 +5,18 @@ from .models import Employee
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'email', 'company','department', 'designation', 'status','days_employed')
-    list_filter = ('status', 'company', 'department')
+    list_display = ('name', 'email', 'company','department', 'designation', 'status','days_employed','account_status')
+    list_filter = ('status', 'company', 'department', 'account_status')
     search_fields = ('name', 'email','designation')
-    readonly_fields = ('days_employed','created_at','updated_at')
+    readonly_fields = ('days_employed','account_status','created_at','updated_at')
+
+    def get_queryset(self, request):
+        # days employed is computed by the database for the list and the change form
+        return super().get_queryset(request).with_days_employed()
+
+    @admin.display(description='days employed', ordering='days_employed')
+    def days_employed(self, obj):
+        return obj.days_employed
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
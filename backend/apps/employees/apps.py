@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 from apps import employees
 
@@ -9,3 +10,5 @@ class EmployeesConfig(AppConfig):
 
     def ready(self):
         import apps.employees.signals  # Import signals when app is ready
+        post_migrate.connect(apps.employees.signals.install_employee_search, sender=self)
+        post_migrate.connect(apps.employees.signals.partition_employee_table, sender=self)
@@ -0,0 +1,126 @@
+import csv
+import json
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from .models import Employee, EmployeeStatus
+
+# columns of the hired report, same order as HiredEmployeeReportSerializer
+HIRED_REPORT_COLUMNS = [
+    'id', 'name', 'email', 'designation', 'mobile_number',
+    'hired_on', 'days_employed', 'company_name', 'department_name'
+]
+
+# rows fetched per round trip from the server side cursor
+EXPORT_CHUNK_SIZE = 2000
+
+
+def hired_report_values(queryset=None):
+    """
+    tuples of HIRED_REPORT_COLUMNS, everything (including the joined names
+    and days employed) is computed in sql, no model instances are built
+    """
+    if queryset is None:
+        queryset = Employee.objects.all()
+    queryset = (
+        queryset
+        .filter(status=EmployeeStatus.HIRED)
+        .with_days_employed()
+        .annotate(
+            company_name=F('company__name'),
+            department_name=F('department__name'),
+        )
+        .order_by('id')
+        .values_list(*HIRED_REPORT_COLUMNS)
+    )
+    # the database is picked now (a replica during a GET, core.dbrouter), the
+    # rows are read while the response streams, after the request routing ended
+    return queryset.using(queryset.db)
+
+
+def hired_report_rows(queryset=None):
+    """
+    the hired report tuples read with a server side cursor
+    """
+    return hired_report_values(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def ahired_report_rows(queryset=None):
+    """
+    async iterator version of hired_report_rows (async views), a chunk per
+    round trip. not aiterator(): on django 4.2 it opens the cursor of a
+    values_list() queryset in the event loop
+    """
+    rows = hired_report_rows(queryset)
+
+    async def chunks():
+        while True:
+            chunk = await sync_to_async(lambda: list(islice(rows, EXPORT_CHUNK_SIZE)))()
+            for row in chunk:
+                yield row
+            if len(chunk) < EXPORT_CHUNK_SIZE:
+                break
+    return chunks()
+
+
+class _Echo:
+    """
+    file like object for csv.writer that hands back the line instead of storing it
+    """
+    def write(self, value):
+        return value
+
+
+def _format_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_format_value(value) for value in row])
+
+
+async def astream_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    async for row in rows:
+        yield writer.writerow([_format_value(value) for value in row])
+
+
+def _ndjson_line(columns, row):
+    return json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_ndjson(columns, rows):
+    for row in rows:
+        yield _ndjson_line(columns, row)
+
+
+async def astream_ndjson(columns, rows):
+    async for row in rows:
+        yield _ndjson_line(columns, row)
+
+
+def streaming_export(columns, rows, export_format, filename):
+    """
+    wraps the row iterator in a streaming response, memory stays flat
+    no matter how many rows the export has.
+    rows may be an async iterator (async views under ASGI)
+    """
+    if hasattr(rows, '__aiter__'):
+        stream_csv_rows, stream_ndjson_rows = astream_csv, astream_ndjson
+    else:
+        stream_csv_rows, stream_ndjson_rows = stream_csv, stream_ndjson
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream_csv_rows(columns, rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    else:
+        response = StreamingHttpResponse(stream_ndjson_rows(columns, rows),
+                                         content_type='application/x-ndjson')
+    return response
@@ -0,0 +1,47 @@
+import django_filters
+from apps.departments.models import Department
+from .models import Employee
+from .partitioning import prune
+
+# ?ordering= values -> keyset ordering of the list. days employed grows as
+# hired_on gets older, so both are served by the employee_status_hired_idx index
+DAYS_EMPLOYED_ORDERINGS = {
+    'days_employed': ('-hired_on', 'id'),
+    '-days_employed': ('hired_on', 'id'),
+}
+
+
+class EmployeeFilter(django_filters.FilterSet):
+    """
+    ?company= ?department= ?status=
+    ?min_days_employed= / ?max_days_employed= : tenure range in whole days
+    ?ordering=days_employed | -days_employed
+    the tenure filters and ordering only match hired employees, the others
+    have no days employed
+    """
+    # also restricted to the company of the department (partition pruning)
+    department = django_filters.ModelChoiceFilter(queryset=Department.objects.all(), method='filter_department')
+    min_days_employed = django_filters.NumberFilter(method='filter_days_employed', min_value=0)
+    max_days_employed = django_filters.NumberFilter(method='filter_days_employed', min_value=0)
+    ordering = django_filters.ChoiceFilter(
+        choices=[(value, value) for value in DAYS_EMPLOYED_ORDERINGS],
+        method='order_by_days_employed',
+    )
+
+    # sample values of the method filters for manage.py audit_indexes
+    audit_values = {'min_days_employed': 365, 'max_days_employed': 30}
+
+    class Meta:
+        model = Employee
+        fields = ['company', 'department', 'status']
+
+    def filter_department(self, queryset, name, value):
+        return prune(queryset.filter(department=value), value.company_id)
+
+    def filter_days_employed(self, queryset, name, value):
+        if name == 'min_days_employed':
+            return queryset.employed_for(min_days=int(value))
+        return queryset.employed_for(max_days=int(value))
+
+    def order_by_days_employed(self, queryset, name, value):
+        return queryset.employed_for().order_by(*DAYS_EMPLOYED_ORDERINGS[value])
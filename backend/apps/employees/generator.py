@@ -0,0 +1,264 @@
+"""
+synthetic organisations for benchmark / staging databases.
+
+rows are generated straight into core.bulk (COPY on postgres, bulk_create
+elsewhere) with explicit primary keys, so nothing is read back and neither
+Employee.save() nor the signals run. the counter columns are computed
+while generating and written with the companies / departments, and the
+user accounts share one precomputed password hash. without them the
+employees stay PENDING and are not queued for the provisioning worker
+(a million queued logins is rarely what a benchmark database wants).
+
+the same seed gives the same organisation: every value comes from one
+random.Random(seed) and the dates are relative to the start of the day.
+"""
+import random
+from bisect import bisect
+from collections import Counter
+from contextlib import nullcontext
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.utils import timezone
+
+from apps.companies.models import Company
+from apps.departments.models import Department
+from core.bulk import bulk_insert, deferred_indexes, next_pk, reset_sequences
+from core.cache import bump_generation
+from .models import AccountStatus, Employee, EmployeeStatus
+from .provisioning import employee_user_fields
+
+User = get_user_model()
+
+COMPANY_NAMES = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Vandelay', 'Stark', 'Wayne',
+                 'Tyrell', 'Cyberdyne', 'Soylent', 'Wonka', 'Oscorp', 'Aperture', 'Massive Dynamic',
+                 'Gringotts', 'Monarch', 'Dunder Mifflin', 'Pied Piper', 'Nakatomi']
+COMPANY_SUFFIXES = ['Corp', 'Labs', 'Holdings', 'Group', 'Industries', 'Systems', 'Partners', 'Inc']
+
+# department -> designations of its employees
+DEPARTMENTS = {
+    'Engineering': ['software engineer', 'senior software engineer', 'staff engineer', 'qa engineer',
+                    'devops engineer', 'engineering manager'],
+    'Product': ['product manager', 'product owner', 'ux designer', 'ui designer'],
+    'Sales': ['account executive', 'sales representative', 'sales manager'],
+    'Marketing': ['marketing specialist', 'content writer', 'seo analyst', 'marketing manager'],
+    'Finance': ['accountant', 'financial analyst', 'controller'],
+    'Human Resources': ['recruiter', 'hr generalist', 'hr manager'],
+    'Customer Support': ['support agent', 'support engineer', 'support lead'],
+    'Operations': ['operations analyst', 'office manager', 'operations manager'],
+    'Legal': ['legal counsel', 'paralegal', 'compliance officer'],
+    'Data': ['data analyst', 'data engineer', 'data scientist'],
+}
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'Ahmed',
+               'Fatima', 'Mohamed', 'Aisha', 'Omar', 'Layla', 'Wei', 'Mei', 'Hiroshi', 'Yuki', 'Carlos',
+               'Sofia', 'Luis', 'Elena', 'Ivan', 'Olga', 'Pierre', 'Camille', 'Hans', 'Greta', 'Raj',
+               'Priya', 'Kwame', 'Amara', 'Liam', 'Emma', 'Noah', 'Olivia', 'Lucas', 'Mia', 'Yusuf', 'Zara']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Hassan',
+              'Ali', 'Ibrahim', 'Mansour', 'Chen', 'Wang', 'Tanaka', 'Sato', 'Rodriguez', 'Martinez',
+              'Lopez', 'Gonzalez', 'Ivanov', 'Petrov', 'Martin', 'Bernard', 'Muller', 'Schmidt',
+              'Patel', 'Sharma', 'Mensah', 'Okafor', 'Wilson', 'Anderson', 'Taylor', 'Thomas', 'Moore']
+STREETS = ['Main St', 'Oak Ave', 'Park Rd', 'Cedar Ln', 'Elm St', 'Lake Dr', 'Hill Rd', 'River Rd',
+           'Nile St', 'Tahrir Sq', 'Market St', 'Station Rd']
+CITIES = ['Cairo', 'Alexandria', 'London', 'Berlin', 'Paris', 'New York', 'Toronto', 'Dubai',
+          'Tokyo', 'Madrid', 'Lagos', 'Mumbai']
+
+# share of each status in a mature organisation
+STATUS_WEIGHTS = {
+    EmployeeStatus.HIRED.value: 55,
+    EmployeeStatus.NOT_ACCEPTED.value: 25,
+    EmployeeStatus.APPLICATION_RECEIVED.value: 12,
+    EmployeeStatus.INTERVIEW_SCHEDULED.value: 8,
+}
+HIRED = EmployeeStatus.HIRED.value
+NOT_ACCEPTED = EmployeeStatus.NOT_ACCEPTED.value
+# hires are spread over ~15 years, most of them recent (mean tenure ~3 years)
+MEAN_TENURE_DAYS = 3 * 365
+MAX_TENURE_DAYS = 15 * 365
+# applications still in the pipeline are at most a few months old
+PIPELINE_DAYS = 120
+
+
+class OrgGenerator:
+    """
+    generates companies x departments_per_company departments and
+    employees spread over them (department sizes are skewed, a few large
+    departments and a long tail of small ones), in one transaction.
+    users=True also creates the employee logins (role EMPLOYEE, the
+    provisioning temp password).
+    returns the number of rows created per table
+    """
+    batch_size = 20000
+
+    def __init__(self, companies, departments_per_company, employees, seed=0, users=False,
+                 batch_size=None):
+        self.companies = companies
+        self.departments_per_company = departments_per_company
+        self.employees = employees
+        self.seed = seed
+        self.users = users
+        self.batch_size = batch_size or self.batch_size
+        self.rng = random.Random(seed)
+        self.today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def run(self):
+        using = router.db_for_write(Employee)
+        with transaction.atomic(using=using):
+            # a load larger than the table rebuilds its indexes once at the end
+            tables = [Employee, User] if self.users else [Employee]
+            existing = Employee.objects.using(using).count()
+            loading = deferred_indexes(*tables, using=using) if self.employees > existing else nullcontext()
+            with loading:
+                company_ids, department_rows = self._organisation(using)
+                assignment = self._assign(len(department_rows))
+                self._insert_organisation(company_ids, department_rows, assignment, using)
+                users = self._insert_employees(department_rows, assignment, using)
+            reset_sequences(Company, Department, Employee, *([User] if self.users else []), using=using)
+            bump_generation(*company_ids)
+        return {
+            'companies': len(company_ids),
+            'departments': len(department_rows),
+            'employees': self.employees,
+            'users': users,
+        }
+
+    # organisation
+
+    def _company_names(self):
+        base = [f'{name} {suffix}' for name in COMPANY_NAMES for suffix in COMPANY_SUFFIXES]
+        self.rng.shuffle(base)
+        return [base[index] if index < len(base) else f'{base[index % len(base)]} {index // len(base) + 1}'
+                for index in range(self.companies)]
+
+    def _organisation(self, using):
+        """
+        company ids and the (id, company_id, name, domain) of the departments
+        """
+        first_company = next_pk(Company, using)
+        first_department = next_pk(Department, using)
+        kinds = list(DEPARTMENTS)
+        company_ids, department_rows = [], []
+        self.company_names = {}
+        for index, name in enumerate(self._company_names()):
+            company_id = first_company + index
+            company_ids.append(company_id)
+            self.company_names[company_id] = name
+            domain = name.lower().replace(' ', '') + '.example.com'
+            for number in range(self.departments_per_company):
+                kind = kinds[number % len(kinds)]
+                # past the ten kinds, departments become regional teams
+                label = kind if number < len(kinds) else f'{kind} {number // len(kinds) + 1}'
+                department_rows.append((first_department + len(department_rows), company_id, label, domain))
+        return company_ids, department_rows
+
+    def _assign(self, departments):
+        """
+        department index of every employee, pareto weighted then shuffled
+        so the rows of a department are spread over the table
+        """
+        if not departments:
+            return []
+        weights = [self.rng.paretovariate(1.2) for _ in range(departments)]
+        total = sum(weights)
+        sizes = [int(self.employees * weight / total) for weight in weights]
+        # largest remainders get the employees lost to rounding
+        remainders = sorted(range(departments),
+                            key=lambda index: self.employees * weights[index] / total - sizes[index],
+                            reverse=True)
+        for index in remainders[:self.employees - sum(sizes)]:
+            sizes[index] += 1
+        assignment = [index for index, size in enumerate(sizes) for _ in range(size)]
+        self.rng.shuffle(assignment)
+        return assignment
+
+    def _insert_organisation(self, company_ids, department_rows, assignment, using):
+        department_sizes = Counter(assignment)
+        company_sizes = Counter()
+        company_departments = Counter()
+        for index, (_department_id, company_id, _name, _domain) in enumerate(department_rows):
+            company_sizes[company_id] += department_sizes[index]
+            company_departments[company_id] += 1
+        created = self.today - timedelta(days=MAX_TENURE_DAYS)
+        bulk_insert(Company, [
+            {'id': company_id, 'name': self.company_names[company_id], 'created_at': created,
+             'department_count': company_departments[company_id],
+             'employee_count': company_sizes[company_id]}
+            for company_id in company_ids
+        ], batch_size=self.batch_size, using=using)
+        bulk_insert(Department, [
+            {'id': department_id, 'company_id': company_id, 'name': name, 'created_at': created,
+             'employee_count': department_sizes[index]}
+            for index, (department_id, company_id, name, _domain) in enumerate(department_rows)
+        ], batch_size=self.batch_size, using=using)
+
+    # employees
+
+    def _employee(self, number, employee_id, department):
+        """
+        field values of one generated employee
+        (values are picked with random() indexing, several times faster
+        than rng.choice / randrange over a million rows)
+        """
+        random = self.rng.random
+        department_id, company_id, domain, designations = department
+        first = FIRST_NAMES[int(random() * len(FIRST_NAMES))]
+        last = LAST_NAMES[int(random() * len(LAST_NAMES))]
+        status = self.statuses[bisect(self.cum_weights, random() * self.cum_weights[-1])]
+        hired_on = None
+        if status == HIRED:
+            tenure = min(self.rng.expovariate(1 / MEAN_TENURE_DAYS), MAX_TENURE_DAYS)
+            # during office hours, a few weeks after applying
+            hired_on = self.today - timedelta(days=int(tenure), hours=6 + int(random() * 10))
+            created_at = hired_on - timedelta(days=7 + int(random() * 53))
+        else:
+            days = MAX_TENURE_DAYS if status == NOT_ACCEPTED else PIPELINE_DAYS
+            created_at = self.today - timedelta(seconds=int(random() * days * 86400))
+        return {
+            'id': employee_id,
+            'company_id': company_id,
+            'department_id': department_id,
+            'name': f'{first} {last}',
+            'email': f'{first.lower()}.{last.lower()}.{number}@{domain}',
+            'mobile_number': f'+1{2000000000 + int(random() * 7999999999)}',
+            'address': f'{1 + int(random() * 9999)} {STREETS[int(random() * len(STREETS))]}, '
+                       f'{CITIES[int(random() * len(CITIES))]}',
+            'designation': designations[int(random() * len(designations))],
+            'status': status,
+            'hired_on': hired_on,
+            'account_status': self.account_status,
+            'search_vector': None,
+            'created_at': created_at,
+            'updated_at': hired_on or created_at,
+        }
+
+    def _insert_employees(self, department_rows, assignment, using):
+        self.statuses = list(STATUS_WEIGHTS)
+        self.cum_weights = list(accumulate(STATUS_WEIGHTS.values()))
+        self.account_status = AccountStatus.PROVISIONED if self.users else AccountStatus.PENDING
+        departments = [
+            (department_id, company_id, domain, DEPARTMENTS[name.rstrip(' 0123456789')])
+            for department_id, company_id, name, domain in department_rows
+        ]
+
+        first_employee = next_pk(Employee, using)
+        first_user = next_pk(User, using) if self.users else None
+        users = 0
+        for start in range(0, self.employees, self.batch_size):
+            employees = [
+                self._employee(number, first_employee + number, departments[assignment[number]])
+                for number in range(start, min(start + self.batch_size, self.employees))
+            ]
+            bulk_insert(Employee, employees, batch_size=self.batch_size, using=using)
+            if not self.users:
+                continue
+            accounts = []
+            for employee in employees:
+                account = employee_user_fields(employee['name'], employee['email'], employee['id'])
+                account['id'] = first_user + users + len(accounts)
+                account['date_joined'] = employee['created_at']
+                accounts.append(account)
+            bulk_insert(User, accounts, batch_size=self.batch_size, using=using)
+            users += len(accounts)
+        return users
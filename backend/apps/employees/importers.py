@@ -0,0 +1,259 @@
+import csv
+import io
+import json
+from collections import Counter
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from apps.changes.models import ChangeAction
+from apps.changes.outbox import change_data, record_employees
+from apps.companies.counters import adjust_employee_count
+from apps.departments.models import Department
+from core.bulk import bulk_insert
+from core.cache import bump_generation
+from .models import AccountStatus, Employee, EmployeeStatus
+from .provisioning import employee_user_fields
+
+User = get_user_model()
+
+# plain fields validated with the model field validators
+IMPORT_FIELDS = ['name', 'email', 'mobile_number', 'address', 'designation', 'status', 'hired_on']
+
+IMPORT_FORMATS = {
+    'csv': 'csv',
+    'text/csv': 'csv',
+    'ndjson': 'ndjson',
+    'jsonl': 'ndjson',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+
+def detect_format(content_type='', filename=''):
+    """
+    csv / ndjson from a content type or a file extension, None if unknown
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in IMPORT_FORMATS:
+        return IMPORT_FORMATS[content_type]
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    return IMPORT_FORMATS.get(extension)
+
+
+def read_rows(stream, input_format):
+    """
+    yields (row number, dict or error message) from a text stream
+    """
+    if input_format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            yield number, row
+        return
+
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, 'invalid json'
+            continue
+        yield number, row if isinstance(row, dict) else 'each line must be a json object'
+
+
+def text_stream(data, encoding='utf-8'):
+    """
+    text stream over an uploaded file / request body (bytes or str)
+    """
+    if hasattr(data, 'read'):
+        data = data.read()
+    if isinstance(data, bytes):
+        data = data.decode(encoding)
+    return io.StringIO(data)
+
+
+class EmployeeImporter:
+    """
+    high throughput employee import:
+    - rows are validated with the same rules as Employee.save / clean and the
+      employee signals, but set-wise: departments, existing emails and
+      usernames are preloaded once per batch instead of queried per row
+    - valid rows are inserted in batches without building model instances
+      (COPY on postgres, bulk_create elsewhere), one transaction per batch,
+      together with their user accounts (one shared precomputed password hash)
+    - counter columns are adjusted once per batch
+    returns a report with the created count and the per row errors
+    """
+    batch_size = 1000
+
+    def __init__(self, batch_size=None, dry_run=False):
+        self.batch_size = batch_size or self.batch_size
+        self.dry_run = dry_run
+        self.fields = {name: Employee._meta.get_field(name) for name in IMPORT_FIELDS}
+        self.department_companies = {}
+
+    def run(self, rows):
+        report = {'valid': 0, 'created': 0, 'failed': 0, 'errors': []}
+        batch = []
+        for number, row in rows:
+            batch.append((number, row))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch, report)
+                batch = []
+        if batch:
+            self._import_batch(batch, report)
+        return report
+
+    # validation
+
+    def _load_indexes(self, batch):
+        """
+        preload everything the row validation needs for one batch (3 queries)
+        """
+        department_ids = set()
+        emails = set()
+        usernames = set()
+        for _, row in batch:
+            if not isinstance(row, dict):
+                continue
+            department_ids.add(self._to_int(row.get('department')))
+            email = str(row.get('email') or '').strip()
+            emails.add(email)
+            usernames.add(email.split('@')[0])
+
+        missing = department_ids - set(self.department_companies) - {None}
+        if missing:
+            self.department_companies.update(
+                Department.objects.filter(pk__in=missing).values_list('id', 'company_id')
+            )
+        taken_emails = set(Employee.objects.filter(email__in=emails).values_list('email', flat=True))
+        taken_emails.update(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        return taken_emails, taken_usernames
+
+    @staticmethod
+    def _to_int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _clean_row(self, row, taken_emails, taken_usernames):
+        """
+        returns (cleaned values, errors)
+        """
+        errors = {}
+        values = {}
+        for name, field in self.fields.items():
+            raw = row.get(name)
+            if isinstance(raw, str):
+                raw = raw.strip()
+            if raw in (None, ''):
+                raw = field.get_default()
+            try:
+                values[name] = field.clean(raw, None)
+            except ValidationError as error:
+                errors[name] = error.messages
+
+        company_id = self._to_int(row.get('company'))
+        department_id = self._to_int(row.get('department'))
+        if company_id is None:
+            errors['company'] = ['company is required']
+        if department_id is None:
+            errors['department'] = ['department is required']
+        elif department_id not in self.department_companies:
+            errors['department'] = ['department does not exist']
+        elif company_id is not None and self.department_companies[department_id] != company_id:
+            errors['department'] = ['selected department does not belong to this company']
+
+        email = values.get('email')
+        if email:
+            if email in taken_emails:
+                errors['email'] = ['This email is already registered in the system.']
+            elif email.split('@')[0] in taken_usernames:
+                errors['email'] = ['a user with this username already exists.']
+        if errors:
+            return None, errors
+
+        # same rules as Employee.save
+        hired_on = values.get('hired_on')
+        if values['status'] == EmployeeStatus.HIRED:
+            if not hired_on:
+                hired_on = timezone.now()
+            elif timezone.is_naive(hired_on):
+                hired_on = timezone.make_aware(hired_on)
+        else:
+            hired_on = None
+        values['hired_on'] = hired_on
+        values['company_id'] = company_id
+        values['department_id'] = department_id
+        values['account_status'] = AccountStatus.PROVISIONED  # the user is inserted with the row
+        return values, None
+
+    # insertion
+
+    def _import_batch(self, batch, report):
+        taken_emails, taken_usernames = self._load_indexes(batch)
+        employees = []
+        numbers = []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                report['errors'].append({'row': number, 'errors': {'row': [row]}})
+                continue
+            values, errors = self._clean_row(row, taken_emails, taken_usernames)
+            if errors:
+                report['errors'].append({'row': number, 'errors': errors})
+                continue
+            # later duplicates of the same email inside the file fail too
+            taken_emails.add(values['email'])
+            taken_usernames.add(values['email'].split('@')[0])
+            employees.append(values)
+            numbers.append(number)
+
+        report['failed'] = len(report['errors'])
+        report['valid'] += len(employees)
+        if not employees or self.dry_run:
+            return
+
+        try:
+            with transaction.atomic():
+                bulk_insert(Employee, employees, batch_size=self.batch_size)
+                # COPY returns no ids, they are read back once per batch for the login links
+                employee_ids = dict(Employee.objects.filter(
+                    email__in=[employee['email'] for employee in employees]
+                ).values_list('email', 'id'))
+                bulk_insert(User, [employee_user_fields(employee['name'], employee['email'],
+                                                        employee_ids[employee['email']])
+                                   for employee in employees],
+                            batch_size=self.batch_size)
+                self._adjust_counters(employees)
+                record_employees([(employee_ids[employee['email']], employee['company_id'],
+                                   change_data(Employee, employee)) for employee in employees],
+                                 ChangeAction.CREATED)
+        except IntegrityError:
+            # a concurrent write took one of the emails, the whole batch is rejected
+            for number in numbers:
+                report['errors'].append({
+                    'row': number,
+                    'errors': {'row': ['conflicting concurrent write, retry this row']},
+                })
+            report['valid'] -= len(employees)
+            report['failed'] = len(report['errors'])
+            return
+        report['created'] += len(employees)
+
+    @staticmethod
+    def _adjust_counters(employees):
+        """
+        counters and cached responses are updated once per batch
+        (bulk inserts skip the employee signals)
+        """
+        companies = Counter(employee['company_id'] for employee in employees)
+        departments = Counter(employee['department_id'] for employee in employees)
+        for company_id, total in companies.items():
+            adjust_employee_count(company_id=company_id, delta=total)
+        for department_id, total in departments.items():
+            adjust_employee_count(department_id=department_id, delta=total)
+        bump_generation(*companies)
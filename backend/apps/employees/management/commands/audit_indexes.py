@@ -0,0 +1,86 @@
+from importlib import import_module
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.indexaudit import IndexAudit, migration_source, suggested_indexes
+
+
+class Command(BaseCommand):
+    """
+    EXPLAIN (ANALYZE, BUFFERS) of every filter / search / ordering combination
+    of the list endpoints against the current data (see core.indexaudit)
+    usage: python manage.py audit_indexes [--max-filters 2] [--endpoint employees]
+           [--min-rows 10000] [--page-size 50] [--write-migrations]
+    prints the sequential scans, wasted index scans and disk sorts, then the
+    suggested composite indexes as Meta.indexes entries and a migration per app
+    """
+    help = 'explain the list endpoint queries and suggest composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-filters', type=int, default=2,
+                            help='most filters combined in one request')
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='only audit the endpoints whose path contains this (repeatable)')
+        parser.add_argument('--min-rows', type=int, default=10000,
+                            help='sequential scans of smaller tables are not reported')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--write-migrations', action='store_true',
+                            help='write the migrations into the migrations package of each app')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('the index audit needs postgresql (EXPLAIN ANALYZE, BUFFERS)')
+        if options['max_filters'] < 0:
+            raise CommandError('--max-filters must be positive')
+
+        verbosity = options['verbosity']
+
+        def progress(combination, queries):
+            if verbosity > 1:
+                self.stdout.write(f'  {combination} ({queries} queries)')
+
+        audit = IndexAudit(max_filters=options['max_filters'], page_size=options['page_size'],
+                           min_rows=options['min_rows'], endpoints=options['endpoints'])
+        audit.run(progress=progress)
+
+        combinations = {str(combination) for query in audit.queries.values() for combination in query.combinations}
+        self.stdout.write(f'{len(combinations)} combinations, {len(audit.queries)} distinct queries explained')
+        for path, names in audit.skipped.items():
+            self.stdout.write(f'{path}: no sample value for {", ".join(names)} (filterset audit_values)')
+        for error in audit.errors:
+            self.stdout.write(self.style.ERROR(error))
+
+        flagged = sorted(audit.flagged(), key=lambda query: -query.execution_ms)
+        for query in flagged:
+            self.stdout.write('')
+            self.stdout.write(self.style.WARNING(
+                f'{query.execution_ms:.1f}ms, buffers hit={query.shared_hit} read={query.shared_read}'
+                f'{f" temp written={query.temp_written}" if query.temp_written else ""}'
+                f', {len(query.combinations)} combination(s) e.g. {query.combinations[0]}'))
+            if verbosity > 1:
+                self.stdout.write(f'  {query.sql}')
+            for finding in query.findings:
+                self.stdout.write(f'  {finding.kind} {finding.table}: {finding.detail}')
+
+        suggestions = audit.suggestions()
+        if not suggestions:
+            self.stdout.write(self.style.SUCCESS('\nno index to suggest'))
+            return
+
+        self.stdout.write('\nsuggested indexes (flagged queries served):')
+        by_app = suggested_indexes(suggestions)
+        for entries in by_app.values():
+            for model, index, count in entries:
+                self.stdout.write(f'  {model.__name__}.Meta.indexes: '
+                                  f'models.Index(fields={index.fields!r}, name={index.name!r})  # {count}')
+
+        for app_label, entries in by_app.items():
+            name, source = migration_source(app_label, entries)
+            if options['write_migrations']:
+                module = import_module(f'{entries[0][0]._meta.app_config.name}.migrations')
+                path = Path(module.__file__).parent / f'{name}.py'
+                path.write_text(source, encoding='utf-8')
+                self.stdout.write(self.style.SUCCESS(f'\nwrote {path}'))
+            else:
+                self.stdout.write(f'\n# {app_label}/migrations/{name}.py')
+                self.stdout.write(source)
@@ -0,0 +1,104 @@
+import json
+import sys
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from benchmarks.seed import TIERS, seed_tier
+from benchmarks.suite import Benchmark, compare, environment, load_baseline, query_baseline, row_counts
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    """
+    in process api benchmark against a seeded tier, run in its own test database
+    usage: python manage.py benchmark --tier small|medium|large [--runs 30] [--output results.json]
+           [--baseline benchmarks/baseline.json] [--save-baseline] [--tolerance 0.25] [--keepdb]
+    exits with an error when a query count regressed against the baseline, or a p95
+    when the baseline is the --output report of an earlier run on this machine
+    """
+    help = 'time the main api endpoints against a seeded dataset and compare with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tier', choices=list(TIERS), default='small')
+        parser.add_argument('--runs', type=int, default=30, help='timed requests per endpoint')
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='only benchmark this endpoint (repeatable)')
+        parser.add_argument('--seed', type=int, default=0, help='random seed of the dataset')
+        parser.add_argument('--output', help='write the results to this json file')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help='query count baseline, or an --output report to compare the timings too')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='store the query counts as the baseline of the tier')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='allowed p95 slowdown against the baseline (0.25 = +25%%)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='keep the benchmark database (and its data) between runs')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+        tier = options['tier']
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = self.run_tier(tier, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+
+        baselines = load_baseline(options['baseline'])
+        if options['save_baseline']:
+            baselines[tier] = query_baseline(report['results'])
+            with open(options['baseline'], 'w', encoding='utf-8') as output:
+                json.dump(baselines, output, indent=2, sort_keys=True)
+                output.write('\n')
+            self.stdout.write(f"baseline of the {tier} tier saved to {options['baseline']}")
+            return
+
+        if tier not in baselines:
+            self.stdout.write(self.style.WARNING(f'no {tier} baseline to compare with'))
+            return
+        regressions = compare(report['results'], baselines[tier], options['tolerance'])
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            raise CommandError(f'{len(regressions)} regression(s) against the {tier} baseline')
+        self.stdout.write(self.style.SUCCESS(f'no regression against the {tier} baseline'))
+
+    def run_tier(self, tier, options):
+        companies, departments, employees = TIERS[tier]
+        counts = row_counts()
+        if counts['employees'] != employees:
+            if counts['employees']:
+                raise CommandError('the kept benchmark database holds another tier, run without --keepdb')
+            self.stdout.write(f'seeding {tier}: {companies} companies, '
+                              f'{companies * departments} departments, {employees} employees')
+            seed_tier(tier, seed=options['seed'])
+            counts = row_counts()
+
+        self.stdout.write(f"{'endpoint':<24}{'runs':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>9}")
+
+        def progress(name, result):
+            self.stdout.write(f"{name:<24}{result['runs']:>6}{result['p50_ms']:>10.2f}"
+                              f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['queries']:>9}")
+
+        results = Benchmark(runs=options['runs']).run(only=options['endpoints'], progress=progress)
+        return {
+            'tier': tier,
+            'seed': options['seed'],
+            'date': timezone.now().isoformat(),
+            'argv': sys.argv[1:],
+            'environment': environment(),
+            'rows': counts,
+            'results': results,
+        }
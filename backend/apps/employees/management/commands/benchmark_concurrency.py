@@ -0,0 +1,76 @@
+import json
+import sys
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.accounts.serializers import CustomTokenObtainPairSerializer
+from benchmarks.concurrency import MODES, ConcurrencyBenchmark
+from benchmarks.suite import environment, row_counts
+
+
+class Command(BaseCommand):
+    """
+    wsgi vs asgi throughput of the read endpoints against the current database
+    usage: python manage.py benchmark_concurrency [--concurrency 64] [--requests 500]
+           [--mode wsgi|asgi-sync|asgi] [--endpoint employee_list] [--email admin@example.com]
+           [--output results.json]
+    fill the database first (python manage.py generate_org), keep the
+    concurrency below the server max_connections with DB_CONNECTIONS=direct
+    """
+    help = 'compare the sync (wsgi) and async (asgi) read endpoints under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64, help='requests in flight')
+        parser.add_argument('--requests', type=int, default=500, help='timed requests per endpoint and mode')
+        parser.add_argument('--warmup', type=int, default=10, help='untimed requests before each run')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES,
+                            help='only run this mode (repeatable)')
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='only benchmark this endpoint (repeatable)')
+        parser.add_argument('--email', help='user the requests authenticate as (default: the first superuser)')
+        parser.add_argument('--output', help='write the results to this json file')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+        counts = row_counts()
+        if not counts['employees']:
+            raise CommandError('the database has no employees, run generate_org first')
+
+        users = get_user_model().objects.filter(is_active=True)
+        if options['email']:
+            user = users.filter(email=options['email']).first()
+        else:
+            user = users.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError('no active user to authenticate as, pass --email')
+        token = str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+
+        self.stdout.write(
+            f"{counts['employees']} employees, DB_CONNECTIONS={settings.DB_CONNECTIONS}, "
+            f"ASYNC_CONCURRENT_QUERIES={settings.ASYNC_CONCURRENT_QUERIES}, "
+            f"{options['concurrency']} concurrent requests"
+        )
+        self.stdout.write(f"{'endpoint':<20}{'mode':<11}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>8}")
+
+        def progress(name, mode, result):
+            self.stdout.write(f"{name:<20}{mode:<11}{result['rps']:>9.1f}{result['p50_ms']:>10.2f}"
+                              f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}")
+
+        benchmark = ConcurrencyBenchmark(token, concurrency=options['concurrency'],
+                                         requests=options['requests'], warmup=options['warmup'])
+        results = benchmark.run(modes=options['modes'] or MODES, only=options['endpoints'], progress=progress)
+
+        if options['output']:
+            report = {
+                'date': timezone.now().isoformat(),
+                'argv': sys.argv[1:],
+                'environment': environment(),
+                'db_connections': settings.DB_CONNECTIONS,
+                'async_concurrent_queries': settings.ASYNC_CONCURRENT_QUERIES,
+                'rows': counts,
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from apps.employees.generator import OrgGenerator
+
+
+class Command(BaseCommand):
+    """
+    synthetic organisation for benchmark / staging databases
+    usage: python manage.py generate_org --companies 50 --departments 20 --employees 1000000
+           [--users] [--seed 0]
+    """
+    help = 'generate companies, departments and employees in bulk (deterministic for a seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=10)
+        parser.add_argument('--departments', type=int, default=5, help='departments per company')
+        parser.add_argument('--employees', type=int, default=1000, help='employees in total')
+        parser.add_argument('--users', action='store_true',
+                            help='also create the employee logins (shared temp password)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=OrgGenerator.batch_size)
+
+    def handle(self, *args, **options):
+        if options['companies'] < 1 or options['departments'] < 1 or options['employees'] < 0:
+            raise CommandError('--companies and --departments must be at least 1, --employees at least 0')
+
+        generator = OrgGenerator(
+            options['companies'], options['departments'], options['employees'],
+            seed=options['seed'], users=options['users'], batch_size=options['batch_size'],
+        )
+        started = time.perf_counter()
+        try:
+            created = generator.run()
+        except IntegrityError as error:
+            raise CommandError(f'generated rows collide with existing ones, use another --seed '
+                               f'or an empty database ({error})')
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{created['companies']} companies, {created['departments']} departments, "
+            f"{created['employees']} employees, {created['users']} users in {elapsed:.2f}s "
+            f"({created['employees'] / elapsed if elapsed else 0:.0f} employees/s)"
+        )
@@ -0,0 +1,48 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.employees.importers import EmployeeImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    """
+    bulk employee import from a csv / ndjson file
+    usage: python manage.py import_employees employees.csv [--format csv] [--dry-run]
+    """
+    help = 'import employees in bulk from a csv or ndjson file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='csv or ndjson file to import')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='input format (detected from the file extension by default)')
+        parser.add_argument('--batch-size', type=int, default=EmployeeImporter.batch_size)
+        parser.add_argument('--dry-run', action='store_true', help='only validate the rows')
+        parser.add_argument('--report', help='write the per row error report to this json file')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or detect_format(filename=options['path'])
+        if input_format is None:
+            raise CommandError('unknown input format, pass --format csv|ndjson')
+
+        importer = EmployeeImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        started = time.perf_counter()
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as stream:
+                report = importer.run(read_rows(stream, input_format))
+        except OSError as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - started
+
+        rows = report['valid'] + report['failed']
+        self.stdout.write(
+            f"{rows} row(s) in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s): "
+            f"{report['valid']} valid, {report['created']} created, {report['failed']} failed"
+        )
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as output:
+                json.dump(report['errors'], output, indent=2)
+        else:
+            for error in report['errors'][:20]:
+                self.stdout.write(self.style.WARNING(f"row {error['row']}: {error['errors']}"))
+            if len(report['errors']) > 20:
+                self.stdout.write(f"... {len(report['errors']) - 20} more, use --report to save them all")
@@ -0,0 +1,85 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from apps.employees.partitioning import (
+    STRATEGIES, TABLE, partition, partition_strategy, sync_company_partitions, unpartition,
+)
+
+
+class Command(BaseCommand):
+    """
+    converts the employee table into a table partitioned by company, or back
+    usage: python manage.py partition_employees [--strategy hash|list] [--partitions 16]
+           python manage.py partition_employees --sync     (list: partitions of the companies missing one)
+           python manage.py partition_employees --revert
+           python manage.py partition_employees --status [-v 2]
+    the table is locked while it is copied, run it in a maintenance window
+    """
+    help = 'partition the employee table by company (or --revert it to a plain table)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strategy', choices=STRATEGIES,
+                            help='hash or list partitioning (default: EMPLOYEE_PARTITIONING)')
+        parser.add_argument('--partitions', type=int, default=None,
+                            help='number of hash partitions (default: EMPLOYEE_PARTITIONS)')
+        parser.add_argument('--sync', action='store_true',
+                            help='create the missing company partitions of a list partitioned table')
+        parser.add_argument('--revert', action='store_true', help='convert back into a plain table')
+        parser.add_argument('--status', action='store_true', help='only show the partitions and their rows')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('partitioning needs postgresql')
+        current = partition_strategy(connection)
+        started = time.perf_counter()
+
+        if options['status']:
+            pass
+        elif options['revert']:
+            if current is None:
+                raise CommandError(f'{TABLE} is not partitioned')
+            unpartition(connection)
+            self.stdout.write(f'{TABLE} is a plain table again ({time.perf_counter() - started:.2f}s)')
+        elif options['sync']:
+            if current != 'list':
+                raise CommandError(f'{TABLE} is not list partitioned')
+            created = sync_company_partitions(connection)
+            self.stdout.write(f'created {len(created)} company partition(s)')
+        else:
+            strategy = options['strategy'] or settings.EMPLOYEE_PARTITIONING
+            if strategy not in STRATEGIES:
+                raise CommandError('pass --strategy hash|list or set EMPLOYEE_PARTITIONING')
+            if current is not None:
+                raise CommandError(f'{TABLE} is already {current} partitioned, --revert it first')
+            if options['partitions'] is not None and options['partitions'] < 1:
+                raise CommandError('--partitions must be at least 1')
+            partition(connection, strategy, options['partitions'])
+            self.stdout.write(f'{TABLE} is {strategy} partitioned ({time.perf_counter() - started:.2f}s)')
+            if strategy != settings.EMPLOYEE_PARTITIONING:
+                self.stdout.write(f'set EMPLOYEE_PARTITIONING={strategy} so the application prunes its queries')
+
+        self.show(connection, options['verbosity'])
+
+    def show(self, connection, verbosity):
+        strategy = partition_strategy(connection)
+        if strategy is None:
+            self.stdout.write(f'{TABLE}: not partitioned')
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(%s)
+                ORDER BY c.relname
+            """, [TABLE])
+            partitions = cursor.fetchall()
+            cursor.execute(f'SELECT tableoid::regclass::text, count(*) FROM {connection.ops.quote_name(TABLE)} GROUP BY 1')
+            rows = dict(cursor.fetchall())
+        self.stdout.write(f'{TABLE}: {strategy} partitioned, {len(partitions)} partition(s), '
+                          f'{sum(rows.values())} row(s)')
+        if verbosity > 1:
+            for name, bound in partitions:
+                self.stdout.write(f'  {name:<40}{rows.get(name, 0):>10}  {bound}')
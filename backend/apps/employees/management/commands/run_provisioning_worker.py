@@ -0,0 +1,62 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from apps.employees.provisioning import link_employee_logins, provision_pending
+
+# longest sleep between two attempts while the database keeps failing
+MAX_ERROR_SLEEP = 60
+# consecutive database errors after which --once gives up
+ONCE_MAX_ERRORS = 3
+
+
+class Command(BaseCommand):
+    """
+    creates the user accounts queued in the provisioning outbox
+    usage: python manage.py run_provisioning_worker [--batch-size 100] [--interval 1] [--once] [--link-logins]
+    --link-logins first links the logins created before the employee link
+    existed (fixtures, older installs) to the employee with their email,
+    only for databases whose logins were all created by an admin
+    a database error (connection lost, failover) does not stop the worker,
+    it reconnects with a growing pause between attempts (--once gives up
+    after ONCE_MAX_ERRORS in a row)
+    """
+    help = 'drain the employee user provisioning outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='accounts created per transaction')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='drain the outbox and exit instead of polling forever')
+        parser.add_argument('--link-logins', action='store_true',
+                            help='link the existing logins without an employee to the employee with their email')
+
+    def handle(self, *args, **options):
+        if options['link_logins']:
+            linked = link_employee_logins()
+            self.stdout.write(f'linked {linked} existing login(s) to their employee')
+        errors = 0
+        try:
+            while True:
+                try:
+                    provisioned, failed = provision_pending(options['batch_size'])
+                except DatabaseError as error:
+                    errors += 1
+                    if options['once'] and errors >= ONCE_MAX_ERRORS:
+                        raise CommandError(f'provisioning failed {errors} times in a row: {error}')
+                    pause = min(options['interval'] * 2 ** errors, MAX_ERROR_SLEEP)
+                    self.stderr.write(f'provisioning failed ({error}), retrying in {pause:.0f}s')
+                    connection.close()  # the next attempt opens a fresh one
+                    time.sleep(pause)
+                    continue
+                errors = 0
+                if provisioned or failed:
+                    self.stdout.write(f'provisioned {provisioned} account(s), {failed} failed')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('provisioning worker stopped'))
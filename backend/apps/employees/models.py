@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, DurationField, ExpressionWrapper, F, Q, When
+from django.db.models.functions import Extract, Now
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, EmailValidator
 from django.utils import timezone
+from datetime import timedelta
 from apps.companies.models import Company
 from apps.departments.models import Department
 # Create your models here.
@@ -16,6 +22,70 @@ class EmployeeStatus(models.TextChoices):
     HIRED = "HIRED", 'hired'
     NOT_ACCEPTED = "NOT_ACCEPTED", 'not accepted'
 
+# workflow: the statuses each status can move to
+ALLOWED_TRANSITIONS = {
+    EmployeeStatus.APPLICATION_RECEIVED.value: {
+        EmployeeStatus.INTERVIEW_SCHEDULED.value,
+        EmployeeStatus.NOT_ACCEPTED.value
+    },
+    EmployeeStatus.INTERVIEW_SCHEDULED.value: {
+        EmployeeStatus.HIRED.value,
+        EmployeeStatus.NOT_ACCEPTED.value
+    },
+    EmployeeStatus.HIRED.value: set(), # no transitions from hired
+    EmployeeStatus.NOT_ACCEPTED.value: set() # no transitions from not accepted
+}
+
+class AccountStatus(models.TextChoices):
+    """
+    state of the employee login (user account), created asynchronously
+    by the provisioning worker
+    """
+    PENDING = "PENDING", 'pending'
+    PROVISIONED = "PROVISIONED", 'provisioned'
+    FAILED = "FAILED", 'failed'
+
+def days_employed_expression():
+    """
+    whole days since hired_on computed by the database, null unless hired
+    (same result as the Employee.days_employed property)
+    """
+    tenure = ExpressionWrapper(Now() - F('hired_on'), output_field=DurationField())
+    return Case(
+        When(status=EmployeeStatus.HIRED.value, hired_on__isnull=False, then=Extract(tenure, 'day')),
+        default=None,
+        output_field=models.IntegerField(),
+    )
+
+def hired_before(days):
+    """
+    the moment `days` days ago, as a database expression so that the
+    tenure filters and the days_employed annotation share the same now()
+    """
+    return ExpressionWrapper(Now() - timedelta(days=days), output_field=models.DateTimeField())
+
+class EmployeeQuerySet(models.QuerySet):
+
+    def with_days_employed(self):
+        """
+        days employed as an sql annotation (read back by the days_employed property)
+        """
+        return self.annotate(days_employed=days_employed_expression())
+
+    def employed_for(self, min_days=None, max_days=None):
+        """
+        hired employees whose days employed is within [min_days, max_days].
+        written as a hired_on range so the employee_status_hired_idx index
+        serves it (a filter on the annotation would compute every row)
+        """
+        conditions = Q(status=EmployeeStatus.HIRED.value)
+        if min_days is not None:
+            conditions &= Q(hired_on__lte=hired_before(min_days))
+        if max_days is not None:
+            # less than max_days + 1 whole days
+            conditions &= Q(hired_on__gt=hired_before(max_days + 1))
+        return self.filter(conditions)
+
 class Employee(models.Model):
     """
     from tasks.pdf
@@ -62,13 +132,39 @@ class Employee(models.Model):
         default=EmployeeStatus.APPLICATION_RECEIVED.value
     )
     hired_on = models.DateTimeField(null=True, blank=True)
+    # rows created before the provisioning outbox (and the fixtures) already have their user
+    account_status = models.CharField(
+        max_length=20,
+        choices=AccountStatus.choices,
+        default=AccountStatus.PROVISIONED,
+        editable=False,
+    )
+    # name / designation / email document, maintained by a database trigger (core.search)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = EmployeeQuerySet.as_manager()
+
     class Meta:
         verbose_name = "employee"
         verbose_name_plural = "employees"
         ordering = ['-created_at']
+        indexes = [
+            # matches the keyset pagination ordering of the employee list
+            models.Index(fields=['-created_at', 'id'], name='employee_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='employee_search_vector_idx'),
+            # tenure filters / ordering (days employed is derived from hired_on)
+            models.Index(fields=['status', 'hired_on'], name='employee_status_hired_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # remember the loaded foreign keys so the counter signals can tell
+        # when an employee moved (read from __dict__ to never hit deferred fields)
+        self._original_company_id = self.__dict__.get('company_id')
+        self._original_department_id = self.__dict__.get('department_id')
+        self._original_email = self.__dict__.get('email')
 
     def __str__(self):
         return f"{self.name} - {self.designation} ({self.department})"
@@ -78,11 +174,20 @@ class Employee(models.Model):
         """
         calculate days employed if the employee is hired
         -- returns None if not hired
+        -- rows loaded with EmployeeQuerySet.with_days_employed() return the
+           value computed by the database
         """
+        if '_days_employed' in self.__dict__:
+            return self._days_employed
         if self.status == EmployeeStatus.HIRED.value and self.hired_on:
             return (timezone.now() - self.hired_on).days
         return None
 
+    @days_employed.setter
+    def days_employed(self, value):
+        # set by the queryset annotation
+        self._days_employed = value
+
     def clean(self):
         """
         adds some custom validation checks
@@ -90,7 +195,8 @@ class Employee(models.Model):
         2. validates hired on date based on status
         3. all required fields must be filled
         """
-        if self.department and self.company and self.department.company != self.company:
+        # compared by id, the department's company row is never loaded for this
+        if self.department and self.company and self.department.company_id != self.company_id:
             raise ValidationError({
                 'department': 'selected department does not belong to this company'
             })
@@ -108,34 +214,93 @@ class Employee(models.Model):
             this method overrides save to:
             - sets hired on date automatically when status changes to HIRED
             - clear hired on date if status changes from Hired
+            - marks the login of a new employee as pending (see provisioning outbox)
             - runs full clean for validation
             """
+            if self._state.adding:
+                self.account_status = AccountStatus.PENDING
 
             if self.status == EmployeeStatus.HIRED and not self.hired_on:
                 self.hired_on = timezone.now()
             elif self.status != EmployeeStatus.HIRED.value:
                 self.hired_on = None
 
-            self.full_clean()
+            self.full_clean(exclude=self.prevalidated_fields())
             super().save(*args, **kwargs)
+            # an annotated days employed is stale once status / hired_on changed
+            self.__dict__.pop('_days_employed', None)
+            # the post_save signals compared against the previous foreign keys
+            self._original_company_id = self.company_id
+            self._original_department_id = self.department_id
+            self._original_email = self.email
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """
+        with a partitioned employee table (apps.employees.partitioning) the
+        UPDATE names the company the row was loaded with, so only its
+        partition is scanned. a row moved since then is updated by id
+        """
+        if settings.EMPLOYEE_PARTITIONING and self._original_company_id is not None:
+            pruned = base_qs.filter(company_id=self._original_company_id)
+            if super()._do_update(pruned, using, pk_val, values, update_fields, forced_update):
+                return True
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+    def prevalidated_fields(self):
+        """
+        fields whose full_clean database checks are already settled:
+        - a foreign key whose related row is loaded on the instance exists
+          (the existence query is skipped, the db constraint still applies)
+        - the email of a saved employee that did not change is still unique
+        """
+        exclude = []
+        for field in (Employee._meta.get_field('company'), Employee._meta.get_field('department')):
+            if field.is_cached(self):
+                related = field.get_cached_value(self)
+                if related is not None and related.pk == getattr(self, field.attname):
+                    exclude.append(field.name)
+        if not self._state.adding and self.email == self._original_email:
+            exclude.append('email')
+        return exclude
 
     def can_transition_to(self, new_status):
             """
             validate status transitions according to workflow
             """
-            current_status = self.status
-            allowed_transitions = {
-                EmployeeStatus.APPLICATION_RECEIVED.value: {
-                    EmployeeStatus.INTERVIEW_SCHEDULED.value,
-                    EmployeeStatus.NOT_ACCEPTED.value
-                },
-                EmployeeStatus.INTERVIEW_SCHEDULED.value: {
-                    EmployeeStatus.HIRED.value,
-                    EmployeeStatus.NOT_ACCEPTED.value
-                },
-                EmployeeStatus.HIRED.value:set(), # no transitions from hired
-                EmployeeStatus.NOT_ACCEPTED.value: set() # no transitions from not accepted
-            }
-            return new_status in allowed_transitions.get(current_status, set())
+            return new_status in ALLOWED_TRANSITIONS.get(self.status, set())
 
 
+class UserProvisioning(models.Model):
+    """
+    outbox of user accounts to create for new employees.
+    a row is written in the same transaction as the employee so it becomes
+    visible exactly when the employee commits, the run_provisioning_worker
+    command drains it in batches off the request path
+    """
+    class State(models.TextChoices):
+        PENDING = "PENDING", 'pending'
+        DONE = "DONE", 'done'
+        FAILED = "FAILED", 'failed'
+
+    employee = models.OneToOneField(Employee, on_delete=models.CASCADE,
+                                    related_name='provisioning')
+    state = models.CharField(max_length=10, choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # a pending task that failed is not claimed again before this time (retry backoff)
+    retry_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "user provisioning"
+        verbose_name_plural = "user provisioning"
+        ordering = ['id']
+        indexes = [
+            # the worker only ever scans the pending rows
+            models.Index(fields=['id'], name='provisioning_pending_idx',
+                         condition=models.Q(state='PENDING')),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} ({self.state})"
@@ -0,0 +1,145 @@
+"""
+set-based bulk operations on employees (POST /api/v1/employees/bulk/).
+
+the workflow of a transition is a condition of its UPDATE (status among the
+statuses allowed to move to the new one), the rows the statement skipped
+are the rejected ones. moves and deletes lock the targeted rows once and
+write them with a single statement. no get_object / full_clean / save round
+trip per employee. counters and
+cached responses are adjusted once per operation, the change outbox
+(apps.changes) gets one INSERT per operation.
+every operation returns {'applied': [ids], 'rejected': [{'id', 'reason'}]}
+"""
+from collections import Counter
+from django.db import transaction
+from django.utils import timezone
+from apps.changes.models import ChangeAction
+from apps.changes.outbox import record_employees
+from apps.companies.counters import adjust_employee_count
+from core.bulk import update_returning
+from core.cache import bump_generation
+from .models import ALLOWED_TRANSITIONS, Employee, EmployeeStatus
+from .partitioning import prune
+from .signals import bulk_operation
+
+OPERATIONS = ('transition', 'move', 'delete')
+
+
+def _targets(queryset, ids=None):
+    """
+    the employees of queryset, limited to ids, as a queryset without joins
+    """
+    targets = Employee.objects.filter(pk__in=queryset.order_by().values('pk'))
+    if ids is not None:
+        targets = targets.filter(pk__in=ids)
+    return targets
+
+
+def _not_found(ids, found):
+    if ids is None:
+        return []
+    return [{'id': pk, 'reason': 'employee not found or filtered out'}
+            for pk in sorted(set(ids) - set(found))]
+
+
+def _lock(queryset, ids=None):
+    """
+    (rows, rejected) of the targeted employees, rows locked FOR UPDATE.
+    rows are (id, status, company_id, department_id) tuples
+    """
+    rows = list(_targets(queryset, ids).select_for_update()
+                .order_by('pk')
+                .values_list('pk', 'status', 'company_id', 'department_id'))
+    return rows, _not_found(ids, [row[0] for row in rows])
+
+
+def _result(applied, rejected):
+    return {'applied': applied, 'rejected': sorted(rejected, key=lambda row: row['id'])}
+
+
+def bulk_transition(queryset, new_status, ids=None):
+    """
+    moves every employee allowed by the workflow (Employee.can_transition_to)
+    to new_status in one UPDATE ... WHERE status IN (the allowed sources),
+    hired_on follows the same rules as Employee.save. the targeted rows the
+    UPDATE did not return are rejected
+    """
+    sources = [status for status, allowed in ALLOWED_TRANSITIONS.items() if new_status in allowed]
+    with transaction.atomic():
+        targets = _targets(queryset, ids)
+        now = timezone.now()
+        updated = update_returning(
+            targets.filter(status__in=sources), ('id', 'company_id'),
+            status=new_status,
+            hired_on=now if new_status == EmployeeStatus.HIRED else None,
+            updated_at=now,
+        )
+        updated.sort()
+        applied = [pk for pk, _ in updated]
+        applied_ids = set(applied)
+        # read after the update: the rows it skipped kept their status
+        current = dict(targets.order_by().values_list('pk', 'status'))
+        rejected = _not_found(ids, current)
+        rejected += [{'id': pk, 'reason': f'invalid transition status from {status} to {new_status}'}
+                     for pk, status in current.items() if pk not in applied_ids]
+        if updated:
+            record_employees([(pk, company_id, {'status': new_status}) for pk, company_id in updated],
+                             ChangeAction.UPDATED)
+            bump_generation(*{company_id for _, company_id in updated})
+    return _result(applied, rejected)
+
+
+def bulk_move(queryset, department, ids=None):
+    """
+    reassigns employees to department (and to its company) in one UPDATE
+    """
+    with transaction.atomic():
+        rows, rejected = _lock(queryset, ids)
+        applied, moved = [], []
+        for row in rows:
+            if row[3] == department.pk:
+                rejected.append({'id': row[0], 'reason': 'employee is already in this department'})
+            else:
+                applied.append(row[0])
+                moved.append(row)
+        if applied:
+            prune(Employee.objects.filter(pk__in=applied), *{row[2] for row in moved}).update(
+                department_id=department.pk,
+                company_id=department.company_id,
+                updated_at=timezone.now(),
+            )
+            _adjust_counters(moved, -1)
+            adjust_employee_count(department.company_id, department.pk, len(moved))
+            data = {'department': department.pk}
+            record_employees([(row[0], department.company_id, data) for row in moved], ChangeAction.UPDATED)
+            # the company they left hears of it too (apps.changes.outbox.record)
+            record_employees([(row[0], row[2], {'company': department.company_id})
+                              for row in moved if row[2] != department.company_id], ChangeAction.MOVED)
+            bump_generation(department.company_id, *{row[2] for row in moved})
+    return _result(applied, rejected)
+
+
+def bulk_delete(queryset, ids=None):
+    """
+    deletes employees with one DELETE per batch (the collector still
+    cascades to the provisioning outbox and unlinks the logins)
+    """
+    with transaction.atomic():
+        rows, rejected = _lock(queryset, ids)
+        applied = [row[0] for row in rows]
+        if applied:
+            with bulk_operation():
+                prune(Employee.objects.filter(pk__in=applied), *{row[2] for row in rows}).delete()
+            _adjust_counters(rows, -1)
+            record_employees([(row[0], row[2], {}) for row in rows], ChangeAction.DELETED)
+            bump_generation(*{row[2] for row in rows})
+    return _result(applied, rejected)
+
+
+def _adjust_counters(rows, sign):
+    companies = Counter(row[2] for row in rows)
+    departments = Counter(row[3] for row in rows)
+    for company_id, total in companies.items():
+        adjust_employee_count(company_id=company_id, delta=sign * total)
+    for department_id, total in departments.items():
+        adjust_employee_count(department_id=department_id, delta=sign * total)
@@ -0,0 +1,18 @@
+from rest_framework.parsers import BaseParser
+
+
+class RawUploadParser(BaseParser):
+    """
+    hands the raw request body of a csv / ndjson upload to the view
+    (request.data becomes {'file': <stream>, 'content_type': ...})
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        return {'file': stream, 'content_type': media_type}
+
+
+class CSVParser(RawUploadParser):
+    media_type = 'text/csv'
+
+
+class NDJSONParser(RawUploadParser):
+    media_type = 'application/x-ndjson'
@@ -0,0 +1,459 @@
+"""
+optional partitioning of the employee table by company (EMPLOYEE_PARTITIONING).
+
+- hash: EMPLOYEE_PARTITIONS partitions, each company in one of them
+- list: a partition per company, created with the company, and a default
+  partition for the rows of companies that do not have theirs yet
+  (python manage.py partition_employees --sync moves them)
+
+a query filtered on company_id only reads the partition(s) of that company
+(partition pruning): the ?company= filters of the list / exports / detail,
+the department employees, the updates of Employee.save and the bulk
+operations. a lookup by id alone probes the id index of every partition.
+
+postgres wants the partition key in every unique constraint, so on a
+partitioned table:
+- the primary key is (company_id, id), ids stay unique through the identity
+  sequence and a plain index on id serves the lookups
+- the email uniqueness is checked by a trigger, serialized per email with an
+  advisory lock, raising the unique_violation the constraint raised
+- the foreign keys to the employee table (the login of accounts_user, the
+  provisioning outbox) are replaced by constraint triggers, deferred like
+  the foreign keys they replace
+
+deleting a company drops (EMPLOYEE_DELETED_PARTITIONS=detach: keeps as a
+standalone table) its list partition instead of deleting the employees one
+by one (release_company_employees).
+
+python manage.py partition_employees converts the table (post_migrate does
+it when EMPLOYEE_PARTITIONING is set), partition_employees --revert converts
+it back. postgres only.
+"""
+from django.conf import settings
+from django.db import connections, models, router, transaction
+
+from .models import Employee
+
+STRATEGIES = ('hash', 'list')
+TABLE = Employee._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+# indexes only the partitioned table has, replacing its unique constraints
+ID_INDEX = f'{TABLE}_id_idx'
+EMAIL_INDEX = f'{TABLE}_email_idx'
+EMAIL_CONSTRAINT = f'{TABLE}_email_key'
+EMAIL_TRIGGER = f'{TABLE}_unique_email'
+REFERENCE_FUNCTION = f'{TABLE}_reference_check'
+REFERENCED_FUNCTION = f'{TABLE}_referenced_check'
+# serializes the inserts / updates of one email (pg_advisory_xact_lock key, with the email hash)
+EMAIL_LOCK = 718_302
+
+
+def partitioned():
+    return settings.EMPLOYEE_PARTITIONING in STRATEGIES
+
+
+def prune(queryset, *company_ids):
+    """
+    queryset restricted to the companies of its rows, so that postgres only
+    scans their partitions (unchanged when the table is not partitioned)
+    """
+    company_ids = {company_id for company_id in company_ids if company_id is not None}
+    if not partitioned() or not company_ids:
+        return queryset
+    if len(company_ids) == 1:
+        return queryset.filter(company_id=company_ids.pop())
+    return queryset.filter(company_id__in=company_ids)
+
+
+def partition_strategy(connection):
+    """
+    'hash' / 'list' when the employee table is partitioned, None otherwise
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT partstrat FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE]
+        )
+        row = cursor.fetchone()
+    return {'h': 'hash', 'l': 'list'}.get(row[0]) if row else None
+
+
+def company_partition(company_id):
+    return f'{TABLE}_c{int(company_id)}'
+
+
+def _references():
+    """
+    the foreign keys pointing at the employee table
+    """
+    return [
+        relation.field for relation in Employee._meta.related_objects
+        if (relation.one_to_many or relation.one_to_one) and relation.field.db_constraint
+    ]
+
+
+def _table_exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+    return cursor.fetchone()[0]
+
+
+# conversion
+
+def _index_definitions(cursor):
+    """
+    CREATE INDEX statements of the non unique indexes of the employee table
+    """
+    cursor.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s) AND NOT i.indisunique
+    """, [TABLE])
+    return [
+        # a partitioned table reports its indexes as created ON ONLY the parent
+        definition.replace(' ON ONLY ', ' ON ', 1)
+        for name, definition in cursor.fetchall() if name not in (ID_INDEX, EMAIL_INDEX)
+    ]
+
+
+def _foreign_keys(cursor):
+    """
+    (name, definition) of the foreign keys of the employee table (company, department)
+    """
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype = 'f' AND conparentid = 0
+    """, [TABLE])
+    return cursor.fetchall()
+
+
+def _rebuild(connection, partition_by='', partitions=()):
+    """
+    copies the employee table into a new table (PARTITION BY partition_by,
+    with the partitions: CREATE TABLE ... PARTITION OF clauses) under the
+    same name. ids, identity sequence, indexes, foreign keys and triggers
+    are carried over, the keys and constraints are left to the caller
+    """
+    quote = connection.ops.quote_name
+    table, previous = quote(TABLE), quote(f'{TABLE}_previous')
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        indexes = _index_definitions(cursor)
+        foreign_keys = _foreign_keys(cursor)
+
+        # the incoming foreign keys / reference triggers go first, they are put back by the caller
+        for field in _references():
+            referencing = quote(field.model._meta.db_table)
+            cursor.execute("""
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = to_regclass(%s) AND confrelid = to_regclass(%s) AND contype = 'f'
+            """, [field.model._meta.db_table, TABLE])
+            for (name,) in cursor.fetchall():
+                cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT {quote(name)}')
+            cursor.execute(f'DROP TRIGGER IF EXISTS {quote(_reference_trigger(field))} ON {referencing}')
+
+        # the new table takes over the name of the identity sequence
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {previous}')
+        cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {quote(f'{TABLE}_previous_id_seq')}")
+        cursor.execute(f"""
+            CREATE TABLE {table} (LIKE {previous} INCLUDING DEFAULTS INCLUDING IDENTITY
+                INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) {partition_by}
+        """)
+        for partition in partitions:
+            cursor.execute(partition)
+        cursor.execute(f'INSERT INTO {table} SELECT * FROM {previous}')
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence(%s, 'id'), last_value, is_called)
+            FROM {quote(f'{TABLE}_previous_id_seq')}
+        """, [TABLE])
+        # the indexes, foreign keys and triggers of the old table go with it
+        cursor.execute(f'DROP TABLE {previous} CASCADE')
+
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote(name)} {definition}')
+    _install_triggers(connection)
+
+
+def _install_triggers(connection):
+    # the search vector and report triggers of the employee table (post_migrate otherwise)
+    from apps.reports.rollups import install_change_triggers
+    from .signals import install_employee_search
+    install_employee_search(sender=None, using=connection.alias)
+    install_change_triggers(connection)
+
+
+def partition(connection, strategy, partitions=None):
+    """
+    converts the plain employee table into a partitioned one (in one
+    transaction, the table is locked for the time of the copy)
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f'unknown partitioning strategy {strategy!r}, expected one of {STRATEGIES}')
+    quote = connection.ops.quote_name
+    table = quote(TABLE)
+
+    if strategy == 'hash':
+        modulus = partitions or settings.EMPLOYEE_PARTITIONS
+        clauses = [
+            f'CREATE TABLE {quote(f"{TABLE}_p{remainder}")} PARTITION OF {table} '
+            f'FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})'
+            for remainder in range(modulus)
+        ]
+    else:
+        from apps.companies.models import Company
+        company_ids = Company._base_manager.using(connection.alias).order_by('pk').values_list('pk', flat=True)
+        clauses = [
+            f'CREATE TABLE {quote(company_partition(company_id))} PARTITION OF {table} '
+            f'FOR VALUES IN ({int(company_id)})'
+            for company_id in company_ids
+        ]
+        clauses.append(f'CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {table} DEFAULT')
+
+    with transaction.atomic(using=connection.alias):
+        _rebuild(connection, f'PARTITION BY {strategy.upper()} (company_id)', clauses)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote(f"{TABLE}_pkey")} '
+                           f'PRIMARY KEY (company_id, id)')
+            cursor.execute(f'CREATE INDEX {quote(ID_INDEX)} ON {table} (id)')
+            cursor.execute(f'CREATE INDEX {quote(EMAIL_INDEX)} ON {table} (email)')
+            cursor.execute(f'ANALYZE {table}')
+        install_partitioned_constraints(connection)
+
+
+def unpartition(connection):
+    """
+    converts the partitioned employee table back into a plain one, with its
+    primary key, email unique constraint and incoming foreign keys
+    """
+    quote = connection.ops.quote_name
+    table = quote(TABLE)
+    with transaction.atomic(using=connection.alias):
+        _rebuild(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote(f"{TABLE}_pkey")} PRIMARY KEY (id)')
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote(EMAIL_CONSTRAINT)} UNIQUE (email)')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {EMAIL_TRIGGER}()')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {REFERENCE_FUNCTION}()')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {REFERENCED_FUNCTION}()')
+        # named the way django names them, so later migrations find them
+        with connection.schema_editor(atomic=False) as editor:
+            for field in _references():
+                editor.execute(editor._create_fk_sql(field.model, field, '_fk_%(to_table)s_%(to_column)s'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {table}')
+
+
+def _reference_trigger(field):
+    return f'{field.model._meta.db_table}_{field.column}_employee_check'
+
+
+def install_partitioned_constraints(connection):
+    """
+    (idempotently) the triggers enforcing the unique email and the foreign
+    keys to the partitioned employee table
+    """
+    quote = connection.ops.quote_name
+    table = quote(TABLE)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {EMAIL_TRIGGER}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' AND NEW.email = OLD.email THEN
+                    RETURN NEW;
+                END IF;
+                -- held until commit, a concurrent insert of the same email sees this row
+                PERFORM pg_advisory_xact_lock({EMAIL_LOCK}, hashtext(NEW.email));
+                IF EXISTS (SELECT 1 FROM {table} WHERE email = NEW.email AND id <> NEW.id) THEN
+                    RAISE unique_violation
+                        USING MESSAGE = 'duplicate key value violates unique constraint "{EMAIL_CONSTRAINT}"',
+                              DETAIL = format('Key (email)=(%s) already exists.', NEW.email),
+                              CONSTRAINT = '{EMAIL_CONSTRAINT}';
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute(f'DROP TRIGGER IF EXISTS {EMAIL_TRIGGER} ON {table}')
+        cursor.execute(f"""
+            CREATE TRIGGER {EMAIL_TRIGGER} BEFORE INSERT OR UPDATE OF email ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {EMAIL_TRIGGER}()
+        """)
+
+        # TG_ARGV: the referencing column and primary key / the referencing table and column
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {REFERENCE_FUNCTION}() RETURNS trigger AS $$
+            DECLARE
+                employee_id bigint;
+            BEGIN
+                -- the value of the row at commit: deleted since (null) or updated since
+                -- (checked by the trigger of that update), like a foreign key would
+                EXECUTE format('SELECT %I FROM %I.%I WHERE %I = ($1).%I', TG_ARGV[0],
+                               TG_TABLE_SCHEMA, TG_TABLE_NAME, TG_ARGV[1], TG_ARGV[1])
+                    USING NEW INTO employee_id;
+                IF employee_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {table} WHERE id = employee_id) THEN
+                    RAISE foreign_key_violation
+                        USING MESSAGE = format('insert or update on table "%s" violates foreign key constraint "%s"',
+                                               TG_TABLE_NAME, TG_NAME),
+                              DETAIL = format('Key (%s)=(%s) is not present in table "{TABLE}".',
+                                              TG_ARGV[0], employee_id);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {REFERENCED_FUNCTION}() RETURNS trigger AS $$
+            DECLARE
+                referenced boolean;
+            BEGIN
+                -- a row moved to another partition (new company) keeps its id
+                IF EXISTS (SELECT 1 FROM {table} WHERE id = OLD.id) THEN
+                    RETURN NULL;
+                END IF;
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I = $1)', TG_ARGV[0], TG_ARGV[1])
+                    USING OLD.id INTO referenced;
+                IF referenced THEN
+                    RAISE foreign_key_violation
+                        USING MESSAGE = format('update or delete on table "{TABLE}" violates foreign key '
+                                               'constraint "%s" on table "%s"', TG_NAME, TG_ARGV[0]),
+                              DETAIL = format('Key (id)=(%s) is still referenced from table "%s".',
+                                              OLD.id, TG_ARGV[0]);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        for field in _references():
+            referencing = field.model._meta.db_table
+            trigger = _reference_trigger(field)
+            cursor.execute(f'DROP TRIGGER IF EXISTS {quote(trigger)} ON {quote(referencing)}')
+            cursor.execute(f"""
+                CREATE CONSTRAINT TRIGGER {quote(trigger)}
+                AFTER INSERT OR UPDATE OF {quote(field.column)} ON {quote(referencing)}
+                DEFERRABLE INITIALLY DEFERRED FOR EACH ROW
+                EXECUTE FUNCTION {REFERENCE_FUNCTION}(%s, %s)
+            """, [field.column, field.model._meta.pk.column])
+            referenced = f'{TABLE}_{referencing}_check'
+            cursor.execute(f'DROP TRIGGER IF EXISTS {quote(referenced)} ON {table}')
+            cursor.execute(f"""
+                CREATE CONSTRAINT TRIGGER {quote(referenced)} AFTER DELETE ON {table}
+                DEFERRABLE INITIALLY DEFERRED FOR EACH ROW
+                EXECUTE FUNCTION {REFERENCED_FUNCTION}(%s, %s)
+            """, [referencing, field.column])
+
+
+# list partitions
+
+def ensure_company_partition(connection, company_id):
+    """
+    creates the list partition of a company and moves its rows out of the
+    default partition, True when it was created. attached rather than
+    created as PARTITION OF: reads and writes of the other companies go on.
+    the default partition is only locked (SHARE, reads go on) when it has
+    rows of the company to move; the ATTACH itself still holds it for the
+    scan that proves none are left
+    """
+    quote = connection.ops.quote_name
+    table, default = quote(TABLE), quote(DEFAULT_PARTITION)
+    name = company_partition(company_id)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if _table_exists(cursor, name):
+            return False
+        cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {default} WHERE company_id = %s)', [company_id])
+        if cursor.fetchone()[0]:
+            # no rows of the company can be written to the default partition while they move
+            cursor.execute(f'LOCK TABLE {default} IN SHARE MODE')
+            cursor.execute(f'INSERT INTO {quote(name)} SELECT * FROM {default} WHERE company_id = %s',
+                           [company_id])
+            cursor.execute(f'DELETE FROM {default} WHERE company_id = %s', [company_id])
+        cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {quote(name)} FOR VALUES IN ({int(company_id)})')
+    return True
+
+
+def sync_company_partitions(connection):
+    """
+    creates the missing list partitions (companies created while the
+    partitioning was off, or whose partition creation failed), returns
+    the ids of their companies
+    """
+    from apps.companies.models import Company
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, [TABLE])
+        existing = {row[0] for row in cursor.fetchall()}
+    created = []
+    for company_id in Company._base_manager.using(connection.alias).order_by('pk').values_list('pk', flat=True):
+        if company_partition(company_id) not in existing and ensure_company_partition(connection, company_id):
+            created.append(company_id)
+    return created
+
+
+# company deletes
+
+def release_company_employees(company):
+    """
+    removes the employees of a company about to be deleted with set based
+    statements, before the deletion collector would load and delete them one
+    by one (partitioned table only): the list partition is dropped or
+    detached, a hash partition is emptied with one pruned DELETE.
+    the logins are unlinked and the provisioning outbox rows deleted first
+    (their on_delete). the per employee signals are skipped: the counters
+    and cached responses they keep belong to the company going away
+    """
+    if not partitioned():
+        return False
+    using = router.db_for_write(Employee, instance=company)
+    connection = connections[using]
+    strategy = partition_strategy(connection)
+    if strategy is None:
+        return False
+
+    references = _references()
+    if any(field.remote_field.on_delete not in (models.CASCADE, models.SET_NULL) for field in references):
+        # protected rows: left to the collector, which raises
+        return False
+
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=using):
+        for field in references:
+            dependents = field.model._base_manager.using(using).filter(
+                **{f'{field.name}__in': Employee._base_manager.using(using)
+                   .filter(company_id=company.pk).values('pk')}
+            )
+            if field.remote_field.on_delete is models.CASCADE:
+                dependents.delete()
+            else:
+                dependents.update(**{field.name: None})
+
+        with connection.cursor() as cursor:
+            name = company_partition(company.pk)
+            if strategy == 'list' and _table_exists(cursor, name):
+                cursor.execute(f'ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}')
+                if settings.EMPLOYEE_DELETED_PARTITIONS == 'detach':
+                    _archive(cursor, quote, name)
+                else:
+                    cursor.execute(f'DROP TABLE {quote(name)}')
+            else:
+                cursor.execute(f'DELETE FROM {quote(TABLE)} WHERE company_id = %s', [company.pk])
+    return True
+
+
+def _archive(cursor, quote, name):
+    """
+    a detached partition kept as a standalone table <partition>_deleted,
+    without the foreign keys (its company is gone) and the triggers
+    """
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'", [name])
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {quote(name)} DROP CONSTRAINT {quote(constraint)}')
+    cursor.execute('SELECT tgname FROM pg_trigger WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal', [name])
+    for (trigger,) in cursor.fetchall():
+        cursor.execute(f'DROP TRIGGER {quote(trigger)} ON {quote(name)}')
+    cursor.execute(f'ALTER TABLE {quote(name)} RENAME TO {quote(f"{name}_deleted")}')
@@ -0,0 +1,178 @@
+import logging
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
+from core.cache import bump_generation
+from .models import AccountStatus, Employee, UserProvisioning
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# temp password that can be changed by a super user inside the django admin panel
+TEMP_PASSWORD = 'ChangeMe123!'
+
+
+@lru_cache(maxsize=None)
+def temp_password_hash():
+    """
+    the temp password is the same for every new account so it is hashed
+    once per process instead of once per user (PBKDF2 is the dominant cost)
+    """
+    return make_password(TEMP_PASSWORD)
+
+
+def employee_user_fields(name, email, employee_id=None):
+    """
+    field values of the login created for an employee
+    (username from the email, first / last name split from the full name)
+    """
+    names = name.split() if name else []
+    return {
+        'employee_id': employee_id,
+        'username': email.split('@')[0],
+        'email': email,
+        'password': temp_password_hash(),
+        'first_name': names[0] if names else '',
+        'last_name': ' '.join(names[1:]),
+        'role': 'EMPLOYEE',
+        'is_active': True,
+    }
+
+
+def provision_pending(batch_size=100):
+    """
+    drains one batch of the provisioning outbox in a single transaction.
+    rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED so several
+    workers can run side by side. a batch that fails (a concurrent login
+    took a username, a deadlock) is provisioned again one task at a time,
+    a task that still fails is retried later (retry_later).
+    returns (provisioned, failed)
+    """
+    with transaction.atomic():
+        tasks = list(
+            UserProvisioning.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(state=UserProvisioning.State.PENDING)
+            .filter(Q(retry_at__isnull=True) | Q(retry_at__lte=timezone.now()))
+            .select_related('employee')
+            .order_by('id')[:batch_size]
+        )
+        if not tasks:
+            return 0, 0
+        try:
+            with transaction.atomic():
+                return _provision(tasks)
+        except (IntegrityError, OperationalError) as error:
+            if len(tasks) == 1:
+                return 0, retry_later(tasks, error)
+            logger.warning('provisioning a batch of %s tasks failed (%s), retrying them one by one',
+                           len(tasks), error)
+
+        provisioned = failed = 0
+        for task in tasks:
+            try:
+                with transaction.atomic():
+                    done, gave_up = _provision([task])
+            except (IntegrityError, OperationalError) as error:
+                done, gave_up = 0, retry_later([task], error)
+            provisioned += done
+            failed += gave_up
+    return provisioned, failed
+
+
+def _provision(tasks):
+    emails = {task.employee.email for task in tasks}
+    usernames = {email.split('@')[0] for email in emails}
+    # the employee of the login with each email (None: a login of its own, registered
+    # before the worker ran, it is never handed the employee record)
+    existing_emails = dict(User.objects.filter(email__in=emails).values_list('email', 'employee_id'))
+    taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+    users, done, email_taken, username_taken = [], [], [], []
+    for task in tasks:
+        fields = employee_user_fields(task.employee.name, task.employee.email, task.employee_id)
+        if fields['email'] in existing_emails:
+            if existing_emails[fields['email']] == task.employee_id:
+                done.append(task)  # this employee's login exists already
+            else:
+                email_taken.append(task)
+        elif fields['username'] in taken_usernames:
+            username_taken.append(task)
+        else:
+            users.append(User(**fields))
+            existing_emails[fields['email']] = task.employee_id
+            taken_usernames.add(fields['username'])
+            done.append(task)
+
+    User.objects.bulk_create(users)  # created linked to their employee (employee_id)
+    now = timezone.now()
+    _finish(done, UserProvisioning.State.DONE, AccountStatus.PROVISIONED, now)
+    _finish(email_taken, UserProvisioning.State.FAILED, AccountStatus.FAILED, now,
+            error='a user with this email is already registered')
+    _finish(username_taken, UserProvisioning.State.FAILED, AccountStatus.FAILED, now,
+            error='a user with this username already exists')
+    return len(done), len(email_taken) + len(username_taken)
+
+
+def retry_later(tasks, error):
+    """
+    records a failed attempt of tasks (in the transaction that claimed
+    them, once the failed savepoint is rolled back): pending again after an
+    exponential backoff, FAILED after PROVISIONING_MAX_ATTEMPTS.
+    returns the number of tasks given up
+    """
+    logger.warning('provisioning %s task(s) failed: %s', len(tasks), error)
+    error = str(error)
+    now = timezone.now()
+    given_up = []
+    for task in tasks:
+        attempts = task.attempts + 1
+        if attempts >= settings.PROVISIONING_MAX_ATTEMPTS:
+            given_up.append(task)
+            continue
+        delay = settings.PROVISIONING_RETRY_SECONDS * 2 ** (attempts - 1)
+        UserProvisioning.objects.filter(pk=task.pk).update(
+            attempts=attempts, processed_at=now, last_error=error, retry_at=now + timedelta(seconds=delay)
+        )
+    _finish(given_up, UserProvisioning.State.FAILED, AccountStatus.FAILED, now, error=error)
+    return len(given_up)
+
+
+def link_employee_logins(emails=None):
+    """
+    points the logins without an employee link at the employee with the
+    same email (one UPDATE): the backfill of the rows created before the
+    link existed (fixtures, older installs). an explicit admin step
+    (run_provisioning_worker --link-logins): anyone can register a login
+    with the email of an employee, the worker never links by email.
+    returns the number of linked logins
+    """
+    from apps.accounts.cache import invalidate_profile
+
+    employees = Employee.objects.filter(email=OuterRef('email'))
+    users = User.objects.filter(employee__isnull=True).filter(Exists(employees))
+    if emails is not None:
+        users = users.filter(email__in=emails)
+    user_ids = list(users.values_list('pk', flat=True))
+    if not user_ids:
+        return 0
+    User.objects.filter(pk__in=user_ids).update(employee=Subquery(employees.values('pk')[:1]))
+    transaction.on_commit(lambda: invalidate_profile(*user_ids))
+    return len(user_ids)
+
+
+def _finish(tasks, state, account_status, now, error=''):
+    if not tasks:
+        return
+    UserProvisioning.objects.filter(pk__in=[task.pk for task in tasks]).update(
+        state=state, attempts=F('attempts') + 1, processed_at=now, last_error=error
+    )
+    Employee.objects.filter(pk__in=[task.employee_id for task in tasks]).update(
+        account_status=account_status, updated_at=now
+    )
+    bump_generation(*{task.employee.company_id for task in tasks})
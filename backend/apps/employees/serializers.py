@@ -1,14 +1,25 @@
 from rest_framework import serializers
 from django.utils import timezone
 from .models import Employee, EmployeeStatus
+from .operations import OPERATIONS
+from apps.companies.models import Company
+from apps.departments.models import Department
+from core.relations import LoadedPrimaryKeyRelatedField
+from core.serializers import SparseFieldsMixin
 from apps.companies.serializers import CompanySerializer
 from apps.departments.serializers import DepartmentSerializer
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     this is the main employee serializer with nested company and
     department details
+    ?fields= / ?expand=company_details,department_details.company_details
+    for sparse responses
     """
+    # the rows loaded by get_object are reused, a new department comes with its
+    # company (department_details renders it)
+    company = LoadedPrimaryKeyRelatedField(queryset=Company.objects.all())
+    department = LoadedPrimaryKeyRelatedField(queryset=Department.objects.select_related('company'))
     company_details = CompanySerializer(source='company', read_only=True)
     department_details = DepartmentSerializer(source='department', read_only=True)
     days_employed = serializers.IntegerField(read_only=True)
@@ -20,10 +31,12 @@ class EmployeeSerializer(serializers.ModelSerializer):
             'department', 'department_details',
             'name', 'email', 'mobile_number',
             'address', 'designation', 'status',
-            'hired_on', 'days_employed',
+            'hired_on', 'days_employed', 'account_status',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id','hired_on','created_at', 'updated_at']
+        read_only_fields = ['id','hired_on','account_status','created_at', 'updated_at']
+        expandable_fields = ['company_details', 'department_details']
+        field_dependencies = {'days_employed': ('status', 'hired_on')}
 
         def validate(self, data):
             """
@@ -49,18 +62,52 @@ class EmployeeSerializer(serializers.ModelSerializer):
                     })
             return data
 
-class EmployeeListSerializer(serializers.ModelSerializer):
+class DepartmentEmployeeSerializer(EmployeeSerializer):
+    """
+    employee rows of a department listing: the shared company and department
+    are serialized once next to the rows instead of nested in every row
+    """
+    company_details = None
+    department_details = None
+
+    class Meta(EmployeeSerializer.Meta):
+        fields = [
+            field for field in EmployeeSerializer.Meta.fields
+            if field not in ('company_details', 'department_details')
+        ]
+
+class EmployeeListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     simplified serializer for list views
     """
     department_name = serializers.CharField(source='department.name', read_only=True)
     company_name = serializers.CharField(source='company.name', read_only=True)
+    days_employed = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Employee
         fields = [
             'id', 'name', 'email', 'designation','mobile_number',
-            'status', 'department_name', 'company_name'
+            'status', 'hired_on', 'days_employed', 'account_status',
+            'company', 'company_name', 'department', 'department_name'
+        ]
+        field_dependencies = {'days_employed': ('status', 'hired_on')}
+
+class EmployeeProfileSerializer(serializers.ModelSerializer):
+    """
+    employee profile of the logged in user (/auth/me/), flat company /
+    department names instead of the nested serializers and their counts
+    """
+    company_name = serializers.CharField(source='company.name', read_only=True)
+    department_name = serializers.CharField(source='department.name', read_only=True)
+    days_employed = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Employee
+        fields = [
+            'id', 'name', 'email', 'mobile_number', 'address', 'designation',
+            'status', 'hired_on', 'days_employed', 'account_status',
+            'company', 'company_name', 'department', 'department_name'
         ]
 
 class HiredEmployeeReportSerializer(serializers.ModelSerializer):
@@ -77,3 +124,21 @@ class HiredEmployeeReportSerializer(serializers.ModelSerializer):
             'hired_on', 'days_employed', 'company_name',
             'department_name'
         ]
+
+class BulkOperationSerializer(serializers.Serializer):
+    """
+    payload of the bulk endpoint: the operation, its argument and
+    optionally the ids it is limited to
+    """
+    operation = serializers.ChoiceField(choices=OPERATIONS)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False,
+                                allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=EmployeeStatus.choices, required=False)
+    department = serializers.PrimaryKeyRelatedField(queryset=Department.objects.all(), required=False)
+
+    def validate(self, data):
+        if data['operation'] == 'transition' and 'status' not in data:
+            raise serializers.ValidationError({'status': 'new status is required'})
+        if data['operation'] == 'move' and 'department' not in data:
+            raise serializers.ValidationError({'department': 'target department is required'})
+        return data
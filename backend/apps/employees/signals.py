@@ -1,45 +1,141 @@
-from django.db.models.signals import pre_save, post_save
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from .models import Employee
+from apps.companies.counters import adjust_employee_count
+from apps.companies.models import Company
+from core.cache import bump_generation
+from core.search import install_search_support
+from .models import Employee, UserProvisioning
+from .partitioning import (
+    ensure_company_partition, install_partitioned_constraints, partition, partition_strategy,
+    sync_company_partitions,
+)
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# set while a bulk operation adjusts the counters and caches itself, once per set
+_bulk_operation = ContextVar('employee_bulk_operation', default=False)
+
+@contextmanager
+def bulk_operation():
+    """mutes the per row counter / cache receivers (apps.employees.operations)"""
+    token = _bulk_operation.set(True)
+    try:
+        yield
+    finally:
+        _bulk_operation.reset(token)
+
+def in_bulk_operation():
+    """True inside bulk_operation() (for the receivers of other apps)"""
+    return _bulk_operation.get()
+
 @receiver(pre_save, sender=Employee)
 def validate_employee_email(sender, instance, raw=False, **kwargs):
     """Ensure email is not already taken in User model"""
     if raw:  # this if condition is to skip validation during fixture loading for testing
         return
-        
+
+    # If this is an update and the email did not change it belongs to this employee's user, allow it
+    if not instance._state.adding and instance.email == instance._original_email:
+        return
     if User.objects.filter(email=instance.email).exists():
-        # If this is an update and the email belongs to this employee's user, allow it
-        try:
-            current_employee = Employee.objects.get(pk=instance.pk)
-            if current_employee.email == instance.email:
-                return
-        except Employee.DoesNotExist:
-            pass
         raise ValidationError("This email is already registered in the system.")
 
 @receiver(post_save, sender=Employee)
 def create_user_for_employee(sender, instance, created, raw=False, **kwargs):
-    """Create a User instance for new employees"""
+    """
+    queue the User creation of new employees in the provisioning outbox.
+    the row is written in the same transaction as the employee, the
+    run_provisioning_worker command creates the accounts in batches
+    """
     if raw:  # Skip user creation during fixture loading
         return
-        
-    if created:  # Only when the employee is first created from django admin panel
-        # Generate a username from email (before @)
-        username = instance.email.split('@')[0]
-        
-        # Create user with a random password that must be changed on first login
-        user = User.objects.create_user(
-            username=username,
-            email=instance.email,
-            password='ChangeMe123!',  # temp password that can be changed by a super user inside the django admin panel
-            first_name=instance.name.split()[0] if instance.name else '',
-            last_name=' '.join(instance.name.split()[1:]) if instance.name and len(instance.name.split()) > 1 else '',
-            role='EMPLOYEE'
-        )
-        user.is_active = True
-        user.save()
+
+    if created:  # Only when the employee is first created
+        UserProvisioning.objects.create(employee=instance)
+
+@receiver(post_save, sender=Employee)
+def update_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    """keep company / department employee counters in sync on create and move"""
+    if raw:
+        return
+
+    if created:
+        adjust_employee_count(instance.company_id, instance.department_id, 1)
+    else:
+        if instance._original_company_id != instance.company_id:
+            adjust_employee_count(company_id=instance._original_company_id, delta=-1)
+            adjust_employee_count(company_id=instance.company_id, delta=1)
+        if instance._original_department_id != instance.department_id:
+            adjust_employee_count(department_id=instance._original_department_id, delta=-1)
+            adjust_employee_count(department_id=instance.department_id, delta=1)
+
+@receiver(post_delete, sender=Employee)
+def update_counts_on_delete(sender, instance, **kwargs):
+    """decrement company / department employee counters"""
+    if _bulk_operation.get():
+        return
+    adjust_employee_count(instance.company_id, instance.department_id, -1)
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def invalidate_cached_responses(sender, instance, raw=False, **kwargs):
+    """employee writes change the cached company / department responses"""
+    if raw or _bulk_operation.get():
+        return
+    bump_generation(instance.company_id, instance._original_company_id)
+
+def install_employee_search(sender, using, **kwargs):
+    """search vector trigger and trigram indexes of the employee table (post_migrate)"""
+    from django.db import connections
+    install_search_support(
+        connections[using], Employee,
+        weighted_columns={'name': 'A', 'designation': 'B', 'email': 'C'},
+        trigram_columns=['name', 'email', 'designation'],
+    )
+
+def partition_employee_table(sender, using, **kwargs):
+    """
+    converts the employee table when EMPLOYEE_PARTITIONING asks for it and it
+    is not partitioned yet (post_migrate, after install_employee_search).
+    a table partitioned the other way is left to partition_employees --revert
+    """
+    strategy = settings.EMPLOYEE_PARTITIONING
+    connection = connections[using]
+    if not strategy or connection.vendor != 'postgresql':
+        return
+    current = partition_strategy(connection)
+    if current is None:
+        partition(connection, strategy)
+        return
+    install_partitioned_constraints(connection)
+    if current == 'list':
+        sync_company_partitions(connection)
+
+@receiver(post_save, sender=Company)
+def create_company_partition(sender, instance, created, using=None, **kwargs):
+    """
+    the list partition of a new company, created once the company is committed.
+    until then (or if it fails) its employees go to the default partition
+    """
+    if not created or settings.EMPLOYEE_PARTITIONING != 'list':
+        return
+    connection = connections[using]
+
+    def create():
+        try:
+            if partition_strategy(connection) == 'list':
+                ensure_company_partition(connection, instance.pk)
+        except DatabaseError:
+            # partition_employees --sync creates it later
+            logger.exception('could not create the employee partition of company %s', instance.pk)
+
+    transaction.on_commit(create, using=using)
@@ -1,3 +1,935 @@
-from django.test import TestCase
+import io
+import json
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.changes.models import Change, ChangeAction
+from apps.companies.models import Company
+from apps.departments.models import Department
+from core.dbrouter import PIN_HEADER, ReplicaRouter
+from core.instrumentation import QueryBudgetExceeded
+from core.testing import (bearer_headers, create_admin, create_departments, create_employee, employee_fields,
+                          enforce_query_budgets)
+from .exports import HIRED_REPORT_COLUMNS
+from .generator import OrgGenerator
+from .importers import EmployeeImporter
+from .models import AccountStatus, Employee, EmployeeStatus, UserProvisioning
+from .partitioning import (DEFAULT_PARTITION, company_partition, ensure_company_partition, partition,
+                           partition_strategy)
+from .provisioning import provision_pending
+from .views import EmployeeViewSet
 
-# Create your tests here.
+User = get_user_model()
+
+
+class EmployeeWriteQueryBudgetTests(TestCase):
+    """
+    the single employee write path runs a fixed number of queries,
+    whatever the size of the tables
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        cls.department, cls.other_department = create_departments('Engineering', 'Sales')
+        cls.company = cls.department.company
+        [cls.foreign_department] = create_departments('Legal', company='Globex')
+        cls.employee = create_employee(cls.department, name='Jane Doe', email='jane@example.com',
+                                       status=EmployeeStatus.INTERVIEW_SCHEDULED)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = f'/api/v1/employees/{self.employee.pk}/'
+
+    def payload(self, **changes):
+        data = {
+            'company': self.company.pk,
+            'department': self.department.pk,
+            'name': 'Jane Doe',
+            'email': 'jane@example.com',
+            'mobile_number': '+123456789',
+            'address': '1 main st',
+            'designation': 'engineer',
+            'status': EmployeeStatus.INTERVIEW_SCHEDULED,
+        }
+        data.update(changes)
+        return data
+
+    def test_create_budget(self):
+        # company, department (+ its company), email unique (serializer), email
+        # unique (model), email taken by a user, insert, provisioning outbox,
+        # company and department counters, change outbox
+        with self.assertNumQueries(10):
+            response = self.client.post('/api/v1/employees/', self.payload(email='john@example.com'),
+                                        format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['department_details']['company_details']['name'], 'Acme')
+
+    def test_partial_update_budget(self):
+        # get_object, update, change outbox
+        with self.assertNumQueries(3):
+            response = self.client.patch(self.url, {'designation': 'lead'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['designation'], 'lead')
+
+    def test_full_update_budget(self):
+        # get_object, email unique (serializer), update, change outbox
+        with self.assertNumQueries(4):
+            response = self.client.put(self.url, self.payload(name='Jane Roe'), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Jane Roe')
+
+    def test_move_budget(self):
+        # get_object, new department (+ its company), update, counters of
+        # the old and the new department, change outbox
+        with self.assertNumQueries(6):
+            response = self.client.patch(self.url, {'department': self.other_department.pk},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['department_details']['name'], 'Sales')
+
+    def test_email_change_budget(self):
+        # get_object, email unique (serializer), email unique (model),
+        # email taken by a user, update, change outbox
+        with self.assertNumQueries(6):
+            response = self.client.patch(self.url, {'email': 'jane.doe@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_transition_budget(self):
+        # get_object, update, change outbox
+        with self.assertNumQueries(3):
+            response = self.client.post(f'{self.url}transition/', {'status': EmployeeStatus.HIRED},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['hired_on'])
+
+
+class EmployeeValidationTests(TestCase):
+    """
+    the checks skipped by the query budget still hold when they matter
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [cls.department] = create_departments()
+        [cls.foreign_department] = create_departments('Legal', company='Globex')
+        cls.employee = create_employee(cls.department, name='Jane Doe', email='jane@example.com')
+
+    def test_department_must_belong_to_company(self):
+        self.employee.department = self.foreign_department
+        with self.assertRaises(ValidationError):
+            self.employee.save()
+
+    def test_changed_email_must_be_unique(self):
+        other = create_employee(self.department, name='John Doe', email='john@example.com')
+        other.email = 'jane@example.com'
+        with self.assertRaises(ValidationError):
+            other.save()
+
+    def test_email_of_a_user_is_rejected(self):
+        User.objects.create_user(username='taken', email='taken@example.com', password='x')
+        self.employee.email = 'taken@example.com'
+        with self.assertRaises(ValidationError):
+            self.employee.save()
+
+    def test_unchanged_email_of_own_user_is_accepted(self):
+        User.objects.create_user(username='jane', email='jane@example.com', password='x')
+        self.employee.designation = 'lead'
+        self.employee.save()
+
+
+@enforce_query_budgets
+class EmployeeReadQueryBudgetTests(TestCase):
+    """
+    the employee read actions stay within their declared @query_budget
+    whatever the number of rows
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        departments = create_departments('Engineering', 'Sales', 'Legal')
+        for number in range(30):
+            create_employee(departments[number % 3], number,
+                            status=EmployeeStatus.HIRED if number % 2 else EmployeeStatus.INTERVIEW_SCHEDULED)
+        cls.employee = Employee.objects.filter(status=EmployeeStatus.INTERVIEW_SCHEDULED).first()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_list(self):
+        self.assertEqual(self.client.get('/api/v1/employees/').status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/employees/?page_size=10&search=employee').status_code, 200)
+
+    def test_retrieve(self):
+        self.assertEqual(self.client.get(f'/api/v1/employees/{self.employee.pk}/').status_code, 200)
+
+    def test_hired_report(self):
+        self.assertEqual(self.client.get('/api/v1/employees/hired_report/').status_code, 200)
+
+    def test_transition(self):
+        response = self.client.post(f'/api/v1/employees/{self.employee.pk}/transition/',
+                                    {'status': EmployeeStatus.HIRED}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_exceeded_budget_fails(self):
+        with mock.patch.object(EmployeeViewSet.retrieve, 'query_budget', 0):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(f'/api/v1/employees/{self.employee.pk}/')
+
+
+class DaysEmployedTests(TestCase):
+    """
+    days employed is computed by the database and can be filtered / ordered on
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        [department] = create_departments()
+        now = timezone.now()
+        cls.tenures = {}
+        for number, days in enumerate((10, 364, 365, 366, 800)):
+            employee = create_employee(department, number, status=EmployeeStatus.HIRED,
+                                       hired_on=now - timedelta(days=days, hours=1))
+            cls.tenures[employee.pk] = days
+        cls.candidate = create_employee(department, name='Candidate', email='candidate@example.com',
+                                        status=EmployeeStatus.INTERVIEW_SCHEDULED)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def days(self, response):
+        return [row['days_employed'] for row in response.data]
+
+    def test_annotation_matches_property(self):
+        for employee in Employee.objects.with_days_employed():
+            del employee.__dict__['_days_employed']
+            annotated = Employee.objects.with_days_employed().get(pk=employee.pk).days_employed
+            self.assertEqual(annotated, employee.days_employed)
+            self.assertEqual(annotated, self.tenures.get(employee.pk))
+
+    def test_range_filters(self):
+        response = self.client.get('/api/v1/employees/?min_days_employed=365')
+        self.assertEqual(sorted(self.days(response)), [365, 366, 800])
+        response = self.client.get('/api/v1/employees/?max_days_employed=365')
+        self.assertEqual(sorted(self.days(response)), [10, 364, 365])
+        response = self.client.get('/api/v1/employees/?min_days_employed=364&max_days_employed=366')
+        self.assertEqual(sorted(self.days(response)), [364, 365, 366])
+        self.assertEqual(self.client.get('/api/v1/employees/?min_days_employed=-1').status_code, 400)
+
+    def test_ordering(self):
+        response = self.client.get('/api/v1/employees/?ordering=days_employed')
+        self.assertEqual(self.days(response), [10, 364, 365, 366, 800])
+        response = self.client.get('/api/v1/employees/?ordering=-days_employed')
+        self.assertEqual(self.days(response), [800, 366, 365, 364, 10])
+
+    def test_ordering_pages(self):
+        days, url = [], '/api/v1/employees/?ordering=-days_employed&page_size=2'
+        while url:
+            response = self.client.get(url)
+            days += [row['days_employed'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(days, [800, 366, 365, 364, 10])
+
+    def test_transition_refreshes_days_employed(self):
+        response = self.client.post(f'/api/v1/employees/{self.candidate.pk}/transition/',
+                                    {'status': EmployeeStatus.HIRED}, format='json')
+        self.assertEqual(response.data['days_employed'], 0)
+
+
+# gather() threads and replica connections would not see the test transaction
+@override_settings(ASYNC_CONCURRENT_QUERIES=False, DATABASE_REPLICAS=[])
+class BulkOperationTests(TestCase):
+    """
+    the set-based operations (POST /api/v1/employees/bulk/) apply the
+    workflow to every targeted row and report the ones they skipped
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        cls.engineering, cls.research = create_departments('Engineering', 'Research')
+        [cls.sales] = create_departments('Sales', company='Globex')
+        cls.company, cls.other = cls.engineering.company, cls.sales.company
+        statuses = [EmployeeStatus.APPLICATION_RECEIVED, EmployeeStatus.INTERVIEW_SCHEDULED,
+                    EmployeeStatus.INTERVIEW_SCHEDULED, EmployeeStatus.HIRED]
+        cls.received, cls.scheduled, cls.other_scheduled, cls.hired = [
+            create_employee(cls.engineering, number, status=status) for number, status in enumerate(statuses)]
+        cls.foreign = create_employee(cls.sales, 4, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def bulk(self, query='', **payload):
+        response = self.client.post(f'/api/v1/employees/bulk/{query}', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def counts(self, *objects):
+        return [type(obj).objects.get(pk=obj.pk).employee_count for obj in objects]
+
+    def test_transition_reports_applied_and_rejected(self):
+        ids = [self.received.pk, self.scheduled.pk, self.hired.pk, self.foreign.pk, 999999]
+        result = self.bulk(f'?company={self.company.pk}', operation='transition',
+                           status=EmployeeStatus.HIRED, ids=ids)
+        self.assertEqual(result['applied'], [self.scheduled.pk])
+        self.assertEqual(result['rejected'], [
+            {'id': self.received.pk, 'reason': 'invalid transition status from APPLICATION_RECEIVED to HIRED'},
+            {'id': self.hired.pk, 'reason': 'invalid transition status from HIRED to HIRED'},
+            {'id': self.foreign.pk, 'reason': 'employee not found or filtered out'},
+            {'id': 999999, 'reason': 'employee not found or filtered out'},
+        ])
+        statuses = dict(Employee.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[self.scheduled.pk], EmployeeStatus.HIRED)
+        self.assertEqual(statuses[self.received.pk], EmployeeStatus.APPLICATION_RECEIVED)
+        self.assertEqual(statuses[self.foreign.pk], EmployeeStatus.INTERVIEW_SCHEDULED)
+
+    def test_transition_sets_hired_on(self):
+        before = timezone.now()
+        self.bulk(f'?status={EmployeeStatus.INTERVIEW_SCHEDULED}&company={self.company.pk}',
+                  operation='transition', status=EmployeeStatus.HIRED)
+        for employee in Employee.objects.filter(pk__in=[self.scheduled.pk, self.other_scheduled.pk]):
+            self.assertEqual(employee.status, EmployeeStatus.HIRED)
+            self.assertGreaterEqual(employee.hired_on, before)
+        result = self.bulk(operation='transition', status=EmployeeStatus.NOT_ACCEPTED,
+                           ids=[self.received.pk, self.foreign.pk])
+        self.assertEqual(result['applied'], [self.received.pk, self.foreign.pk])
+        self.assertEqual(set(Employee.objects.filter(pk__in=result['applied']).values_list('hired_on', flat=True)),
+                         {None})
+
+    def test_move_adjusts_the_counters(self):
+        self.assertEqual(self.counts(self.company, self.other, self.engineering, self.sales), [4, 1, 4, 1])
+        result = self.bulk(operation='move', department=self.sales.pk, ids=[self.received.pk, self.foreign.pk])
+        self.assertEqual(result['applied'], [self.received.pk])
+        self.assertEqual(result['rejected'], [{'id': self.foreign.pk, 'reason': 'employee is already in this department'}])
+        self.assertEqual(Employee.objects.get(pk=self.received.pk).company_id, self.other.pk)
+        self.assertEqual(self.counts(self.company, self.other, self.engineering, self.sales), [3, 2, 3, 2])
+        # transitions leave them alone
+        self.bulk(operation='transition', status=EmployeeStatus.HIRED, ids=[self.scheduled.pk])
+        self.assertEqual(self.counts(self.company, self.other, self.engineering, self.sales), [3, 2, 3, 2])
+
+    def test_delete(self):
+        result = self.bulk(f'?company={self.company.pk}', operation='delete', ids=[self.hired.pk, self.foreign.pk])
+        self.assertEqual(result['applied'], [self.hired.pk])
+        self.assertEqual(result['rejected'], [{'id': self.foreign.pk, 'reason': 'employee not found or filtered out'}])
+        self.assertFalse(Employee.objects.filter(pk=self.hired.pk).exists())
+        self.assertTrue(Employee.objects.filter(pk=self.foreign.pk).exists())
+        self.assertEqual(self.counts(self.company, self.other, self.engineering, self.sales), [3, 1, 3, 1])
+
+    def test_targets_are_required(self):
+        response = self.client.post('/api/v1/employees/bulk/', {'operation': 'delete'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Employee.objects.count(), 5)
+
+
+class EmployeeImportTests(TestCase):
+    """
+    the bulk import (apps.employees.importers) validates set-wise and inserts
+    with COPY, one transaction per batch
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        cls.engineering, cls.research = create_departments('Engineering', 'Research')
+        [cls.sales] = create_departments('Sales', company='Globex')
+        cls.company = cls.engineering.company
+        cls.existing = create_employee(cls.engineering, 1)
+
+    def row(self, number, department=None, **fields):
+        department = department or self.engineering
+        return employee_fields(number, company=department.company_id, department=department.pk, **fields)
+
+    def run_import(self, rows, **options):
+        return EmployeeImporter(**options).run(enumerate(rows, 1))
+
+    def errors(self, report):
+        return {error['row']: error['errors'] for error in report['errors']}
+
+    def test_validation_errors(self):
+        report = self.run_import([
+            self.row(2, email='not an email'),
+            self.row(3, status='RETIRED'),
+            {**self.row(4), 'department': None},
+            {**self.row(5), 'company': self.sales.company_id},
+            {**self.row(6), 'department': 999999},
+            'invalid json',
+            self.row(7),
+        ])
+        self.assertEqual((report['valid'], report['created'], report['failed']), (1, 1, 6))
+        errors = self.errors(report)
+        self.assertEqual(set(errors), {1, 2, 3, 4, 5, 6})
+        self.assertIn('email', errors[1])
+        self.assertIn('status', errors[2])
+        self.assertEqual(errors[3], {'department': ['department is required']})
+        self.assertEqual(errors[4], {'department': ['selected department does not belong to this company']})
+        self.assertEqual(errors[5], {'department': ['department does not exist']})
+        self.assertEqual(errors[6], {'row': ['invalid json']})
+        self.assertTrue(Employee.objects.filter(email='employee7@example.com').exists())
+
+    def test_duplicate_emails(self):
+        get_user_model().objects.create_user(username='taken', email='taken@example.com', password='x')
+        report = self.run_import([
+            self.row(2),
+            self.row(3, email='employee2@example.com'),  # the file itself
+            self.row(4, email=self.existing.email),  # an employee
+            self.row(5, email='taken@example.com'),  # a user
+            self.row(6, email='taken@elsewhere.com'),  # a username
+        ])
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(self.errors(report), {
+            2: {'email': ['This email is already registered in the system.']},
+            3: {'email': ['This email is already registered in the system.']},
+            4: {'email': ['This email is already registered in the system.']},
+            5: {'email': ['a user with this username already exists.']},
+        })
+
+    def test_conflicting_batch_is_rejected(self):
+        # a concurrent write took an email after the batch was validated
+        rows = [self.row(2), self.row(3, email=self.existing.email), self.row(4), self.row(5)]
+        load_indexes = EmployeeImporter._load_indexes
+
+        def unaware_of_the_emails(importer, batch):
+            load_indexes(importer, batch)
+            return set(), set()
+        with mock.patch.object(EmployeeImporter, '_load_indexes', unaware_of_the_emails):
+            report = self.run_import(rows, batch_size=2)
+        self.assertEqual((report['valid'], report['created'], report['failed']), (2, 2, 2))
+        self.assertEqual(self.errors(report), {
+            1: {'row': ['conflicting concurrent write, retry this row']},
+            2: {'row': ['conflicting concurrent write, retry this row']},
+        })
+        self.assertEqual(set(Employee.objects.values_list('email', flat=True)),
+                         {self.existing.email, 'employee4@example.com', 'employee5@example.com'})
+
+    def test_counters_accounts_and_changes(self):
+        Change.objects.all().delete()
+        report = self.run_import([self.row(2, status=EmployeeStatus.HIRED), self.row(3, self.research),
+                                  self.row(4, self.sales)])
+        self.assertEqual(report['created'], 3)
+        self.company.refresh_from_db()
+        self.engineering.refresh_from_db()
+        self.research.refresh_from_db()
+        self.assertEqual((self.company.employee_count, self.engineering.employee_count,
+                          self.research.employee_count), (3, 2, 1))
+        self.assertEqual(Company.objects.get(pk=self.sales.company_id).employee_count, 1)
+        hired = Employee.objects.get(email='employee2@example.com')
+        self.assertIsNotNone(hired.hired_on)
+        self.assertEqual(hired.account_status, AccountStatus.PROVISIONED)
+        self.assertEqual(get_user_model().objects.get(email=hired.email).employee_id, hired.pk)
+        self.assertEqual(sorted(Change.objects.values_list('object_id', 'action')),
+                         [(pk, ChangeAction.CREATED) for pk in sorted(
+                             Employee.objects.exclude(pk=self.existing.pk).values_list('pk', flat=True))])
+
+    def test_text_is_never_read_as_null(self):
+        # COPY used to take a literal \N for its NULL marker
+        self.run_import([self.row(2, address='\\N', designation='say "hi", twice')])
+        employee = Employee.objects.get(email='employee2@example.com')
+        self.assertEqual((employee.address, employee.designation), ('\\N', 'say "hi", twice'))
+
+    def test_upload(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        header = 'name,email,mobile_number,address,designation,status,company,department'
+        line = f'Employee 2,employee2@example.com,+123456789,1 main st,engineer,,{self.company.pk},{self.engineering.pk}'
+        upload = SimpleUploadedFile('employees.csv', f'{header}\n{line}\n'.encode(), content_type='text/csv')
+        response = client.post('/api/v1/employees/bulk_import/?dry_run=true', {'file': upload})
+        self.assertEqual((response.status_code, response.data['valid'], response.data['created']), (200, 1, 0))
+        upload.seek(0)
+        response = client.post('/api/v1/employees/bulk_import/', {'file': upload})
+        self.assertEqual((response.status_code, response.data['created']), (201, 1))
+        self.assertEqual(Employee.objects.get(email='employee2@example.com').status,
+                         EmployeeStatus.APPLICATION_RECEIVED)
+
+
+class ProvisioningTests(TestCase):
+    """
+    the provisioning outbox is drained in batches, a task that fails is
+    retried after a backoff and given up after PROVISIONING_MAX_ATTEMPTS
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [cls.department] = create_departments()
+        cls.employees = [create_employee(cls.department, number) for number in range(3)]
+
+    def states(self):
+        return list(UserProvisioning.objects.order_by('employee_id').values_list('state', 'attempts'))
+
+    def failing_for(self, email):
+        """
+        bulk_create of the logins raising IntegrityError for the batches that hold email
+        """
+        bulk_create = User.objects.bulk_create
+
+        def create(users, *args, **kwargs):
+            if any(user.email == email for user in users):
+                raise IntegrityError('duplicate key value violates unique constraint')
+            return bulk_create(users, *args, **kwargs)
+        return mock.patch.object(User.objects, 'bulk_create', create)
+
+    def test_batches(self):
+        self.assertEqual(provision_pending(batch_size=2), (2, 0))
+        self.assertEqual(provision_pending(batch_size=2), (1, 0))
+        self.assertEqual(provision_pending(batch_size=2), (0, 0))
+        self.assertEqual(self.states(), [(UserProvisioning.State.DONE, 1)] * 3)
+        for employee in Employee.objects.all():
+            self.assertEqual(employee.account_status, AccountStatus.PROVISIONED)
+            self.assertEqual(User.objects.get(email=employee.email).employee_id, employee.pk)
+
+    def test_email_registered_by_someone_else(self):
+        """
+        a login registered with the email of an employee before the worker
+        ran is not taken for theirs
+        """
+        employee = self.employees[0]
+        response = self.client.post('/api/v1/auth/register/', {
+            'username': 'mallory', 'email': employee.email, 'password': 'x', 'role': 'EMPLOYEE',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(provision_pending(), (2, 1))
+        task = UserProvisioning.objects.get(employee=employee)
+        self.assertEqual((task.state, task.last_error),
+                         (UserProvisioning.State.FAILED, 'a user with this email is already registered'))
+        self.assertEqual(Employee.objects.get(pk=employee.pk).account_status, AccountStatus.FAILED)
+        self.assertEqual(list(User.objects.filter(email=employee.email).values_list('username', flat=True)),
+                         ['mallory'])
+
+    @override_settings(PROVISIONING_MAX_ATTEMPTS=2, PROVISIONING_RETRY_SECONDS=60)
+    def test_failed_task_is_retried_then_given_up(self):
+        poisoned = self.employees[1]
+        with self.failing_for(poisoned.email):
+            # the rest of the batch goes through
+            self.assertEqual(provision_pending(), (2, 0))
+            task = UserProvisioning.objects.get(employee=poisoned)
+            self.assertEqual((task.state, task.attempts), (UserProvisioning.State.PENDING, 1))
+            self.assertIn('duplicate key', task.last_error)
+            self.assertGreater(task.retry_at, timezone.now() + timedelta(seconds=50))
+            # not before its backoff
+            self.assertEqual(provision_pending(), (0, 0))
+            UserProvisioning.objects.filter(pk=task.pk).update(retry_at=timezone.now())
+            self.assertEqual(provision_pending(), (0, 1))
+        task.refresh_from_db()
+        self.assertEqual((task.state, task.attempts), (UserProvisioning.State.FAILED, 2))
+        self.assertEqual(Employee.objects.get(pk=poisoned.pk).account_status, AccountStatus.FAILED)
+        self.assertFalse(User.objects.filter(email=poisoned.email).exists())
+
+    def test_retried_task_succeeds(self):
+        with self.failing_for(self.employees[0].email):
+            provision_pending()
+        UserProvisioning.objects.update(retry_at=None)
+        self.assertEqual(provision_pending(), (1, 0))
+        self.assertEqual(self.states(), [(UserProvisioning.State.DONE, 2)] + [(UserProvisioning.State.DONE, 1)] * 2)
+
+    def test_worker_survives_database_errors(self):
+        command = 'apps.employees.management.commands.run_provisioning_worker'
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch(f'{command}.provision_pending',
+                        side_effect=[OperationalError('server closed the connection'), (3, 0), (0, 0)]), \
+                mock.patch(f'{command}.connection') as worker_connection, mock.patch(f'{command}.time.sleep'):
+            call_command('run_provisioning_worker', '--once', stdout=out, stderr=err)
+        self.assertIn('server closed the connection', err.getvalue())
+        self.assertIn('provisioned 3 account(s)', out.getvalue())
+        worker_connection.close.assert_called_once()
+
+        with mock.patch(f'{command}.provision_pending', side_effect=OperationalError('down')), \
+                mock.patch(f'{command}.connection'), mock.patch(f'{command}.time.sleep'):
+            with self.assertRaises(CommandError):
+                call_command('run_provisioning_worker', '--once', stdout=out, stderr=err)
+
+
+class HiredReportTests(TestCase):
+    """
+    the hired report streams csv / ndjson from a server side cursor and
+    honours the list filters in every format
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [cls.engineering] = create_departments()
+        [cls.sales] = create_departments('Sales', company='Globex')
+        cls.hired = create_employee(cls.engineering, 1, status=EmployeeStatus.HIRED, hired_on=timezone.now())
+        create_employee(cls.engineering, 2, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+        cls.foreign = create_employee(cls.sales, 3, status=EmployeeStatus.HIRED, hired_on=timezone.now())
+        cls.headers = bearer_headers(create_admin())
+
+    def get(self, query=''):
+        response = self.client.get(f'/api/v1/employees/hired_report/{query}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.get('?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="hired_report.csv"')
+        header, *lines = self.content(response).splitlines()
+        self.assertEqual(header.split(','), HIRED_REPORT_COLUMNS)
+        self.assertEqual([line.split(',')[0] for line in lines], [str(self.hired.pk), str(self.foreign.pk)])
+        row = dict(zip(HIRED_REPORT_COLUMNS, lines[0].split(',')))
+        self.assertEqual((row['days_employed'], row['company_name'], row['department_name']),
+                         ('0', 'Acme', 'Engineering'))
+
+    def test_ndjson(self):
+        response = self.get(f'?format=ndjson&company={self.sales.company_id}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([(row['id'], row['email'], row['department_name']) for row in rows],
+                         [(self.foreign.pk, self.foreign.email, 'Sales')])
+
+    def test_json_honours_the_filters(self):
+        self.assertEqual({row['id'] for row in self.get().data}, {self.hired.pk, self.foreign.pk})
+        rows = self.get(f'?company={self.engineering.company_id}').data
+        self.assertEqual([(row['id'], row['days_employed']) for row in rows], [(self.hired.pk, 0)])
+
+
+class OrgGeneratorTests(TestCase):
+    """
+    generate_org (OrgGenerator): the same seed gives the same organisation,
+    the counter columns are written right and the logins are linked
+    """
+
+    def generate(self, seed, **options):
+        options = {'companies': 2, 'departments_per_company': 3, 'employees': 40, **options}
+        return OrgGenerator(seed=seed, batch_size=15, **options).run()
+
+    def snapshot(self, seed):
+        """
+        the generated rows (ids aside, they depend on the sequences) of a
+        generation that is rolled back afterwards
+        """
+        with transaction.atomic():
+            self.generate(seed)
+            rows = sorted(Employee.objects.values_list(
+                'company__name', 'department__name', 'name', 'email', 'designation', 'status', 'hired_on',
+            ))
+            transaction.set_rollback(True)
+        return rows
+
+    def test_deterministic(self):
+        first = self.snapshot(seed=7)
+        self.assertEqual(len(first), 40)
+        self.assertEqual(self.snapshot(seed=7), first)
+        self.assertNotEqual(self.snapshot(seed=8), first)
+
+    def test_counters_and_logins(self):
+        self.assertEqual(self.generate(seed=1, users=True),
+                         {'companies': 2, 'departments': 6, 'employees': 40, 'users': 40})
+        for company in Company.objects.all():
+            self.assertEqual((company.department_count, company.employee_count),
+                             (company.departments.count(), company.employees.count()))
+        for department in Department.objects.all():
+            self.assertEqual(department.employee_count, department.employees.count())
+
+        self.assertFalse(Employee.objects.exclude(account_status=AccountStatus.PROVISIONED).exists())
+        self.assertEqual(User.objects.filter(employee__email=F('email')).count(), 40)
+        # the ids continue after the generated rows
+        employee = create_employee(Department.objects.first(), 99)
+        self.assertEqual(employee.pk, Employee.objects.order_by('-pk').values_list('pk', flat=True)[1] + 1)
+
+
+class AsyncReadViewTests(TestCase):
+    """
+    the async views (core.asyncviews) answer like the viewsets they borrow from
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        departments = create_departments('Engineering', 'Sales')
+        cls.company = departments[0].company
+        now = timezone.now()
+        for number in range(5):
+            create_employee(
+                departments[number % 2], number,
+                status=EmployeeStatus.HIRED if number % 2 else EmployeeStatus.INTERVIEW_SCHEDULED,
+                hired_on=now - timedelta(days=number * 100) if number % 2 else None,
+            )
+        cls.employee = Employee.objects.order_by('id').first()
+
+    def setUp(self):
+        self.headers = bearer_headers(self.admin)
+
+    async def get(self, path, **headers):
+        return await self.async_client.get(path, headers={**self.headers, **headers})
+
+    async def assertSameResponse(self, path):
+        sync, asynchronous = await self.get(f'/api/v1/{path}'), await self.get(f'/api/v1/async/{path}')
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        self.assertEqual(asynchronous.content.replace(b'/async', b''), sync.content)
+        return asynchronous
+
+    async def test_matches_the_viewsets(self):
+        for path in ('employees/', 'employees/?page_size=2&status=HIRED',
+                     'employees/?ordering=days_employed&page_size=1', f'employees/{self.employee.pk}/',
+                     'employees/?status=FIRED', 'employees/hired_report/',
+                     'companies/', 'companies/?page_size=1&count=exact',
+                     f'departments/?company={self.company.pk}&page_size=1'):
+            with self.subTest(path=path):
+                await self.assertSameResponse(path)
+
+    async def test_pages(self):
+        ids, url = [], '/api/v1/async/employees/?page_size=2'
+        while url:
+            response = await self.get(url)
+            ids += [row['id'] for row in json.loads(response.content)['results']]
+            url = json.loads(response.content)['next']
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    async def test_errors(self):
+        self.assertEqual((await self.get('/api/v1/async/employees/0/')).status_code, 404)
+        self.assertEqual((await self.get('/api/v1/async/employees/abc/')).status_code, 404)
+        self.assertEqual((await self.get('/api/v1/async/employees/?cursor=abc')).status_code, 404)
+        self.assertEqual((await self.async_client.get('/api/v1/async/employees/')).status_code, 401)
+
+    async def test_conditional(self):
+        response = await self.get('/api/v1/async/employees/')
+        self.assertEqual(response.status_code, 200)
+        response = await self.get('/api/v1/async/employees/', if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    async def test_streamed_report(self):
+        # the stream reads after the request, outside of the test transaction: pinned to
+        # the primary, the replicas (if any) cannot see the uncommitted rows
+        response = await self.get('/api/v1/async/employees/hired_report/?format=csv',
+                                  **{PIN_HEADER: str(time.time() + 60)})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'id')
+        self.assertEqual(len(lines), 3)
+
+    async def test_company_overview(self):
+        response = await self.get(f'/api/v1/async/companies/{self.company.pk}/overview/')
+        data = json.loads(response.content)
+        self.assertEqual(data['name'], 'Acme')
+        self.assertEqual([department['name'] for department in data['departments']], ['Engineering', 'Sales'])
+        self.assertEqual(data['employees_by_status'][EmployeeStatus.HIRED], 2)
+        self.assertEqual(data['employees_by_status'][EmployeeStatus.NOT_ACCEPTED], 0)
+        self.assertEqual((await self.get('/api/v1/async/companies/0/overview/')).status_code, 404)
+
+    @override_settings(SQL_INSTRUMENTATION=True)
+    async def test_instrumentation(self):
+        response = await self.get('/api/v1/async/employees/')
+        self.assertIn('queries', response['Server-Timing'])
+
+
+@override_settings(ASYNC_CONCURRENT_QUERIES=True)
+class AsyncConcurrentQueriesTests(TransactionTestCase):
+    """
+    gather() runs the parts of a response on connections of their own
+    (committed rows, hence the transaction test case)
+    """
+    databases = '__all__'  # outside of a transaction the reads go to the replicas, if any
+
+    def setUp(self):
+        if connection.settings_dict['CONN_MAX_AGE']:
+            self.skipTest('persistent worker connections would outlive the test database')
+        [department] = create_departments()
+        self.company = department.company
+        for number in range(3):
+            create_employee(department, number, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+        self.headers = bearer_headers(create_admin())
+
+    async def test_overview_and_page(self):
+        response = await self.async_client.get(
+            f'/api/v1/async/companies/{self.company.pk}/overview/', headers=self.headers)
+        data = json.loads(response.content)
+        self.assertEqual(len(data['departments']), 1)
+        self.assertEqual(data['employees_by_status'][EmployeeStatus.INTERVIEW_SCHEDULED], 3)
+
+        response = await self.async_client.get(
+            '/api/v1/async/employees/?page_size=2&count=exact', headers=self.headers)
+        data = json.loads(response.content)
+        self.assertEqual((data['count'], len(data['results'])), (3, 2))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'needs DB_REPLICA_HOSTS (the replicas mirror the test database)')
+@override_settings(ASYNC_CONCURRENT_QUERIES=True)
+class AsyncReplicaReadTests(TransactionTestCase):
+    """
+    the async views read from the replicas, streamed exports included, and
+    from the primary once the client is pinned (committed rows: the replica
+    connections do not see a test transaction)
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        if connection.settings_dict['CONN_MAX_AGE']:
+            self.skipTest('persistent worker connections would outlive the test database')
+        [department] = create_departments()
+        self.company = department.company
+        for number in range(3):
+            create_employee(department, number,
+                            status=EmployeeStatus.HIRED if number else EmployeeStatus.INTERVIEW_SCHEDULED)
+        self.headers = bearer_headers(create_admin())
+        # the aliases the employee reads were routed to, on any thread
+        self.reads = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            if model is Employee:
+                self.reads.append(alias)
+            return alias
+        patcher = mock.patch.object(ReplicaRouter, 'db_for_read', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def get(self, path, **headers):
+        return await self.async_client.get(path, headers={**self.headers, **headers})
+
+    async def test_reads_go_to_the_replicas(self):
+        response = await self.get('/api/v1/async/employees/?page_size=10&count=exact')
+        self.assertEqual(json.loads(response.content)['count'], 3)
+        response = await self.get('/api/v1/async/employees/hired_report/?format=csv')
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(self.reads)
+        self.assertLessEqual(set(self.reads), set(settings.DATABASE_REPLICAS))
+
+    async def test_cached_responses_are_read_from_the_primary(self):
+        await sync_to_async(cache.clear)()
+        path = f'/api/v1/async/companies/{self.company.pk}/overview/'
+        response = await self.get(path)
+        self.assertEqual(json.loads(response.content)['employees_by_status'][EmployeeStatus.HIRED], 2)
+        # a replica behind the last write would cache a stale overview
+        self.assertEqual(self.reads, ['default'])
+        self.reads.clear()
+        response = await self.get(path)
+        self.assertEqual(json.loads(response.content)['employees_by_status'][EmployeeStatus.HIRED], 2)
+        self.assertEqual(self.reads, [])
+
+    async def test_pinned_reads_go_to_the_primary(self):
+        pinned = {PIN_HEADER: str(time.time() + 5)}
+        response = await self.get('/api/v1/async/employees/?page_size=10&count=exact', **pinned)
+        self.assertEqual(json.loads(response.content)['count'], 3)
+        response = await self.get('/api/v1/async/employees/hired_report/?format=csv', **pinned)
+        self.assertEqual(len(b''.join([chunk async for chunk in response.streaming_content]).splitlines()), 3)
+        self.assertTrue(self.reads)
+        self.assertEqual(set(self.reads), {'default'})
+
+
+
+
+class EmployeePartitioningTests(TestCase):
+    """
+    the partitioned employee table keeps the guarantees of the plain one
+    (converted inside the test transaction unless the test database already is)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [cls.department] = create_departments()
+        [cls.other_department] = create_departments('Legal', company='Globex')
+        cls.company, cls.other_company = cls.department.company, cls.other_department.company
+        cls.employee = create_employee(cls.department, name='Jane Doe', email='jane@example.com')
+        cls.other_employee = create_employee(cls.other_department, name='John Doe', email='john@example.com')
+        cls.user = User.objects.create_user(username='jane', email='jane@example.com', password='x',
+                                            employee=cls.employee)
+
+    def setUp(self):
+        strategy = partition_strategy(connection)
+        if strategy is None:
+            strategy = 'list'
+            with connection.cursor() as cursor:
+                # the foreign keys cannot be dropped with pending checks
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            partition(connection, strategy)
+        settings_override = override_settings(EMPLOYEE_PARTITIONING=strategy)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def assertConstraintsHold(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+    def test_email_stays_unique_across_partitions(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Employee.objects.filter(pk=self.other_employee.pk).update(email='jane@example.com')
+
+    def test_references_are_checked(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.filter(pk=self.user.pk).update(employee_id=self.other_employee.pk + 1000)
+            self.assertConstraintsHold()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM employees_employee WHERE id = %s', [self.employee.pk])
+            self.assertConstraintsHold()
+
+    def test_save_updates_the_partition_of_the_row(self):
+        employee = Employee.objects.get(pk=self.employee.pk)
+        employee.designation = 'lead'
+        employee.save()
+        self.assertEqual(Employee.objects.get(pk=employee.pk).designation, 'lead')
+
+        # moved since it was loaded (another partition): still updated, not inserted again
+        Employee.objects.filter(pk=employee.pk).update(company=self.other_company, department=self.other_department)
+        employee.designation = 'manager'
+        employee.save()
+        self.assertEqual(Employee.objects.filter(email='jane@example.com').count(), 1)
+        self.assertEqual(Employee.objects.get(pk=employee.pk).designation, 'manager')
+        self.assertConstraintsHold()
+
+    def test_company_partition_moves_the_default_rows(self):
+        if partition_strategy(connection) != 'list':
+            self.skipTest('list partitioning only')
+        # created without their partitions (on commit), the rows go to the default partition
+        [department] = create_departments('Sales', company='Initech')
+        [empty_department] = create_departments('Sales', company='Hooli')
+        employee = create_employee(department, 5)
+        with connection.cursor() as cursor:
+            # the moved rows are only found again once the partition is attached
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+        def statements(company_id):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertTrue(ensure_company_partition(connection, company_id))
+            return [query['sql'] for query in queries if query['sql'].startswith('LOCK')]
+
+        # nothing to move, the default partition is left alone
+        self.assertEqual(statements(empty_department.company_id), [])
+        self.assertEqual(statements(department.company_id),
+                         [f'LOCK TABLE "{DEFAULT_PARTITION}" IN SHARE MODE'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {company_partition(department.company_id)}')
+            self.assertEqual(cursor.fetchall(), [(employee.pk,)])
+            cursor.execute(f'SELECT count(*) FROM "{DEFAULT_PARTITION}" WHERE company_id = %s',
+                           [department.company_id])
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertFalse(ensure_company_partition(connection, department.company_id))
+        self.assertConstraintsHold()
+
+    def test_company_delete_releases_its_employees(self):
+        company_id = self.company.pk
+        self.company.delete()
+        self.assertFalse(Employee.objects.filter(company_id=company_id).exists())
+        self.assertFalse(UserProvisioning.objects.filter(employee_id=self.employee.pk).exists())
+        self.assertIsNone(User.objects.get(pk=self.user.pk).employee_id)
+        self.assertTrue(Employee.objects.filter(pk=self.other_employee.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [company_partition(company_id)])
+            self.assertIsNone(cursor.fetchone()[0])
+        self.assertConstraintsHold()
@@ -1,18 +1,34 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, filters, status
+from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
+from core.asyncviews import AsyncDetailView, AsyncListView, AsyncReadView
+from core.conditional import conditional, detail_version, list_version
+from core.instrumentation import query_budget
+from core.search import PostgresSearchFilter
+from core.serializers import SparseFieldsViewMixin
+from .filters import DAYS_EMPLOYED_ORDERINGS, EmployeeFilter
 from .models import Employee, EmployeeStatus
+from .operations import bulk_delete, bulk_move, bulk_transition
+from .exports import HIRED_REPORT_COLUMNS, ahired_report_rows, hired_report_rows, streaming_export
+from .importers import EmployeeImporter, detect_format, read_rows, text_stream
+from .parsers import CSVParser, NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
 from .serializers import (
 EmployeeSerializer,
 EmployeeListSerializer,
-HiredEmployeeReportSerializer
+HiredEmployeeReportSerializer,
+BulkOperationSerializer
 )
 # Create your views here.
 
-class EmployeeViewSet(viewsets.ModelViewSet):
+class EmployeeViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for Employee model :
     CRUD operations
@@ -20,10 +36,20 @@ class EmployeeViewSet(viewsets.ModelViewSet):
     filtering and search
     employee reports
     """
-    queryset = Employee.objects.all() # retrieves all employees by default
-    filter_backends = (DjangoFilterBackend,filters.SearchFilter) # allows filter and search for this model
-    filterset_fields = ['company','department','status']
+    queryset = Employee.objects.with_days_employed().select_related('company', 'department__company') # retrieves all employees by default
+    filter_backends = (DjangoFilterBackend,PostgresSearchFilter) # allows filter and search (?search_mode=prefix|fuzzy|fulltext)
+    filterset_class = EmployeeFilter # ?min_days_employed= ?max_days_employed= ?ordering=days_employed
     search_fields = ['name', 'email', 'designation']
+    replica_reads = True # GETs read from a replica (core.dbrouter)
+
+    @property
+    def keyset_ordering(self):
+        """
+        served by the employee_created_id_idx index, or employee_status_hired_idx
+        for ?ordering=days_employed
+        """
+        ordering = self.request.query_params.get('ordering') if self.request else None
+        return DAYS_EMPLOYED_ORDERINGS.get(ordering, ('-created_at', 'id'))
 
     def get_serializer_class(self):
         """
@@ -41,13 +67,34 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         view any auth user
         create/update/delete : manager or admin
         """
-        if self.action in ['create','update','partial_update','destroy']:
+        if self.action in ['create','update','partial_update','destroy','bulk_import','bulk']:
             permission_classes = [permissions.IsAdminUser]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    # query budgets leave room for one auth state lookup (apps.accounts.authentication)
+    @query_budget(5)
+    @conditional(list_version('company__updated_at', 'department__updated_at', daily=True))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @query_budget(3)
+    @conditional(detail_version(
+        'company__updated_at', 'department__updated_at', 'department__company__updated_at',
+        daily=True,
+    ))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_hired_report_queryset(self):
+        """
+        the hired employees matching the list filters, in every format
+        """
+        return self.filter_queryset(Employee.objects.all()).filter(status=EmployeeStatus.HIRED)
+
     @action(detail=True, methods=['post'])
+    @query_budget(4)
     def transition(self, request, pk=None):
         """
         handle employee status transitions
@@ -74,19 +121,105 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(employee)
         return Response(serializer.data)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'],
+            renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer, NDJSONRenderer])
+    @query_budget(3)
+    @conditional(list_version(
+        'company__updated_at', 'department__updated_at',
+        queryset=lambda view, request: view.get_hired_report_queryset(),
+        daily=True,
+    ))
     def hired_report(self, request):
         """
         this logic generates report of hired employees
         GET : /api/v1/employees/hired_report
+        GET : /api/v1/employees/hired_report?format=csv | ?format=ndjson
+        --> streams the rows straight from a server side cursor
         """
-        hired_employees = Employee.objects.filter(
-            status=EmployeeStatus.HIRED
-        ).select_related('company', 'department')
+        export_format = request.accepted_renderer.format
+        if export_format in (CSVRenderer.format, NDJSONRenderer.format):
+            rows = hired_report_rows(self.get_hired_report_queryset())
+            return streaming_export(HIRED_REPORT_COLUMNS, rows, export_format, 'hired_report')
+
+        hired_employees = (self.get_hired_report_queryset()
+                           .with_days_employed()
+                           .select_related('company', 'department'))
 
         serializer = HiredEmployeeReportSerializer(hired_employees, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'],
+            parser_classes=[MultiPartParser, CSVParser, NDJSONParser])
+    def bulk_import(self, request):
+        """
+        bulk employee import from csv or ndjson
+        POST : /api/v1/employees/bulk_import/
+        body : multipart upload in `file` (.csv / .ndjson) or a raw
+               text/csv | application/x-ndjson body
+        ?dry_run=true only validates the rows
+        returns created / failed counts and the errors of every rejected row
+        """
+        upload = request.data.get('file')
+        if upload is None:
+            return Response({'file': 'a csv or ndjson file is required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        input_format = detect_format(
+            request.data.get('content_type') or getattr(upload, 'content_type', ''),
+            getattr(upload, 'name', ''),
+        )
+        if input_format is None:
+            return Response({'file': 'unsupported format, upload csv or ndjson'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        importer = EmployeeImporter(dry_run=dry_run)
+        report = importer.run(read_rows(text_stream(upload), input_format))
+
+        if dry_run:
+            response_status = status.HTTP_200_OK
+        elif report['created']:
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(report, status=response_status)
+
+    @action(detail=False, methods=['post'])
+    @query_budget(14)
+    def bulk(self, request):
+        """
+        set-based transition / reassignment / deletion of many employees
+        POST : /api/v1/employees/bulk/?status=INTERVIEW_SCHEDULED&company=1
+        payload = {"operation": "transition", "status": "HIRED"}
+                  {"operation": "move", "department": 3, "ids": [1, 2]}
+                  {"operation": "delete", "ids": [4, 5]}
+        targets the employees matching the list filters (?company= ?department=
+        ?status= ?search=), narrowed to `ids` when given. at least one is required.
+        returns the applied ids and the rejected ones with the reason
+        """
+        serializer = BulkOperationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        filters = {'company', 'department', 'status', 'search',
+                   'min_days_employed', 'max_days_employed'} & set(request.query_params)
+        if 'ids' not in data and not filters:
+            return Response(
+                {'ids': 'pass the employee ids or a filter (?company= ?department= ?status= ?search= '
+                        '?min_days_employed= ?max_days_employed=)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(Employee.objects.all())
+        ids = data.get('ids')
+        if data['operation'] == 'transition':
+            result = bulk_transition(queryset, data['status'], ids)
+        elif data['operation'] == 'move':
+            result = bulk_move(queryset, data['department'], ids)
+        else:
+            result = bulk_delete(queryset, ids)
+        return Response({'operation': data['operation'], **result})
+
     def perform_create(self, serializer):
         """
         sets initial status and hired on date
@@ -95,3 +228,41 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             serializer.save(hired_on=timezone.now())
         else:
             serializer.save()
+
+
+class AsyncEmployeeListView(AsyncListView):
+    """
+    async version of the employee list (same filters, search, pagination and ETag)
+    GET : /api/v1/async/employees/
+    """
+    viewset = EmployeeViewSet
+
+
+class AsyncEmployeeDetailView(AsyncDetailView):
+    """
+    GET : /api/v1/async/employees/{id}/
+    """
+    viewset = EmployeeViewSet
+
+
+class AsyncHiredReportView(AsyncReadView):
+    """
+    async version of the hired report
+    GET : /api/v1/async/employees/hired_report/ (?format=csv | ?format=ndjson)
+    --> the exports stream from a server side cursor read with aiterator
+    """
+    viewset = EmployeeViewSet
+    action = 'hired_report'
+    renderer_classes = [JSONRenderer, CSVRenderer, NDJSONRenderer]
+
+    async def respond(self, view, request):
+        # the streamed formats validate their filters with queries
+        queryset = await sync_to_async(view.get_hired_report_queryset)()
+        export_format = request.accepted_renderer.format
+        if export_format in (CSVRenderer.format, NDJSONRenderer.format):
+            rows = ahired_report_rows(queryset)
+            return streaming_export(HIRED_REPORT_COLUMNS, rows, export_format, 'hired_report')
+
+        hired_employees = [employee async for employee in
+                           queryset.with_days_employed().select_related('company', 'department')]
+        return Response(HiredEmployeeReportSerializer(hired_employees, many=True).data)
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import EmployeeRollup
+# Register your models here.
+
+@admin.register(EmployeeRollup)
+class EmployeeRollupAdmin(admin.ModelAdmin):
+    list_display = ('company', 'department', 'month', 'status', 'headcount')
+    list_filter = ('status',)
+    list_select_related = ('company', 'department')
+    readonly_fields = [field.name for field in EmployeeRollup._meta.fields]
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class ReportsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.reports'
+
+    def ready(self):
+        import apps.reports.signals
+        post_migrate.connect(apps.reports.signals.install_rollup_triggers, sender=self)
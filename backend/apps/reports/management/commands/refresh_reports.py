@@ -0,0 +1,41 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.reports.rollups import rebuild_rollups, refresh_rollups
+
+
+class Command(BaseCommand):
+    """
+    refreshes the report rollups from the employee changes recorded since
+    the last refresh, or rebuilds them from scratch
+    usage: python manage.py refresh_reports [--rebuild] [--watch [--interval 10]]
+    """
+    help = 'refresh (or --rebuild) the employee report rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='recompute every rollup row from the employee table')
+        parser.add_argument('--watch', action='store_true',
+                            help='keep refreshing every --interval seconds')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='seconds between refreshes (default: half of REPORTS_MAX_STALENESS)')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            started = time.perf_counter()
+            rows = rebuild_rollups()
+            self.stdout.write(f'rebuilt {rows} rollup row(s) in {time.perf_counter() - started:.2f}s')
+
+        interval = options['interval'] or settings.REPORTS_MAX_STALENESS / 2
+        try:
+            while True:
+                started = time.perf_counter()
+                departments = refresh_rollups()
+                if departments:
+                    self.stdout.write(f'refreshed {departments} department(s) '
+                                      f'in {time.perf_counter() - started:.2f}s')
+                if not options['watch']:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
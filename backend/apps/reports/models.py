@@ -0,0 +1,57 @@
+from django.db import models
+from apps.companies.models import Company
+from apps.departments.models import Department
+from apps.employees.models import EmployeeStatus
+# Create your models here.
+
+class EmployeeRollup(models.Model):
+    """
+    employees aggregated per (company, department, month, status), the
+    table the /reports/ endpoints read instead of the employee table.
+    month is the month of hired_on for hired employees (hires per month)
+    and of created_at (the application) for the others.
+    average tenure is derived from hired_on_seconds (sum of the hired_on
+    unix timestamps) so the rows never age.
+    maintained by apps.reports.rollups
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='+')
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='+')
+    month = models.DateField()
+    status = models.CharField(max_length=20,
+                              choices=[(status.value, status.label) for status in EmployeeStatus])
+    headcount = models.PositiveIntegerField(default=0)
+    hired_on_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "employee rollup"
+        verbose_name_plural = "employee rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'month', 'status'], name='employee_rollup_key'),
+        ]
+        indexes = [
+            models.Index(fields=['company', 'month'], name='employee_rollup_company_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.department_id} {self.month:%Y-%m} {self.status}: {self.headcount}"
+
+
+class RollupChange(models.Model):
+    """
+    departments whose employees changed since the last rollup refresh,
+    written by a statement level trigger on the employee table so every
+    write path (orm, bulk operations, COPY imports) is covered.
+    plain integer, the department may be gone by the time it is refreshed
+    """
+    department_id = models.BigIntegerField()
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "rollup change"
+        verbose_name_plural = "rollup changes"
+        indexes = [
+            models.Index(fields=['changed_at'], name='rollup_change_changed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.department_id} ({self.changed_at})"
@@ -0,0 +1,165 @@
+"""
+employee rollups behind the /reports/ endpoints.
+
+every insert / update / delete statement on the employee table records the
+departments it touched in RollupChange (statement level triggers with
+transition tables, installed post_migrate, so bulk operations and COPY
+imports are tracked like single writes). refresh_rollups() recomputes the
+rollup rows of those departments only, rebuild_rollups() recomputes
+everything (python manage.py refresh_reports [--rebuild]).
+
+freshness contract: a report never lags the employee table by more than
+REPORTS_MAX_STALENESS seconds. reads check the oldest pending change and
+refresh first when it is older than that (ensure_fresh), a
+refresh_reports --watch process keeps the reads from ever paying for it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, DateField, Min, Sum, BigIntegerField
+from django.db.models.functions import Coalesce, Extract, TruncMonth
+from django.utils import timezone
+
+from apps.employees.models import Employee
+from .models import EmployeeRollup, RollupChange
+
+# serializes the refreshes (pg_advisory_xact_lock key)
+REFRESH_LOCK = 718_301
+
+# an update only matters to the rollups when one of these changed
+ROLLUP_COLUMNS = ('company_id', 'department_id', 'status', 'hired_on', 'created_at')
+
+
+def install_change_triggers(connection):
+    """
+    statement level triggers recording the departments touched by every
+    employee write (postgres only, reports are rebuilt by hand elsewhere)
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    quote = connection.ops.quote_name
+    table = quote(Employee._meta.db_table)
+    changes = quote(RollupChange._meta.db_table)
+    function = 'employees_employee_rollup_change'
+    old = ', '.join(f'o.{quote(column)}' for column in ROLLUP_COLUMNS)
+    new = ', '.join(f'n.{quote(column)}' for column in ROLLUP_COLUMNS)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO {changes} (department_id, changed_at)
+                    SELECT DISTINCT department_id, now() FROM new_rows;
+                ELSIF TG_OP = 'DELETE' THEN
+                    INSERT INTO {changes} (department_id, changed_at)
+                    SELECT DISTINCT department_id, now() FROM old_rows;
+                ELSE
+                    -- a move touches both departments
+                    INSERT INTO {changes} (department_id, changed_at)
+                    SELECT DISTINCT department_id, now() FROM (
+                        SELECT unnest(ARRAY[o.department_id, n.department_id]) AS department_id
+                        FROM old_rows o JOIN new_rows n ON n.id = o.id
+                        WHERE ({old}) IS DISTINCT FROM ({new})
+                    ) moved;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        for event, transition in (('INSERT', 'NEW TABLE AS new_rows'),
+                                  ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                                  ('DELETE', 'OLD TABLE AS old_rows')):
+            trigger = f'{function}_{event.lower()}'
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger} ON {table}')
+            cursor.execute(f"""
+                CREATE TRIGGER {trigger}
+                AFTER {event} ON {table}
+                REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+            """)
+
+
+def _insert_rollups(employees, using):
+    """
+    INSERT ... SELECT of the rollup rows of an employee queryset, the
+    aggregation never leaves the database
+    """
+    rows = (employees.order_by()
+            .annotate(month=TruncMonth(Coalesce('hired_on', 'created_at'), output_field=DateField()))
+            .values('company_id', 'department_id', 'status', 'month')
+            .annotate(headcount=Count('pk'),
+                      hired_on_seconds=Sum(Extract('hired_on', 'epoch'), output_field=BigIntegerField(),
+                                           default=0)))
+    sql, params = rows.query.sql_with_params()
+    connection = connections[using]
+    columns = ', '.join(connection.ops.quote_name(EmployeeRollup._meta.get_field(name).column)
+                        for name in ('company', 'department', 'status', 'month',
+                                     'headcount', 'hired_on_seconds'))
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {connection.ops.quote_name(EmployeeRollup._meta.db_table)} '
+                       f'({columns}) {sql}', params)
+
+
+def _lock(using):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [REFRESH_LOCK])
+
+
+def refresh_rollups(using=None):
+    """
+    recomputes the rollups of the departments changed since the last
+    refresh. returns the number of departments refreshed
+    """
+    using = using or router.db_for_write(EmployeeRollup)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        _lock(using)
+        # the markers are consumed first: a write committing after this
+        # statement leaves its own marker for the next refresh
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(RollupChange._meta.db_table)} '
+                           f'RETURNING department_id')
+            departments = {department_id for department_id, in cursor.fetchall()}
+        if not departments:
+            return 0
+        EmployeeRollup.objects.using(using).filter(department_id__in=departments).delete()
+        _insert_rollups(Employee.objects.using(using).filter(department_id__in=departments), using)
+    return len(departments)
+
+
+def rebuild_rollups(using=None):
+    """
+    recomputes every rollup row from the employee table
+    """
+    using = using or router.db_for_write(EmployeeRollup)
+    with transaction.atomic(using=using):
+        _lock(using)
+        RollupChange.objects.using(using).all().delete()
+        EmployeeRollup.objects.using(using).all().delete()
+        _insert_rollups(Employee.objects.using(using).all(), using)
+    return EmployeeRollup.objects.using(using).count()
+
+
+def ensure_fresh(using=None):
+    """
+    enforces the freshness contract before a report is read and returns
+    it: {'as_of': every change before this time is in the rollups,
+    'pending_changes', 'max_staleness'}
+    """
+    using = using or router.db_for_read(EmployeeRollup)
+    max_staleness = settings.REPORTS_MAX_STALENESS
+    now = timezone.now()
+    oldest = RollupChange.objects.using(using).aggregate(oldest=Min('changed_at'))['oldest']
+    if oldest is not None and now - oldest > timedelta(seconds=max_staleness):
+        refresh_rollups()
+        oldest = RollupChange.objects.using(using).aggregate(oldest=Min('changed_at'))['oldest']
+    return {
+        'as_of': oldest or now,
+        'pending_changes': oldest is not None,
+        'max_staleness': max_staleness,
+    }
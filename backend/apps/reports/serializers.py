@@ -0,0 +1,23 @@
+from rest_framework import serializers
+from apps.employees.models import EmployeeStatus
+
+GROUPINGS = ('total', 'company', 'department')
+
+
+class ReportQuerySerializer(serializers.Serializer):
+    """
+    query parameters of the reports:
+    ?company= &department= &status= (headcount) &group_by=total|company|department
+    &start=YYYY-MM &end=YYYY-MM (hires, inclusive)
+    """
+    company = serializers.IntegerField(required=False)
+    department = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(choices=EmployeeStatus.choices, required=False)
+    group_by = serializers.ChoiceField(choices=GROUPINGS, default='company')
+    start = serializers.DateField(input_formats=['%Y-%m'], required=False)
+    end = serializers.DateField(input_formats=['%Y-%m'], required=False)
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError({'end': 'end month is before the start month'})
+        return data
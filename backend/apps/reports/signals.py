@@ -0,0 +1,5 @@
+def install_rollup_triggers(sender, using, **kwargs):
+    """change tracking triggers of the employee table (post_migrate)"""
+    from django.db import connections
+    from .rollups import install_change_triggers
+    install_change_triggers(connections[using])
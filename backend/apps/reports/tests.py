@@ -0,0 +1,114 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.employees.models import Employee, EmployeeStatus
+from apps.employees.operations import bulk_transition
+from core.bulk import bulk_insert
+from core.testing import create_departments, create_employee, employee_fields
+from .models import EmployeeRollup, RollupChange
+from .rollups import rebuild_rollups, refresh_rollups
+
+User = get_user_model()
+
+
+def rollup_rows():
+    return sorted(EmployeeRollup.objects.values_list(
+        'company_id', 'department_id', 'month', 'status', 'headcount', 'hired_on_seconds'))
+
+
+class RollupRefreshTests(TestCase):
+    """
+    every employee write path marks its departments and the incremental
+    refresh ends up with the rows of a full rebuild
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.engineering, cls.sales = create_departments('Engineering', 'Sales')
+        cls.company = cls.engineering.company
+        cls.employees = [create_employee(cls.engineering, number, status=EmployeeStatus.INTERVIEW_SCHEDULED)
+                         for number in range(4)]
+
+    def assertRefreshMatchesRebuild(self):
+        refresh_rollups()
+        self.assertFalse(RollupChange.objects.exists())
+        refreshed = rollup_rows()
+        rebuild_rollups()
+        self.assertEqual(refreshed, rollup_rows())
+
+    def changed_departments(self):
+        return set(RollupChange.objects.values_list('department_id', flat=True))
+
+    def test_single_writes(self):
+        rebuild_rollups()
+        employee = self.employees[0]
+        employee.status = EmployeeStatus.HIRED
+        employee.save()
+        self.assertEqual(self.changed_departments(), {self.engineering.pk})
+        self.assertRefreshMatchesRebuild()
+
+        employee.department = self.sales
+        employee.save()
+        self.assertEqual(self.changed_departments(), {self.engineering.pk, self.sales.pk})
+        self.assertRefreshMatchesRebuild()
+
+        self.employees[1].delete()
+        self.assertRefreshMatchesRebuild()
+
+    def test_unrelated_update_is_not_tracked(self):
+        rebuild_rollups()
+        Employee.objects.filter(pk=self.employees[0].pk).update(designation='lead')
+        self.assertFalse(RollupChange.objects.exists())
+
+    def test_bulk_paths(self):
+        rebuild_rollups()
+        bulk_transition(Employee.objects.all(), EmployeeStatus.HIRED)
+        bulk_insert(Employee, [employee_fields(
+            4, company_id=self.company.pk, department_id=self.sales.pk,
+            status=EmployeeStatus.HIRED, hired_on=timezone.now() - timedelta(days=400),
+        )])
+        self.assertEqual(self.changed_departments(), {self.engineering.pk, self.sales.pk})
+        self.assertRefreshMatchesRebuild()
+
+
+class ReportEndpointTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='viewer', email='viewer@example.com', password='x')
+        [department] = create_departments()
+        cls.hired_on = timezone.now() - timedelta(days=100)
+        for number, status in enumerate([EmployeeStatus.HIRED, EmployeeStatus.HIRED,
+                                         EmployeeStatus.APPLICATION_RECEIVED]):
+            create_employee(department, number, status=status,
+                            hired_on=cls.hired_on if status == EmployeeStatus.HIRED else None)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reports(self):
+        rebuild_rollups()
+        headcount = self.client.get('/api/v1/reports/headcount/').data['results']
+        self.assertEqual(headcount[0]['statuses'][EmployeeStatus.HIRED], 2)
+        self.assertEqual(headcount[0]['total'], 3)
+
+        tenure = self.client.get('/api/v1/reports/tenure/?group_by=department').data['results']
+        self.assertEqual(tenure[0]['department_name'], 'Engineering')
+        self.assertAlmostEqual(tenure[0]['average_tenure_days'], 100, delta=0.1)
+
+        hires = self.client.get('/api/v1/reports/hires/?group_by=total').data['results']
+        self.assertEqual(hires, [{'month': f'{self.hired_on:%Y-%m}', 'hires': 2}])
+
+    def test_stale_rollups_are_refreshed_before_reading(self):
+        # setUpTestData left pending changes, younger than the contract
+        response = self.client.get('/api/v1/reports/headcount/')
+        self.assertTrue(response.data['freshness']['pending_changes'])
+        self.assertEqual(response.data['results'], [])
+
+        with override_settings(REPORTS_MAX_STALENESS=0):
+            response = self.client.get('/api/v1/reports/headcount/')
+        self.assertFalse(response.data['freshness']['pending_changes'])
+        self.assertEqual(response.data['results'][0]['total'], 3)
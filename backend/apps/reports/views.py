@@ -0,0 +1,142 @@
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from apps.employees.models import EmployeeStatus
+from core.instrumentation import query_budget
+from .models import EmployeeRollup
+from .rollups import ensure_fresh
+from .serializers import ReportQuerySerializer
+
+# group_by -> rollup columns a report is grouped on (and named by)
+GROUP_COLUMNS = {
+    'total': [],
+    'company': ['company_id', 'company__name'],
+    'department': ['company_id', 'company__name', 'department_id', 'department__name'],
+}
+# the rollup column names in the responses
+OUTPUT_NAMES = {
+    'company_id': 'company',
+    'company__name': 'company_name',
+    'department_id': 'department',
+    'department__name': 'department_name',
+}
+
+# freshness check, the report query and one auth state lookup, plus the
+# refresh queries when the freshness contract forces one
+REPORT_QUERY_BUDGET = 8
+
+
+class ReportViewSet(viewsets.ViewSet):
+    """
+    management reports read from the employee rollups (apps.reports.rollups):
+    GET : /api/v1/reports/            the reports and the freshness of the rollups
+    GET : /api/v1/reports/headcount/  employees per status
+    GET : /api/v1/reports/tenure/     hired employees and their average tenure in days
+    GET : /api/v1/reports/hires/      hires per month
+    every report answers {'freshness', 'group_by', 'results'}, see ReportQuerySerializer
+    for the parameters
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_params(self, request):
+        params = ReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data
+
+    def get_rollups(self, params):
+        rollups = EmployeeRollup.objects.all()
+        if 'company' in params:
+            rollups = rollups.filter(company_id=params['company'])
+        if 'department' in params:
+            rollups = rollups.filter(department_id=params['department'])
+        return rollups
+
+    @staticmethod
+    def grouped(rollups, group_by, *extra, **aggregates):
+        """
+        rollups summed per group (plus the extra columns), named for the response
+        """
+        columns = GROUP_COLUMNS[group_by] + list(extra)
+        order = [column for column in columns if not column.endswith('_id')]
+        rows = rollups.order_by().values(*columns).annotate(**aggregates).order_by(*order)
+        return [{OUTPUT_NAMES.get(key, key): value for key, value in row.items()} for row in rows]
+
+    def report(self, params, results):
+        return Response({
+            'freshness': self.freshness,
+            'group_by': params['group_by'],
+            'results': results,
+        })
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.freshness = ensure_fresh()
+
+    @query_budget(3)
+    def list(self, request):
+        return Response({
+            'freshness': self.freshness,
+            'reports': {
+                name: reverse(f'reports:report-{name}', request=request)
+                for name in ('headcount', 'tenure', 'hires')
+            },
+        })
+
+    @action(detail=False)
+    @query_budget(REPORT_QUERY_BUDGET)
+    def headcount(self, request):
+        """
+        employees per status, with their total, for every group
+        """
+        params = self.get_params(request)
+        rollups = self.get_rollups(params)
+        if 'status' in params:
+            rollups = rollups.filter(status=params['status'])
+
+        groups = {}
+        for row in self.grouped(rollups, params['group_by'], 'status', headcount=Sum('headcount')):
+            status, headcount = row.pop('status'), row.pop('headcount')
+            group = groups.setdefault(tuple(row.values()), dict(
+                row, statuses={status.value: 0 for status in EmployeeStatus}, total=0,
+            ))
+            group['statuses'][status] = headcount
+            group['total'] += headcount
+        return self.report(params, list(groups.values()))
+
+    @action(detail=False)
+    @query_budget(REPORT_QUERY_BUDGET)
+    def tenure(self, request):
+        """
+        hired employees and their average tenure (days since hired_on) per group
+        """
+        params = self.get_params(request)
+        rollups = self.get_rollups(params).filter(status=EmployeeStatus.HIRED)
+        now = timezone.now().timestamp()
+        results = []
+        for row in self.grouped(rollups, params['group_by'],
+                                hired=Sum('headcount'), seconds=Sum('hired_on_seconds')):
+            hired, seconds = row['hired'], row.pop('seconds')
+            row['average_tenure_days'] = round((now - seconds / hired) / 86400, 1) if hired else None
+            results.append(row)
+        return self.report(params, results)
+
+    @action(detail=False)
+    @query_budget(REPORT_QUERY_BUDGET)
+    def hires(self, request):
+        """
+        hires per month (month of hired_on) per group, oldest month first
+        """
+        params = self.get_params(request)
+        rollups = self.get_rollups(params).filter(status=EmployeeStatus.HIRED)
+        if 'start' in params:
+            rollups = rollups.filter(month__gte=params['start'])
+        if 'end' in params:
+            rollups = rollups.filter(month__lte=params['end'])
+        rows = self.grouped(rollups, params['group_by'], 'month', hires=Sum('headcount'))
+        rows.sort(key=lambda row: row['month'])  # stable, keeps the group order inside a month
+        for row in rows:
+            row['month'] = row['month'].strftime('%Y-%m')
+        return self.report(params, rows)
@@ -0,0 +1,3 @@
+"""
+in process api benchmark suite (python manage.py benchmark)
+"""
@@ -0,0 +1,205 @@
+"""
+throughput of the read endpoints under concurrent load, served three ways:
+- wsgi: the sync viewsets through django's WSGIHandler, one request per
+  thread of a pool (a threaded wsgi server, e.g. gunicorn --threads)
+- asgi-sync: the same sync viewsets through the ASGIHandler (core.asgi as
+  it serves them, django runs each request on a thread of its own)
+- asgi: the async views (core.asyncviews) through the ASGIHandler, the
+  requests are coroutines of one event loop
+
+the handlers are called in process (no network, no server) with
+`concurrency` requests in flight, client and server share the cpu.
+"""
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+
+from apps.accounts.authentication import user_states
+from apps.companies.models import Company
+from apps.employees.models import Employee
+from .suite import percentile
+
+API = '/api/v1/'
+MODES = ('wsgi', 'asgi-sync', 'asgi')
+
+
+def endpoints():
+    """
+    name -> (path of the sync viewset, path of the async view), relative to /api/v1/
+    """
+    company_id = Company.objects.order_by('id').values_list('id', flat=True).first()
+    employee_id = Employee.objects.order_by('id').values_list('id', flat=True).first()
+    return {
+        'employee_list': ('employees/?page_size=50', 'async/employees/?page_size=50'),
+        'employee_detail': (f'employees/{employee_id}/', f'async/employees/{employee_id}/'),
+        'hired_report_csv': (f'employees/hired_report/?format=csv&company={company_id}',
+                             f'async/employees/hired_report/?format=csv&company={company_id}'),
+        'company_list': ('companies/?page_size=50', 'async/companies/?page_size=50'),
+        'company_overview': (None, f'async/companies/{company_id}/overview/'),
+        'department_list': ('departments/?page_size=50', 'async/departments/?page_size=50'),
+    }
+
+
+def _host():
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+class ConcurrencyBenchmark:
+    """
+    `requests` GET requests per endpoint and mode, `concurrency` at a time
+    """
+
+    def __init__(self, token, concurrency=64, requests=500, warmup=10):
+        self.token = token
+        self.concurrency = concurrency
+        self.requests = requests
+        self.warmup = warmup
+        self.host = _host()
+
+    def run(self, modes=MODES, only=None, progress=None):
+        results = {}
+        for name, (sync_path, async_path) in endpoints().items():
+            if only and name not in only:
+                continue
+            for mode in modes:
+                path = async_path if mode == 'asgi' else sync_path
+                if path is None:
+                    continue
+                result = self.measure(mode, API + path)
+                results.setdefault(name, {})[mode] = result
+                if progress:
+                    progress(name, mode, result)
+        return results
+
+    def measure(self, mode, path):
+        cache.clear()
+        user_states.clear()
+        if mode == 'wsgi':
+            self.run_wsgi(path, self.warmup)
+            start = time.perf_counter()
+            samples = self.run_wsgi(path, self.requests)
+        else:
+            start, samples = asyncio.run(self.run_asgi(path))
+        elapsed = time.perf_counter() - start
+
+        durations = [duration for duration, _status in samples]
+        errors = sum(1 for _duration, status in samples if status >= 400)
+        return {
+            'requests': len(samples),
+            'concurrency': self.concurrency,
+            'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(durations, 50), 2),
+            'p95_ms': round(percentile(durations, 95), 2),
+            'p99_ms': round(percentile(durations, 99), 2),
+            'errors': errors,
+        }
+
+    # wsgi
+
+    def wsgi_environ(self, path):
+        path, _, query = path.partition('?')
+        return {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'HTTP_AUTHORIZATION': f'Bearer {self.token}',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+    def run_wsgi(self, path, requests):
+        application = get_wsgi_application()
+
+        def call(_index):
+            status = []
+            start = time.perf_counter()
+            result = application(self.wsgi_environ(path),
+                                 lambda line, headers, exc_info=None: status.append(line))
+            try:
+                for _chunk in result:
+                    pass
+            finally:
+                result.close()  # sends request_finished, which closes / gives back the connection
+            return (time.perf_counter() - start) * 1000, int(status[0].split()[0])
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(call, range(requests)))
+
+    # asgi
+
+    def asgi_scope(self, path):
+        path, _, query = path.partition('?')
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', self.host.encode()),
+                        (b'authorization', f'Bearer {self.token}'.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': (self.host, 80),
+        }
+
+    async def asgi_call(self, application, path):
+        finished = asyncio.Event()
+        status = []
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body', False):
+                finished.set()
+
+        start = time.perf_counter()
+        await application(self.asgi_scope(path), receive, send)
+        finished.set()
+        return (time.perf_counter() - start) * 1000, status[0]
+
+    async def run_asgi(self, path):
+        application = get_asgi_application()
+        for _index in range(self.warmup):
+            await self.asgi_call(application, path)
+
+        remaining = self.requests
+        samples = []
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                samples.append(await self.asgi_call(application, path))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _index in range(self.concurrency)))
+        return start, samples
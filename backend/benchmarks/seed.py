@@ -0,0 +1,16 @@
+"""
+benchmark datasets, generated with apps.employees.generator (the same
+data as python manage.py generate_org for a given seed)
+"""
+from apps.employees.generator import OrgGenerator
+
+# (companies, departments per company, employees)
+TIERS = {
+    'small': (1, 2, 10),
+    'medium': (5, 4, 1000),
+    'large': (50, 20, 1000000),
+}
+
+
+def seed_tier(tier, seed=0):
+    return OrgGenerator(*TIERS[tier], seed=seed).run()
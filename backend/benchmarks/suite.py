@@ -0,0 +1,204 @@
+"""
+times the main api endpoints in process (django test client, no network)
+against a seeded tier and compares the results with a stored baseline:
+the query counts of benchmarks/baseline.json, or the timings too against
+the report of an earlier run on the same machine.
+
+every run starts with an empty cache so the numbers are the cold path,
+queries are counted with the core.instrumentation execute wrapper.
+"""
+import json
+import math
+import platform
+import statistics
+import time
+from contextlib import ExitStack
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from apps.accounts.authentication import user_states
+from apps.companies.models import Company
+from apps.departments.models import Department
+from apps.employees.models import Employee, EmployeeStatus
+from core.instrumentation import QueryStats
+
+BENCH_EMAIL = 'bench@bench.example.com'
+BENCH_PASSWORD = 'bench-password'
+# login is dominated by the password hasher and the unpaginated reports
+# by the size of the tier, a few runs are enough
+LOGIN_RUNS = 5
+REPORT_RUNS = 5
+
+
+def percentile(samples, percent):
+    """
+    nearest rank percentile of a non empty list
+    """
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(durations, queries):
+    return {
+        'runs': len(durations),
+        'p50_ms': round(percentile(durations, 50), 2),
+        'p95_ms': round(percentile(durations, 95), 2),
+        'p99_ms': round(percentile(durations, 99), 2),
+        'mean_ms': round(statistics.fmean(durations), 2),
+        'queries': max(queries),
+    }
+
+
+def environment():
+    with connection.cursor() as cursor:
+        server = connection.vendor
+        if connection.vendor == 'postgresql':
+            cursor.execute('SHOW server_version')
+            server = f'postgresql {cursor.fetchone()[0]}'
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': server,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def row_counts():
+    return {
+        'companies': Company.objects.count(),
+        'departments': Department.objects.count(),
+        'employees': Employee.objects.count(),
+    }
+
+
+class Benchmark:
+    """
+    one benchmark session: a logged in client and the endpoints to time
+    """
+
+    def __init__(self, runs=30):
+        self.runs = runs
+        self.client = APIClient()
+
+    def setup(self):
+        User = get_user_model()
+        if not User.objects.filter(email=BENCH_EMAIL).exists():
+            User.objects.create_superuser(username='bench', email=BENCH_EMAIL, password=BENCH_PASSWORD)
+        response = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+        self.employee_id = Employee.objects.order_by('id').values_list('id', flat=True).first()
+        self.department_id = Department.objects.order_by('id').values_list('id', flat=True).first()
+        # every transition run moves a different candidate to hired
+        self.candidates = list(Employee.objects
+                               .filter(status=EmployeeStatus.INTERVIEW_SCHEDULED)
+                               .order_by('id').values_list('id', flat=True)[:self.runs])
+
+    def login(self):
+        return APIClient().post('/api/v1/auth/login/',
+                                {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}, format='json')
+
+    def cases(self):
+        """
+        (name, callable(run) -> response, runs)
+        """
+        get = self.client.get
+        candidates = self.candidates
+        return [
+            ('employee_list', lambda run: get('/api/v1/employees/?page_size=50'), self.runs),
+            ('employee_detail', lambda run: get(f'/api/v1/employees/{self.employee_id}/'), self.runs),
+            ('employee_search', lambda run: get('/api/v1/employees/?page_size=50&search=engineer'), self.runs),
+            ('employee_search_prefix', lambda run: get('/api/v1/employees/?page_size=50&search=soft'), self.runs),
+            ('hired_report', lambda run: get('/api/v1/employees/hired_report/'), min(self.runs, REPORT_RUNS)),
+            ('hired_report_csv', lambda run: get('/api/v1/employees/hired_report/?format=csv'),
+             min(self.runs, REPORT_RUNS)),
+            ('employee_transition', lambda run: self.client.post(
+                f'/api/v1/employees/{candidates[run]}/transition/',
+                {'status': EmployeeStatus.HIRED}, format='json'), len(candidates)),
+            ('company_list', lambda run: get('/api/v1/companies/?page_size=50'), self.runs),
+            ('department_list', lambda run: get('/api/v1/departments/?page_size=50'), self.runs),
+            ('department_employees', lambda run: get(
+                f'/api/v1/departments/{self.department_id}/employees/?page_size=50'), self.runs),
+            ('login', lambda run: self.login(), min(self.runs, LOGIN_RUNS)),
+        ]
+
+    def measure(self, request, runs):
+        durations, queries = [], []
+        for run in range(runs):
+            cache.clear()
+            user_states.clear()
+            stats = QueryStats()
+            with ExitStack() as stack:
+                for db in connections.all():
+                    stack.enter_context(db.execute_wrapper(stats))
+                start = time.perf_counter()
+                response = request(run)
+                if response.streaming:
+                    for _chunk in response.streaming_content:
+                        pass
+                elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise RuntimeError(f'{response.status_code}: {getattr(response, "data", response)}')
+            durations.append(elapsed * 1000)
+            queries.append(stats.count)
+        return summarize(durations, queries)
+
+    def run(self, only=None, progress=None):
+        self.setup()
+        results = {}
+        for name, request, runs in self.cases():
+            if (only and name not in only) or not runs:
+                continue
+            results[name] = self.measure(request, runs)
+            if progress:
+                progress(name, results[name])
+        return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    regressions of results against a baseline of the same tier: more
+    queries, or a p95 slower than the baseline by more than tolerance
+    (only against a baseline with timings, see load_baseline)
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if current['queries'] > reference['queries']:
+            regressions.append(f"{name}: {current['queries']} queries, baseline {reference['queries']}")
+        if 'p95_ms' in reference and current['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms, baseline {reference['p95_ms']}ms "
+                               f"(+{tolerance:.0%} allowed)")
+    return regressions
+
+
+def query_baseline(results):
+    """
+    the shared baseline of a tier: the query counts, the same on every
+    machine (timings are only comparable on the machine that measured them)
+    """
+    return {name: {'queries': result['queries']} for name, result in results.items()}
+
+
+def load_baseline(path):
+    """
+    {tier: {endpoint: reference}}: the shared baseline (query counts), or
+    the report of an earlier run (--output) as the baseline of its tier,
+    timings included
+    """
+    try:
+        with open(path, encoding='utf-8') as stream:
+            baseline = json.load(stream)
+    except FileNotFoundError:
+        return {}
+    if 'results' in baseline and 'tier' in baseline:
+        return {baseline['tier']: baseline['results']}
+    return baseline
@@ -9,8 +9,29 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+# requests that stay open (server-sent events, apps.changes)
+LONG_LIVED_PATHS = ('/api/v1/changes/stream/',)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    django gives every request a thread of its own for its sync calls
+    (ThreadSensitiveContext) until the response is sent, an open stream
+    would hold it for as long as it runs. the long lived requests run
+    their few sync calls (signals, authentication) on the shared thread
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] in LONG_LIVED_PATHS:
+            await self.handle(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+django.setup(set_prefix=False)
+application = StreamingASGIHandler()
@@ -0,0 +1,188 @@
+"""
+async versions of read endpoints, for ASGI servers (core.asgi).
+
+an async view borrows a viewset for everything but running the queries:
+authentication, permissions, filters, serializers, pagination, and the
+ETag version / response cache of the action, so both answer the same.
+the queries go through the async orm (aget / async for) and the event
+loop serves other requests while they run.
+django 4.2 runs the async orm on a thread of the request (psycopg2 has no
+async api), so the queries of one request run one after the other unless
+they go through gather().
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .cache import get_cached_data, response_cache_key, set_cached_data
+from .conditional import set_validators, validators
+from .dbrouter import read_from_primary
+
+
+def _on_own_connection(call):
+    def run():
+        try:
+            return call()
+        finally:
+            # closes it, gives it back to the pool or keeps it for the next
+            # call on this thread, depending on DB_CONNECTIONS
+            close_old_connections()
+    return run
+
+
+async def run_on_own_connection(call):
+    """
+    result of a blocking call run on a worker thread with a database
+    connection of its own, for the long lived tasks of an event loop
+    (apps.changes.feed) that must not queue behind the requests
+    """
+    return await sync_to_async(_on_own_connection(call), thread_sensitive=False)()
+
+
+async def gather(*calls):
+    """
+    results of blocking calls (e.g. lambda: list(queryset)) run at the same
+    time, each on a worker thread with a database connection of its own.
+    with ASYNC_CONCURRENT_QUERIES off they run one after the other on the
+    thread of the request (opening a connection per call costs more than
+    it saves with DB_CONNECTIONS=direct)
+    """
+    if not settings.ASYNC_CONCURRENT_QUERIES:
+        return [await sync_to_async(call)() for call in calls]
+    return await asyncio.gather(*(run_on_own_connection(call) for call in calls))
+
+
+class AsyncReadView(View):
+    """
+    GET only and json only: the browsable api renderer runs queries of its own
+    subclasses set `viewset` / `action` and implement respond(). with
+    `action = None` the viewset only authenticates, checks permissions and
+    negotiates the renderer (no ETag version, no response cache)
+    """
+    viewset = None
+    action = 'list'
+    renderer_classes = [JSONRenderer]
+    replica_reads = True  # core.dbrouter
+
+    def get_version(self):
+        """
+        ETag version of the viewset action (core.conditional), if any
+        """
+        if self.action is None:
+            return None
+        return getattr(getattr(self.viewset, self.action), 'version', None)
+
+    def get_cache_prefix(self):
+        """
+        response cache of the viewset action (core.cache), if any
+        """
+        if self.action is None:
+            return None
+        return getattr(getattr(self.viewset, self.action), 'cache_prefix', None)
+
+    def get_viewset(self, request, *args, **kwargs):
+        action_map = {'get': self.action, 'head': self.action} if self.action else {}
+        view = self.viewset(action_map=action_map, renderer_classes=self.renderer_classes)
+        view.args, view.kwargs = args, kwargs
+        view.request = view.initialize_request(request, *args, **kwargs)
+        view.headers = view.default_response_headers
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        view = self.get_viewset(request, *args, **kwargs)
+        try:
+            await sync_to_async(view.initial)(view.request, *args, **kwargs)
+            response = await self.conditional_response(view, view.request, *args, **kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return self.finalize_response(view, view.request, response)
+
+    async def conditional_response(self, view, request, *args, **kwargs):
+        version = self.get_version()
+        values = None
+        if version is not None:
+            values = await sync_to_async(version)(view, request, *args, **kwargs)
+        if values is None:
+            return await self.cached_response(view, request, *args, **kwargs)
+
+        etag, last_modified = validators(request, values)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = await self.cached_response(view, request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    async def cached_response(self, view, request, *args, **kwargs):
+        prefix = self.get_cache_prefix()
+        if prefix is None:
+            return await self.respond(view, request, *args, **kwargs)
+
+        def lookup():
+            key = response_cache_key(prefix, view, request)
+            return key, get_cached_data(prefix, key)
+        key, cached = await sync_to_async(lookup)()
+        if cached is not None:
+            return Response(cached)
+
+        read_from_primary()
+        response = await self.respond(view, request, *args, **kwargs)
+        if response.status_code == 200 and isinstance(response, Response):
+            await sync_to_async(set_cached_data)(key, response.data)
+        return response
+
+    async def respond(self, view, request, *args, **kwargs):
+        """
+        the response of the view (a drf Response or a streaming response),
+        run after the permissions and content negotiation of the viewset
+        """
+        raise NotImplementedError(f'{type(self).__name__} must implement respond()')
+
+    def finalize_response(self, view, request, response):
+        response = view.finalize_response(request, response)
+        if not isinstance(response, Response):
+            return response
+        # rendered here, django would render a template response on a thread
+        content = response.rendered_content
+        rendered = HttpResponse(content, status=response.status_code)
+        for header, value in response.items():
+            rendered[header] = value
+        return rendered
+
+
+class AsyncListView(AsyncReadView):
+    """
+    the viewset list: filtered, searched and keyset paginated
+    """
+
+    async def respond(self, view, request, *args, **kwargs):
+        # the filters validate their values with queries of their own
+        queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+        page = await view.paginator.apaginate_queryset(queryset, request, view=view)
+        if page is not None:
+            return view.get_paginated_response(view.get_serializer(page, many=True).data)
+        rows = [row async for row in queryset]
+        return Response(view.get_serializer(rows, many=True).data)
+
+
+class AsyncDetailView(AsyncReadView):
+    """
+    the viewset retrieve
+    """
+    action = 'retrieve'
+
+    async def respond(self, view, request, *args, **kwargs):
+        queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+        lookup = view.lookup_url_kwarg or view.lookup_field
+        try:
+            instance = await queryset.aget(**{view.lookup_field: kwargs[lookup]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError) as exc:
+            raise Http404 from exc
+        view.check_object_permissions(request, instance)
+        return Response(view.get_serializer(instance).data)
@@ -0,0 +1,238 @@
+"""
+fast bulk inserts for large imports / generated datasets.
+
+rows are plain dicts keyed by field attname (no model instances are
+built on the fast path). missing fields get their default and
+auto_now / auto_now_add fields get the current time, like a regular insert.
+on postgres rows are streamed with COPY FROM STDIN, which skips the per
+value sql compilation of bulk_create and is several times faster. other
+backends fall back to bulk_create. save() and the model signals are not
+called, and primary keys are not returned: rows that must be linked get
+explicit ones (next_pk) and the sequences are moved past them afterwards
+(reset_sequences). large loads into small tables can also defer the index
+and foreign key maintenance to the end (deferred_indexes).
+set-based updates that need the rows they changed use update_returning.
+"""
+import io
+from contextlib import contextmanager
+from datetime import date, datetime, time
+
+from django.core.management.color import no_style
+from django.db import connections, router
+from django.core.exceptions import EmptyResultSet
+from django.db.models import DateField, Max, TimeField
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+
+def _copy_field(value):
+    """
+    one field of the COPY csv stream: NULL is an unquoted empty field, every
+    other value is quoted, so no text (an empty string, a literal \\N) can
+    read back as NULL
+    """
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _insert_fields(model, rows):
+    # the primary key is only written when the rows carry one
+    with_pk = bool(rows) and model._meta.pk.attname in rows[0]
+    return [field for field in model._meta.concrete_fields if with_pk or not field.primary_key]
+
+
+def _row_builder(fields, now, for_copy=False):
+    """
+    function returning the values of one row in field order, with defaults /
+    timestamps filled in. the per field decisions are taken once per batch,
+    rows carrying every field (generated data) take a map() fast path.
+    for_copy=True returns the line of the row in the COPY csv stream instead
+    """
+    attnames = [field.attname for field in fields]
+    required = set(attnames)
+    auto = [index for index, field in enumerate(fields)
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    temporal = [index for index, field in enumerate(fields)
+                if for_copy and isinstance(field, (DateField, TimeField))]
+
+    # the fallback timestamp is encoded once, not once per row
+    fallback = now.isoformat() if for_copy else now
+
+    def build(row):
+        if required <= row.keys():
+            values = list(map(row.get, attnames))
+        else:
+            values = [row[attname] if attname in row else field.get_default()
+                      for attname, field in zip(attnames, fields)]
+        for index in auto:
+            if not values[index]:
+                values[index] = fallback
+        if not for_copy:
+            return values
+        for index in temporal:
+            value = values[index]
+            if isinstance(value, (datetime, date, time)):
+                values[index] = value.isoformat()
+        return ','.join(map(_copy_field, values)) + '\n'
+    return build
+
+
+def copy_insert(model, rows, using):
+    """
+    insert rows with a single COPY statement
+    """
+    fields = _insert_fields(model, rows)
+    build = _row_builder(fields, timezone.now(), for_copy=True)
+    buffer = io.StringIO(''.join(map(build, rows)))
+
+    connection = connections[using]
+    sql = 'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)'.format(
+        table=connection.ops.quote_name(model._meta.db_table),
+        columns=', '.join(connection.ops.quote_name(field.column) for field in fields),
+    )
+    # the driver cursor raises driver errors, django's IntegrityError & co are expected
+    with connection.cursor() as cursor, connection.wrap_database_errors:
+        if hasattr(cursor.cursor, 'copy_expert'):  # psycopg2
+            cursor.cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def bulk_insert(model, rows, batch_size=1000, using=None):
+    """
+    insert many rows (dicts keyed by attname) as fast as the database
+    allows: COPY on postgres, bulk_create elsewhere
+    """
+    using = using or router.db_for_write(model)
+    if connections[using].vendor == 'postgresql':
+        for start in range(0, len(rows), batch_size):
+            copy_insert(model, rows[start:start + batch_size], using)
+        return
+
+    fields = _insert_fields(model, rows)
+    attnames = [field.attname for field in fields]
+    build = _row_builder(fields, timezone.now())
+    objects = [model(**dict(zip(attnames, build(row)))) for row in rows]
+    model._default_manager.using(using).bulk_create(objects, batch_size=batch_size)
+
+
+def update_returning(queryset, attnames, **values):
+    """
+    queryset.update(**values) as a single UPDATE ... RETURNING (postgres),
+    the attnames of the updated rows as tuples. the WHERE clause is the
+    queryset's, a condition on the current values (e.g. a status) is
+    checked by the statement that writes the row, a concurrent write
+    included (django 4.2 update() only counts the rows)
+    """
+    model = queryset.model
+    using = router.db_for_write(model)
+    connection = connections[using]
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    try:
+        sql, params = query.get_compiler(using).as_sql()
+    except EmptyResultSet:
+        return []
+    columns = {field.attname: field.column for field in model._meta.concrete_fields}
+    returning = ', '.join(connection.ops.quote_name(columns[attname]) for attname in attnames)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {returning}', params)
+        return cursor.fetchall()
+
+
+def next_pk(model, using=None):
+    """
+    first free primary key of a table, for rows inserted with explicit ids.
+    call it inside the transaction of the insert: on postgres the table is
+    locked against concurrent inserts until the transaction ends
+    """
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {connection.ops.quote_name(model._meta.db_table)} IN EXCLUSIVE MODE')
+    last = model._default_manager.using(using).aggregate(last=Max('pk'))['last']
+    return (last or 0) + 1
+
+
+def reset_sequences(*models, using=None):
+    """
+    move the id sequences past the explicit ids inserted in the tables
+    """
+    using = using or router.db_for_write(models[0])
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+# memory of the index builds at the end of a deferred load (gin builds are
+# much faster when the whole posting list fits)
+INDEX_BUILD_MEMORY = '256MB'
+
+
+@contextmanager
+def deferred_indexes(*models, using=None):
+    """
+    bulk load mode (postgres, a no-op elsewhere): the non unique indexes
+    and the foreign keys of the tables are dropped for the duration of the
+    block and rebuilt in one pass each at the end, then the tables are
+    analyzed. only worth it when the load is large compared to the tables.
+    must be entered inside the transaction of the load, before its first
+    insert (postgres refuses to alter tables with pending deferred foreign
+    key checks), the tables stay locked until it commits; primary keys and
+    unique constraints are kept
+    """
+    using = using or router.db_for_write(models[0])
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        yield
+        return
+
+    quote = connection.ops.quote_name
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index '
+            'WHERE indrelid = ANY(%s::regclass[]) AND NOT indisprimary AND NOT indisunique',
+            [tables],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            "WHERE conrelid = ANY(%s::regclass[]) AND contype = 'f'",
+            [tables],
+        )
+        foreign_keys = cursor.fetchall()
+        # deferred constraint triggers (the employee references of a
+        # partitioned table) stay, their pending checks must fire before the
+        # rebuild: postgres builds no index on a table with pending trigger events
+        cursor.execute(
+            'SELECT DISTINCT conname FROM pg_constraint '
+            "WHERE conrelid = ANY(%s::regclass[]) AND contype = 't' AND condeferred",
+            [tables],
+        )
+        deferred = ', '.join(quote(name) for name, in cursor.fetchall())
+        for table, name, _definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {quote(name)}')
+        for name, _definition in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+
+    yield
+
+    with connection.cursor() as cursor:
+        if deferred:
+            cursor.execute(f'SET CONSTRAINTS {deferred} IMMEDIATE')
+        cursor.execute(f"SET LOCAL maintenance_work_mem = '{INDEX_BUILD_MEMORY}'")
+        for _name, definition in indexes:
+            cursor.execute(definition)
+        for table, name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote(name)} {definition}')
+        for table in tables:
+            cursor.execute(f'ANALYZE {quote(table)}')
+        if deferred:
+            cursor.execute(f'SET CONSTRAINTS {deferred} DEFERRED')
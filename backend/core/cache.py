@@ -0,0 +1,165 @@
+"""
+versioned response cache for read endpoints.
+
+cached GET responses are keyed by a generation number: a per-company one
+for responses scoped to a single company (a company, its departments, a
+department's employees) and a global one for unscoped lists. saves and
+deletes of companies, departments and employees bump the generation of
+their company and the global one (after commit), so stale entries are
+never read again and simply expire. a response is stored under the
+generation read before it was built, from the primary (core.dbrouter):
+a replica behind the bump would store a stale body under the new one.
+generations and hit / miss counters live in the configured cache backend
+(locmem is per process, use file or redis when running several workers).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .dbrouter import read_from_primary
+
+KEY_PREFIX = 'api'
+GLOBAL_SCOPE = 'global'
+
+# prefixes of the cached endpoints, for the stats endpoint
+CACHED_PREFIXES = set()
+
+
+def company_scope(company_id):
+    return f'company:{company_id}'
+
+
+def _generation_key(scope):
+    return f'{KEY_PREFIX}:gen:{scope}'
+
+
+def _fresh_generation():
+    # time based so a generation lost to eviction never reuses an old number
+    return int(time.time() * 1000)
+
+
+def get_generation(scope):
+    key = _generation_key(scope)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _fresh_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def _bump(scope):
+    key = _generation_key(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_generation(), timeout=None)
+
+
+def bump_generation(*company_ids):
+    """
+    invalidate every cached response of the given companies (and the
+    global lists) once the current transaction commits
+    """
+    scopes = {company_scope(company_id) for company_id in company_ids if company_id is not None}
+    scopes.add(GLOBAL_SCOPE)
+
+    def bump():
+        for scope in scopes:
+            _bump(scope)
+    transaction.on_commit(bump)
+
+
+def _count(prefix, outcome):
+    key = f'{KEY_PREFIX}:stats:{prefix}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def cache_stats():
+    stats = {}
+    for prefix in sorted(CACHED_PREFIXES):
+        hits = cache.get(f'{KEY_PREFIX}:stats:{prefix}:hit', 0)
+        misses = cache.get(f'{KEY_PREFIX}:stats:{prefix}:miss', 0)
+        total = hits + misses
+        stats[prefix] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+    return stats
+
+
+def response_cache_key(prefix, view, request):
+    """
+    cache key of a GET response, the view decides the scope with
+    get_cache_scope() (a company id or None for the global scope)
+    """
+    company_id = view.get_cache_scope()
+    scope = GLOBAL_SCOPE if company_id is None else company_scope(company_id)
+    query = request.get_full_path().encode()
+    return '{}:{}:{}:{}:{}'.format(
+        KEY_PREFIX, prefix, scope, get_generation(scope),
+        hashlib.md5(query).hexdigest(),
+    )
+
+
+def get_cached_data(prefix, key):
+    cached = cache.get(key)
+    _count(prefix, 'miss' if cached is None else 'hit')
+    return cached
+
+
+def set_cached_data(key, data, timeout=None):
+    cache.set(key, data, timeout=timeout if timeout is not None else settings.API_CACHE_TIMEOUT)
+
+
+def cache_response(prefix, timeout=None):
+    """
+    caches the serialized data of a successful GET viewset action.
+    the prefix stays readable as `action.cache_prefix` (core.asyncviews)
+    """
+    CACHED_PREFIXES.add(prefix)
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_method(self, request, *args, **kwargs)
+
+            key = response_cache_key(prefix, self, request)
+            cached = get_cached_data(prefix, key)
+            if cached is not None:
+                return Response(cached)
+
+            read_from_primary()
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200 and not getattr(response, 'streaming', False):
+                set_cached_data(key, response.data, timeout)
+            return response
+        wrapper.cache_prefix = prefix
+        return wrapper
+    return decorator
+
+
+class CacheStatsView(APIView):
+    """
+    hit / miss counters of the response cache (admin only)
+    GET /api/v1/cache/stats/
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'backend': settings.CACHES['default']['BACKEND'],
+            'endpoints': cache_stats(),
+        })
@@ -0,0 +1,122 @@
+"""
+conditional GET support (ETag / Last-Modified / 304) for viewset actions.
+
+the version of a response is read with one cheap query before the view
+runs: the updated_at columns of a detail object and of the related rows it
+nests, or max(updated_at) + count over the filtered queryset of a list.
+counter columns bump updated_at when they change (apps.companies.counters)
+so nested counts are covered too. If-None-Match / If-Modified-Since
+short-circuit with 304 before anything is serialized.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def detail_version(*related, daily=False):
+    """
+    version of a detail response: updated_at of the object and of the
+    related objects it nests (e.g. 'company__updated_at').
+    daily=True for payloads with values derived from today (days_employed)
+    """
+    def version(view, request, *args, **kwargs):
+        lookup = view.lookup_url_kwarg or view.lookup_field
+        try:
+            row = (view.get_queryset().order_by()
+                   .filter(**{view.lookup_field: kwargs.get(lookup)})
+                   .values_list('updated_at', *related).first())
+        except (TypeError, ValueError):
+            return None  # malformed pk, let the view answer 404
+        if row is None:
+            return None
+        return list(row) + ([timezone.now().date()] if daily else [])
+    return version
+
+
+def list_version(*related, queryset=None, daily=False):
+    """
+    version of a list response: max(updated_at) and count of the filtered
+    queryset, plus max(updated_at) of the related rows it shows.
+    queryset(view, request) overrides the view's filtered queryset
+    """
+    def version(view, request, *args, **kwargs):
+        try:
+            rows = queryset(view, request) if queryset else view.filter_queryset(view.get_queryset())
+        except (TypeError, ValueError):
+            return None  # malformed lookup, let the view answer
+        aggregates = {'updated_at': Max('updated_at'), 'rows': Count('pk')}
+        aggregates.update({field: Max(field) for field in related})
+        values = rows.order_by().aggregate(**aggregates)
+        return [values[name] for name in aggregates] + ([timezone.now().date()] if daily else [])
+    return version
+
+
+def combined_version(*versions):
+    """
+    version of a response made of several parts (e.g. a detail and a list)
+    """
+    def version(view, request, *args, **kwargs):
+        values = []
+        for part in versions:
+            part_values = part(view, request, *args, **kwargs)
+            if part_values is None:
+                return None
+            values.extend(part_values)
+        return values
+    return version
+
+
+def _etag(request, values):
+    # the path and the renderer are part of the representation
+    source = '|'.join([request.get_full_path(), request.accepted_renderer.format or '']
+                      + [value.isoformat() if hasattr(value, 'isoformat') else str(value)
+                         for value in values])
+    return quote_etag(hashlib.sha1(source.encode()).hexdigest())
+
+
+def validators(request, values):
+    """
+    (etag, last_modified timestamp or None) of a response version
+    """
+    modified = [value for value in values if isinstance(value, datetime)]
+    return _etag(request, values), int(max(modified).timestamp()) if modified else None
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional(version):
+    """
+    emits ETag / Last-Modified for a GET viewset action and answers 304
+    when the client copy is still current.
+    the version stays readable as `action.version` (core.asyncviews)
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_method(self, request, *args, **kwargs)
+
+            values = version(self, request, *args, **kwargs)
+            if values is None:
+                return view_method(self, request, *args, **kwargs)
+
+            etag, last_modified = validators(request, values)
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            return set_validators(view_method(self, request, *args, **kwargs), etag, last_modified)
+        wrapper.version = version
+        return wrapper
+    return decorator
@@ -0,0 +1,12 @@
+"""
+postgres backend with a per process connection pool (DB_CONNECTIONS=pool).
+
+ENGINE = 'core.dbpool', configured like the django 5.1 pool:
+OPTIONS = {'pool': {'max_size': 10, 'min_size': 0, 'timeout': 10,
+                    'max_lifetime': 3600, 'max_idle': 600, 'check': True, 'check_idle': 1}}
+
+django opens the connection of a thread on its first query and closes it
+at the end of the request (CONN_MAX_AGE = 0), this backend takes it from /
+gives it back to the pool instead. the pool is shared by the threads of
+the process, see core.dbpool.pool for checkout, health checks and recycling.
+"""
@@ -0,0 +1,303 @@
+"""
+thread safe pool of raw psycopg2 connections.
+
+- at most max_size connections are open (in use + idle + being opened),
+  a checkout waits up to `timeout` seconds for one to be given back and
+  raises PoolTimeout after that
+- the most recently returned connection is reused first, so under a light
+  load the extra ones grow idle and are closed after max_idle seconds
+  (min_size connections are always kept)
+- with check=True a reused connection idle for more than check_idle
+  seconds is pinged (SELECT 1) at checkout, a dead one is thrown away and
+  replaced transparently. one given back just before is trusted, if it
+  died anyway the request fails and the connection is closed at checkin
+- connections are closed at checkin once they lived max_lifetime seconds
+  (minus up to 10% jitter so they do not all expire together), and when
+  they come back broken or in a transaction that cannot be rolled back
+"""
+import os
+import random
+import threading
+from collections import Counter, deque
+from time import monotonic
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+DEFAULTS = {
+    'max_size': 10,
+    'min_size': 0,
+    'timeout': 10.0,
+    'max_lifetime': 3600.0,
+    'max_idle': 600.0,
+    'check': True,
+    'check_idle': 1.0,
+}
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """
+    no connection was given back in time (django raises it as OperationalError)
+    """
+
+
+class _Slot:
+    __slots__ = ('connection', 'created', 'expires', 'returned')
+
+    def __init__(self, connection, max_lifetime):
+        self.connection = connection
+        self.created = monotonic()
+        self.expires = self.created + max_lifetime * random.uniform(0.9, 1.0)
+        self.returned = self.created
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except psycopg2.Error:
+        pass
+
+
+class ConnectionPool:
+
+    def __init__(self, name, max_size=10, min_size=0, timeout=10.0, max_lifetime=3600.0,
+                 max_idle=600.0, check=True, check_idle=1.0):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError('the pool needs 1 <= max_size and min_size <= max_size')
+        self.name = name
+        self.max_size = max_size
+        self.min_size = min_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check = check
+        self.check_idle = check_idle
+        self.closed = False
+
+        self._condition = threading.Condition()
+        self._idle = deque()  # returned slots, the newest on the right
+        self._in_use = {}  # id(connection) -> slot
+        self._opening = 0
+        self._queue = deque()  # tickets of the threads in _reserve
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.opened = 0
+        self.closes = Counter()  # reason -> connections closed
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def getconn(self, connect):
+        """
+        an idle connection, or a new one from connect() while below max_size
+        """
+        start = monotonic()
+        deadline = start + self.timeout
+        while True:
+            stale = []
+            try:
+                slot = self._reserve(deadline, stale)
+            finally:
+                for expired in stale:
+                    _close(expired.connection)
+            if slot is None:
+                slot = self._open(connect)
+            elif not self._usable(slot):
+                self._discard(slot, 'health_check')
+                continue
+            with self._condition:
+                waited = monotonic() - start
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            return slot.connection
+
+    def _reserve(self, deadline, stale):
+        """
+        an idle slot, or None to open a new connection. the idle slots to
+        close are added to `stale`
+        """
+        with self._condition:
+            if self.closed:
+                raise psycopg2.OperationalError(f'connection pool {self.name} is closed')
+            stale.extend(self._expire_idle())
+            # first come first served: a thread that just gave its connection
+            # back cannot take it again ahead of the ones already waiting
+            ticket = object()
+            self._queue.append(ticket)
+            try:
+                while True:
+                    if self._queue[0] is ticket:
+                        if self._idle:
+                            # counted in use from here, also while its health is checked
+                            slot = self._idle.pop()
+                            self._in_use[id(slot.connection)] = slot
+                            return slot
+                        if self.size < self.max_size:
+                            self._opening += 1
+                            return None
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f'no connection of pool {self.name} freed within {self.timeout}s '
+                            f'({self.max_size} in use)')
+                    self._condition.wait(remaining)
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+    def _expire_idle(self):
+        # called with the lock held, the oldest returned slots are on the left
+        stale = []
+        now = monotonic()
+        while (self._idle and self.size > self.min_size
+               and now - self._idle[0].returned > self.max_idle):
+            stale.append(self._idle.popleft())
+            self.closes['idle'] += 1
+        return stale
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify_all()
+            raise
+        slot = _Slot(connection, self.max_lifetime)
+        with self._condition:
+            self._opening -= 1
+            self.opened += 1
+            self._in_use[id(connection)] = slot
+        return slot
+
+    def _usable(self, slot):
+        connection = slot.connection
+        if connection.closed:
+            return False
+        if not self.check or monotonic() - slot.returned <= self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, slot, reason):
+        _close(slot.connection)
+        with self._condition:
+            del self._in_use[id(slot.connection)]
+            self.closes[reason] += 1
+            self._condition.notify_all()
+
+    def putconn(self, connection):
+        """
+        gives a connection back, rolled back, or closes it when it cannot be reused
+        """
+        # the slot stays counted in use until it is idle or closed
+        with self._condition:
+            slot = self._in_use.get(id(connection))
+        if slot is None:
+            _close(connection)
+            return
+
+        reason = None
+        if connection.closed:
+            reason = 'broken'
+        elif monotonic() >= slot.expires:
+            reason = 'lifetime'
+        else:
+            status = connection.info.transaction_status
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                reason = 'broken'
+            elif status != TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    reason = 'broken'
+
+        with self._condition:
+            del self._in_use[id(connection)]
+            if reason is None and self.closed:
+                reason = 'pool_closed'
+            if reason is None:
+                slot.returned = monotonic()
+                self._idle.append(slot)
+            else:
+                self.closes[reason] += 1
+            self._condition.notify_all()
+        if reason is not None:
+            _close(connection)
+
+    def close(self):
+        """
+        closes the idle connections, the ones in use are closed when given back
+        """
+        with self._condition:
+            self.closed = True
+            idle, self._idle = list(self._idle), deque()
+            self.closes['pool_closed'] += len(idle)
+            self._condition.notify_all()
+        for slot in idle:
+            _close(slot.connection)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'name': self.name,
+                'max_size': self.max_size,
+                'min_size': self.min_size,
+                'size': self.size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': len(self._queue),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_avg': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'wait_ms_max': round(self.wait_max * 1000, 3),
+                'connections_opened': self.opened,
+                'connections_closed': dict(self.closes),
+            }
+
+
+# pools of this process by (pid, alias, database, user, host, port). the pid
+# keeps a forked worker from sharing the sockets of a pool opened before the fork
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, options):
+    key = (os.getpid(), *key)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            alias, database = key[1], key[2]
+            pool = _pools[key] = ConnectionPool(f'{alias}:{database}', **{**DEFAULTS, **options})
+        return pool
+
+
+def close_pools(database=None):
+    """
+    closes the pools of this process (to one database only if given)
+    """
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items()
+                 if key[0] == os.getpid() and (database is None or key[2] == database)]
+        for key, _pool in pools:
+            del _pools[key]
+    for _key, pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == os.getpid()]
+    return [pool.stats() for pool in pools]
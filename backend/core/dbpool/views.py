@@ -0,0 +1,32 @@
+import os
+from django.conf import settings
+from django.db import connection
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .pool import pool_stats
+
+
+class PoolStatsView(APIView):
+    """
+    connection pool of the worker that served the request and the
+    connections of the database server (admin only)
+    GET /api/v1/db/pool/stats/
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() GROUP BY 1"
+            )
+            server = dict(cursor.fetchall())
+            cursor.execute('SHOW max_connections')
+            max_connections = int(cursor.fetchone()[0])
+        return Response({
+            'mode': settings.DB_CONNECTIONS,
+            'pid': os.getpid(),
+            'pools': pool_stats(),
+            'server': {'connections': server, 'max_connections': max_connections},
+        })
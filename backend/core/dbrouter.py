@@ -0,0 +1,152 @@
+"""
+read replica routing with read-your-writes.
+
+views that opt in with `replica_reads = True` (the employee, company and
+department viewsets and the async views) read from a replica on GET /
+HEAD / OPTIONS, one replica of DATABASE_REPLICAS picked at random per
+request so its queries see the same snapshot. writes, reads inside a
+transaction, other views and code outside of requests use default.
+
+a successful write (any other method answered below 400) pins the client
+to the primary for DB_REPLICA_PIN_SECONDS so it reads its own changes
+despite the replication lag. the pin is a timestamp sent back as a
+cookie and an X-DB-Pinned-Until header, a client returns either one
+(the cookie for browsers on the same site, the header for api clients).
+it only ever moves reads to the primary, so it is not signed, but it
+cannot pin for longer than one window.
+the responses stored by the response cache are read from the primary
+(read_from_primary), cache hits cost no database read at all.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pinned_until'
+PIN_HEADER = 'X-DB-Pinned-Until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadRouting:
+    """
+    the database the reads of the current request go to (None: default)
+    """
+    __slots__ = ('alias',)
+
+    def __init__(self):
+        self.alias = None
+
+
+_routing = ContextVar('db_read_routing', default=None)
+
+
+def read_alias():
+    routing = _routing.get()
+    return routing.alias if routing is not None else None
+
+
+def read_from_primary():
+    """
+    the remaining reads of the current request go to the primary: a response
+    about to be cached (core.cache) must not be built from a lagging replica,
+    it would be served under the new generation to every client, the pinned
+    writer included
+    """
+    routing = _routing.get()
+    if routing is not None:
+        routing.alias = None
+
+
+class ReplicaRouter:
+    """
+    always answers with an alias: django would otherwise save an object
+    loaded from a replica back to that replica
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def pinned_until(request):
+    """
+    the pin the client sent back (cookie or header), 0 when there is none
+    """
+    value = request.headers.get(PIN_HEADER) or request.COOKIES.get(PIN_COOKIE)
+    try:
+        until = float(value)
+    except (TypeError, ValueError):
+        return 0
+    return min(until, time.time() + settings.DB_REPLICA_PIN_SECONDS)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    scopes the read routing to the request and pins the clients that wrote
+    (a no-op without DATABASE_REPLICAS)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        token = _routing.set(ReadRouting())
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        token = _routing.set(ReadRouting())
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = _routing.get()
+        if routing is None or request.method not in SAFE_METHODS or pinned_until(request) > time.time():
+            return None
+        # drf views expose their class as .cls, django class based views as .view_class
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if getattr(view_class, 'replica_reads', False):
+            routing.alias = random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def pin(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return response
+        window = settings.DB_REPLICA_PIN_SECONDS
+        until = str(int(time.time() + window) + 1)
+        response[PIN_HEADER] = until
+        response.set_cookie(PIN_COOKIE, until, max_age=window, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,560 @@
+"""
+index audit of the list endpoints (postgres only).
+
+every collection GET endpoint of the url conf is called in process with
+each combination of its filterset filters, search modes and ?ordering=
+values, first page and next (cursor) page. the SELECTs it runs are
+captured and each distinct query shape is run once more under
+EXPLAIN (ANALYZE, BUFFERS). the plans are checked for:
+- sequential scans of tables with at least `min_rows` rows
+- index scans that throw away most of what they read (Rows Removed by Filter)
+- sorts that spill to disk
+and a composite index is derived from the scan filter (equality columns
+first) followed by the sort keys, the index order or the range column.
+
+filter values are sampled from the data (the most common value, the worst
+case for a btree), filters without a model field take theirs from the
+filterset's `audit_values` and are skipped otherwise.
+"""
+import itertools
+import re
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection, connections, models, transaction
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django_filters.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import SearchFilter
+from rest_framework.generics import GenericAPIView
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.instrumentation import query_shape
+from core.search import SEARCH_MODES, PostgresSearchFilter
+
+# an index scan is flagged when it discards this many rows, and more than
+# it returns
+WASTED_ROWS = 1000
+
+_CONJUNCT = re.compile(r'^\(*(?:\w+\.)?"?(\w+)"?\)?(?:::[\w ]+)?\s*(=|<=|>=|<|>)\s')
+_RANGE_OPERATORS = ('<', '>', '<=', '>=')
+
+
+@dataclass
+class Endpoint:
+    path: str
+    view_class: type
+    callback: object
+
+
+@dataclass
+class Combination:
+    endpoint: Endpoint
+    params: dict
+
+    def __str__(self):
+        query = '&'.join(f'{key}={value}' for key, value in self.params.items())
+        return f"{self.endpoint.path}{'?' + query if query else ''}"
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    """
+    composite index: the equality columns (in any order) then the ordered ones
+    """
+    table: str
+    equal: tuple
+    order: tuple  # ((column, descending), ...)
+
+    @property
+    def columns(self):
+        return tuple((column, False) for column in self.equal) + self.order
+
+    def served_by(self, index_columns):
+        """
+        an index with these ((column, descending), ...) serves the same
+        queries (a btree is also scanned backward)
+        """
+        size = len(self.equal)
+        if len(index_columns) < size + len(self.order):
+            return False
+        if {column for column, _desc in index_columns[:size]} != set(self.equal):
+            return False
+        tail = tuple(index_columns[size:size + len(self.order)])
+        return tail in (self.order, _flip(self.order))
+
+
+@dataclass
+class Finding:
+    kind: str  # seq_scan | wasted_index_scan | disk_sort
+    table: str
+    detail: str
+    suggestion: Suggestion = None
+
+
+@dataclass
+class QueryAudit:
+    sql: str
+    params: tuple
+    combinations: list = field(default_factory=list)
+    execution_ms: float = 0.0
+    shared_hit: int = 0
+    shared_read: int = 0
+    temp_written: int = 0
+    findings: list = field(default_factory=list)
+
+
+def collection_endpoints(patterns=None, namespace=None):
+    """
+    the GET list endpoints of the url conf (viewset list actions and list views)
+    """
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            nested = namespace
+            if pattern.namespace:
+                nested = f'{namespace}:{pattern.namespace}' if namespace else pattern.namespace
+            yield from collection_endpoints(pattern.url_patterns, nested)
+            continue
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        view_class = getattr(pattern.callback, 'cls', None)
+        if view_class is None or not issubclass(view_class, GenericAPIView):
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        handler = actions.get('get') if actions is not None else 'list'
+        if handler != 'list' or not hasattr(view_class, 'list') or pattern.pattern.regex.groups:
+            continue
+        name = f'{namespace}:{pattern.name}' if namespace else pattern.name
+        yield Endpoint(reverse(name), view_class, pattern.callback)
+
+
+def _view(endpoint, request):
+    view = endpoint.view_class()
+    view.request = Request(request)
+    view.args, view.kwargs = (), {}
+    view.format_kwarg = None
+    view.action = 'list'
+    return view
+
+
+def _is_field(model, field_name):
+    # method filters on a model field (e.g. ?department=, which adds its company) are sampled too
+    try:
+        return model._meta.get_field(field_name).concrete
+    except FieldDoesNotExist:
+        return False
+
+
+def _most_common(model, field_name):
+    row = (model._default_manager.order_by().values(field_name)
+           .annotate(_rows=models.Count('pk')).order_by('-_rows').first())
+    return row[field_name] if row else None
+
+
+def filter_dimensions(endpoint, request):
+    """
+    ({filter: sample value}, [ordering values], [search params], [skipped filters])
+    """
+    view = _view(endpoint, request)
+    queryset = view.get_queryset()
+    model = queryset.model
+    filters, orderings, searches, skipped = {}, [], [], []
+
+    if DjangoFilterBackend in view.filter_backends:
+        filterset_class = DjangoFilterBackend().get_filterset_class(view, queryset)
+        audit_values = getattr(filterset_class, 'audit_values', {}) if filterset_class else {}
+        for name, filter_ in (filterset_class.base_filters.items() if filterset_class else ()):
+            if isinstance(filter_, OrderingFilter) or name == 'ordering':
+                orderings = [value for value, _label in filter_.extra.get('choices', ())]
+            elif name in audit_values:
+                filters[name] = audit_values[name]
+            elif filter_.method is None or _is_field(model, filter_.field_name):
+                value = _most_common(model, filter_.field_name)
+                if value is not None:
+                    filters[name] = value
+            else:
+                skipped.append(name)
+
+    search_backend = next((backend for backend in view.filter_backends
+                           if issubclass(backend, SearchFilter)), None)
+    search_fields = getattr(view, 'search_fields', None)
+    if search_backend and search_fields:
+        column = search_fields[0].lstrip('^=@$')
+        sample = queryset.order_by('pk').values_list(column, flat=True).first() or ''
+        term = (sample.split() or [''])[0]
+        if term:
+            if issubclass(search_backend, PostgresSearchFilter):
+                for mode in SEARCH_MODES:
+                    value = term[:3] if mode == 'prefix' else term
+                    searches.append({'search': value, search_backend.search_mode_param: mode})
+            else:
+                searches.append({'search': term})
+    return filters, orderings, searches, skipped
+
+
+def combinations(endpoint, request, max_filters=2):
+    filters, orderings, searches, skipped = filter_dimensions(endpoint, request)
+    combos = []
+    for size in range(min(max_filters, len(filters)) + 1):
+        for names in itertools.combinations(filters, size):
+            for search in [{}] + searches:
+                for ordering in [None] + orderings:
+                    params = {name: filters[name] for name in names}
+                    params.update(search)
+                    if ordering:
+                        params['ordering'] = ordering
+                    combos.append(Combination(endpoint, params))
+    return combos, skipped
+
+
+class _Capture:
+    """
+    execute wrapper keeping the SELECTs (the EXPLAINs of estimate_count excluded)
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def run_combination(combination, user, page_size):
+    """
+    the SELECTs of the first and the next page of a combination
+    """
+    factory = APIRequestFactory()
+    capture = _Capture()
+    params = {**combination.params, 'page_size': page_size}
+    url = combination.endpoint.path
+    for _page in range(2):
+        request = factory.get(url, params)
+        force_authenticate(request, user=user)
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(capture))
+            response = combination.endpoint.callback(request)
+            if hasattr(response, 'render'):
+                response.render()
+        following = response.data.get('next') if isinstance(response.data, dict) else None
+        if response.status_code != 200 or not following:
+            break
+        url, params = following, {}
+    return response.status_code, capture.queries
+
+
+def walk(node, ancestors=()):
+    yield node, ancestors
+    for child in node.get('Plans', ()):
+        yield from walk(child, ancestors + (node,))
+
+
+def split_conjuncts(condition):
+    """
+    the top level AND terms of a plan condition
+    """
+    condition = condition.strip()
+    while condition.startswith('(') and _closing(condition, 0) == len(condition) - 1:
+        condition = condition[1:-1].strip()
+    terms, depth, start = [], 0, 0
+    for index, char in enumerate(condition):
+        depth += char == '('
+        depth -= char == ')'
+        if depth == 0 and condition.startswith(' AND ', index):
+            terms.append(condition[start:index])
+            start = index + 5
+    terms.append(condition[start:])
+    return [term.strip() for term in terms if term.strip()]
+
+
+def _closing(text, start):
+    depth = 0
+    for index in range(start, len(text)):
+        depth += text[index] == '('
+        depth -= text[index] == ')'
+        if depth == 0:
+            return index
+    return -1
+
+
+def condition_columns(condition):
+    """
+    (equality columns, range columns) compared to a value in a plan condition
+    """
+    equal, ranges = [], []
+    for term in split_conjuncts(condition or ''):
+        if ' OR ' in term:
+            continue
+        match = _CONJUNCT.match(term)
+        if not match:
+            continue
+        column, operator = match.groups()
+        target = ranges if operator in _RANGE_OPERATORS else equal
+        if column not in equal + ranges:
+            target.append(column)
+    return equal, ranges
+
+
+def sort_columns(keys, table):
+    """
+    ((column, descending), ...) of a Sort Key on `table`, None if it sorts on anything else
+    """
+    columns = []
+    for key in keys:
+        match = re.match(rf'^(?:{re.escape(table)}\.)?"?(\w+)"?( DESC)?$', key.strip())
+        if not match:
+            return None
+        columns.append((match.group(1), bool(match.group(2))))
+    return tuple(columns)
+
+
+def _flip(order):
+    return tuple((column, not descending) for column, descending in order)
+
+
+def suggest(table, equal, order):
+    equal = tuple(dict.fromkeys(equal))
+    order = tuple((column, descending) for column, descending in order if column not in equal)
+    if not equal and not order:
+        return None
+    return Suggestion(table, equal, order)
+
+
+def analyze_plan(plan, table_rows, table_indexes, min_rows):
+    findings = []
+    for node, ancestors in walk(plan):
+        table = node.get('Relation Name')
+        node_type = node['Node Type']
+        sort = next((parent for parent in reversed(ancestors)
+                     if parent['Node Type'] in ('Sort', 'Incremental Sort')), None)
+
+        if node_type in ('Sort', 'Incremental Sort') and node.get('Sort Space Type') == 'Disk':
+            findings.append(Finding(
+                'disk_sort', '', f"{node.get('Sort Method')} on {', '.join(node['Sort Key'])} "
+                                 f"({node.get('Sort Space Used')}kB on disk)"))
+
+        if node_type == 'Seq Scan' and table in table_rows and table_rows[table] >= min_rows:
+            equal, ranges = condition_columns(node.get('Filter'))
+            order = sort_columns(sort['Sort Key'], table) if sort else None
+            findings.append(Finding(
+                'seq_scan', table,
+                f"{node.get('Actual Rows')} rows kept, {node.get('Rows Removed by Filter', 0)} removed"
+                f"{' by ' + node['Filter'] if node.get('Filter') else ''}",
+                suggest(table, equal, order or [(column, False) for column in ranges[:1]])))
+
+        if node_type in ('Index Scan', 'Index Only Scan') and table in table_rows:
+            removed = node.get('Rows Removed by Filter', 0)
+            if removed >= WASTED_ROWS and removed > node.get('Actual Rows', 0) * node.get('Actual Loops', 1):
+                filter_equal, filter_ranges = condition_columns(node.get('Filter'))
+                index_equal, _ = condition_columns(node.get('Index Cond'))
+                order = table_indexes.get(table, {}).get(node['Index Name'], ())
+                if node.get('Scan Direction') == 'Backward':
+                    order = _flip(order)
+                findings.append(Finding(
+                    'wasted_index_scan', table,
+                    f"{node['Index Name']} kept {node.get('Actual Rows')} rows, removed {removed} "
+                    f"by {node.get('Filter')}",
+                    suggest(table, index_equal + filter_equal,
+                            order or [(column, False) for column in filter_ranges[:1]])))
+    return findings
+
+
+def table_statistics(cursor):
+    cursor.execute(
+        "SELECT c.relname, c.reltuples::bigint FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema()")
+    return dict(cursor.fetchall())
+
+
+def table_indexes(cursor, tables):
+    """
+    {table: {index name: ((column, descending), ...)}}
+    """
+    indexes = {}
+    for table in tables:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        indexes[table] = {
+            name: tuple((column, order == 'DESC')
+                        for column, order in zip(info['columns'], info.get('orders') or ['ASC'] * len(info['columns'])))
+            for name, info in constraints.items() if info['index'] and all(info['columns'])
+        }
+    return indexes
+
+
+def explain(sql, params):
+    """
+    runs the query under EXPLAIN (ANALYZE, BUFFERS) in a rolled back savepoint
+    """
+    with connection.cursor() as cursor:
+        sid = transaction.savepoint()
+        try:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+            result = cursor.fetchone()[0]
+        finally:
+            transaction.savepoint_rollback(sid)
+    return result[0] if isinstance(result, list) else result
+
+
+class IndexAudit:
+
+    def __init__(self, max_filters=2, page_size=50, min_rows=10000, endpoints=None):
+        self.max_filters = max_filters
+        self.page_size = page_size
+        self.min_rows = min_rows
+        self.only = endpoints
+        self.skipped = {}
+        self.errors = []
+        self.queries = {}
+
+    def user(self):
+        # never saved, force_authenticate only needs an authenticated staff user
+        return get_user_model()(is_staff=True, is_superuser=True, is_active=True)
+
+    def endpoints(self):
+        seen = set()
+        for endpoint in collection_endpoints():
+            if endpoint.path in seen or (self.only and not any(name in endpoint.path for name in self.only)):
+                continue
+            seen.add(endpoint.path)
+            yield endpoint
+
+    def run(self, progress=None):
+        user = self.user()
+        factory = APIRequestFactory()
+        with transaction.atomic():
+            for endpoint in self.endpoints():
+                combos, skipped = combinations(endpoint, factory.get(endpoint.path), self.max_filters)
+                if skipped:
+                    self.skipped[endpoint.path] = skipped
+                for combination in combos:
+                    status_code, queries = run_combination(combination, user, self.page_size)
+                    if status_code != 200:
+                        self.errors.append(f'{combination}: {status_code}')
+                        continue
+                    for sql, params in queries:
+                        shape = query_shape(sql)
+                        audit = self.queries.setdefault(shape, QueryAudit(sql, params))
+                        audit.combinations.append(combination)
+                    if progress:
+                        progress(combination, len(queries))
+            self.explain_queries()
+            transaction.set_rollback(True)
+        return self
+
+    def explain_queries(self):
+        with connection.cursor() as cursor:
+            rows = table_statistics(cursor)
+            indexes = table_indexes(cursor, rows)
+        for audit in self.queries.values():
+            plan = explain(audit.sql, audit.params)
+            # the buffers of the top node include the ones of its children
+            audit.execution_ms = plan.get('Execution Time', 0.0)
+            audit.shared_hit = plan['Plan'].get('Shared Hit Blocks', 0)
+            audit.shared_read = plan['Plan'].get('Shared Read Blocks', 0)
+            audit.temp_written = plan['Plan'].get('Temp Written Blocks', 0)
+            audit.findings = [
+                finding for finding in analyze_plan(plan['Plan'], rows, indexes, self.min_rows)
+                if not (finding.suggestion and any(finding.suggestion.served_by(columns)
+                                                   for columns in indexes[finding.table].values()))
+            ]
+
+    def flagged(self):
+        return [audit for audit in self.queries.values() if audit.findings]
+
+    def suggestions(self):
+        """
+        {Suggestion: number of flagged queries it serves}, a suggestion
+        served by a longer one is merged into it
+        """
+        counts = Counter(finding.suggestion for audit in self.flagged()
+                         for finding in audit.findings if finding.suggestion)
+        merged = Counter()
+        for suggestion, count in counts.most_common():
+            target = next((other for other in sorted(counts, key=lambda other: -len(other.columns))
+                           if other.table == suggestion.table and suggestion.served_by(other.columns)),
+                          suggestion)
+            merged[target] += count
+        return merged
+
+
+def model_for_table(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def index_for(model, columns):
+    by_column = {model_field.column: model_field.name for model_field in model._meta.concrete_fields}
+    if any(column not in by_column for column, _desc in columns):
+        return None
+    index = models.Index(fields=[f"{'-' if desc else ''}{by_column[column]}" for column, desc in columns],
+                         name='')
+    index.set_name_with_model(model)
+    return index
+
+
+def suggested_indexes(suggestions):
+    """
+    {app_label: [(model, models.Index, flagged queries served)]} of the
+    suggestions that map to model fields, most useful first
+    """
+    result = {}
+    for suggestion, count in suggestions.most_common():
+        model = model_for_table(suggestion.table)
+        index = index_for(model, suggestion.columns) if model else None
+        if index is not None:
+            result.setdefault(model._meta.app_label, []).append((model, index, count))
+    return result
+
+
+MIGRATION_TEMPLATE = '''# generated by manage.py audit_indexes
+# also add the indexes to the Meta.indexes of the models, makemigrations
+# would remove them otherwise
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction, writes are not blocked
+    atomic = False
+
+    dependencies = [
+{dependencies}
+    ]
+
+    operations = [
+{operations}
+    ]
+'''
+
+
+def migration_source(app_label, entries):
+    """
+    (migration name, source) adding the indexes of one app
+    """
+    loader = MigrationLoader(connection, ignore_no_migrations=True)
+    leaves = loader.graph.leaf_nodes(app_label)
+    number = (MigrationAutodetector.parse_number(leaves[0][1]) or 0) + 1 if leaves else 1
+    dependencies = '\n'.join(f'        ({app!r}, {name!r}),' for app, name in leaves)
+    operations = '\n'.join(
+        f'        AddIndexConcurrently(\n'
+        f'            model_name={model._meta.model_name!r},\n'
+        f'            index=models.Index(fields={index.fields!r}, name={index.name!r}),\n'
+        f'        ),'
+        for model, index, _count in entries
+    )
+    return (f'{number:04d}_audit_indexes',
+            MIGRATION_TEMPLATE.format(dependencies=dependencies, operations=operations))
@@ -0,0 +1,176 @@
+"""
+per request sql instrumentation (SQL_INSTRUMENTATION=True).
+
+every query of a request goes through a database execute wrapper that
+counts and times it and groups it by shape (the sql with its parameter
+lists collapsed). the response gets a Server-Timing header and one json
+log line on the core.instrumentation logger, logged as a warning when a
+shape repeats N_PLUS_ONE_THRESHOLD times or more (an N+1 signature) or
+when the view exceeds its query budget.
+
+budgets are declared per viewset action with @query_budget(n). with
+QUERY_BUDGET_ENFORCE=True an exceeded budget raises QueryBudgetExceeded
+instead of being logged, which is what the test helper
+core.testing.enforce_query_budgets turns on.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# "IN (%s, %s, %s)" and multi row VALUES lists collapse to one shape
+_PARAM_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def query_shape(sql):
+    """
+    the query with its parameter lists and inline numbers collapsed, two
+    queries with the same shape only differ by their values
+    """
+    return _NUMBER.sub('N', _PARAM_LIST.sub('(%s...)', sql))
+
+
+def query_budget(queries):
+    """
+    declares the maximum number of queries of a viewset action
+    (checked by QueryInstrumentationMiddleware)
+    """
+    def decorator(view_method):
+        view_method.query_budget = queries
+        return view_method
+    return decorator
+
+
+def view_query_budget(view_func, method):
+    """
+    budget declared on the action (viewsets) or handler (APIView) that
+    view_func dispatches the http method to, if any
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return None
+    method = method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    handler = getattr(view_class, actions.get(method, method), None)
+    return getattr(handler, 'query_budget', None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats:
+    """
+    execute wrapper collecting the queries of one request
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    counts / times the sql of every request when SQL_INSTRUMENTATION is on
+    (a no-op otherwise). queries issued while a streaming response is
+    consumed happen after the middleware returned and are not counted
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'SQL_INSTRUMENTATION', False):
+            return self.get_response(request)
+
+        stats = QueryStats()
+        request._query_budget = None
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.wrap_connections(stack, stats)
+            response = self.get_response(request)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'SQL_INSTRUMENTATION', False):
+            return await self.get_response(request)
+
+        # the async orm runs the queries of a request on one thread, the
+        # wrappers go on its connections (gather() threads are not counted)
+        stats = QueryStats()
+        request._query_budget = None
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self.wrap_connections)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def wrap_connections(self, stack, stats):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+
+    def finish(self, request, response, stats, total):
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", '
+            f'app;dur={total * 1000:.2f}'
+        )
+        self.report(request, response, stats, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(settings, 'SQL_INSTRUMENTATION', False):
+            request._query_budget = view_query_budget(view_func, request.method)
+
+    def report(self, request, response, stats, total):
+        budget = getattr(request, '_query_budget', None)
+        over_budget = budget is not None and stats.count > budget
+        repeated = stats.repeated(settings.N_PLUS_ONE_THRESHOLD)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(stats.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'budget': budget,
+            'repeated': [{'shape': shape, 'count': count} for shape, count in repeated],
+        }
+        if over_budget and settings.QUERY_BUDGET_ENFORCE:
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path} ran {stats.count} queries, '
+                f'its budget is {budget}: {json.dumps(record["repeated"])}'
+            )
+        level = logging.WARNING if over_budget or repeated else logging.INFO
+        logger.log(level, json.dumps(record))
@@ -0,0 +1,273 @@
+"""
+keyset (cursor) pagination shared by every list endpoint.
+
+pagination is opt-in: a list is only paginated when the client sends
+?cursor= or ?page_size=, otherwise the whole list is returned as before
+(views that never return a whole list set `always_paginate = True`).
+pages are selected with a WHERE on the ordering columns (no OFFSET) so a
+deep page costs the same as the first one, and the total can be read from
+the postgres planner statistics instead of running COUNT(*).
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .asyncviews import gather
+
+
+def planner_estimate(queryset):
+    """
+    rows postgres expects the queryset to return (EXPLAIN, nothing is scanned)
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_count(queryset, exact_below=1000):
+    """
+    (count, exact) of a queryset.
+    on postgres this is the planner estimate (planner_estimate). small
+    estimates are confirmed with a count limited to exact_below rows (the
+    planner is least accurate there): below it the count is exact, a stale
+    estimate of a table that grew since costs at most exact_below rows,
+    not a full COUNT(*).
+    """
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count(), True
+
+    estimate = planner_estimate(queryset)
+    if estimate < exact_below:
+        count = queryset[:exact_below].count()
+        if count < exact_below:
+            return count, True
+        return max(estimate, count), False
+    return estimate, False
+
+
+class KeysetPagination(BasePagination):
+    """
+    keyset pagination over an explicit ordering.
+    views declare the ordering with `keyset_ordering` (model field attnames,
+    '-' for descending), the last field must make the ordering unique.
+    query params:
+    - cursor: opaque position returned as next / previous
+    - page_size: rows per page (capped at max_page_size)
+    - count: approximate (default) | exact | none. the response tells
+      whether the count is approximate, a small approximate one is exact
+    """
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    count_modes = ('approximate', 'exact', 'none')
+    default_count_mode = 'approximate'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        self.count = self.get_count(queryset, request)
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset of the async views, the count and the rows are
+        read at the same time
+        """
+        page_queryset = self.page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        self.count, rows = await gather(
+            lambda: self.get_count(queryset, request),
+            lambda: list(page_queryset),
+        )
+        return self.set_page(rows)
+
+    def page_queryset(self, queryset, request, view=None):
+        """
+        the rows of the requested page plus one (to know if there is a next
+        page), None when the list is not paginated
+        """
+        params = request.query_params
+        if (not getattr(view, 'always_paginate', False)
+                and self.cursor_query_param not in params
+                and self.page_size_query_param not in params):
+            return None  # pagination is opt-in
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+        self.cursor_values, self.reverse = self.decode_cursor(request, queryset)
+
+        ordering = [self._flip(field) for field in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor_values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, self.cursor_values))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor_values is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'count': self.count,
+            'count_is_approximate': self.count_mode == 'approximate',
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset, view):
+        """
+        the view's keyset_ordering, else the model ordering with the pk appended.
+        ranked search results (search_rank annotation) are ordered by rank first
+        """
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering:
+            ordering = list(ordering)
+        else:
+            ordering = [field for field in queryset.model._meta.ordering if isinstance(field, str)]
+            pk = queryset.model._meta.pk.attname
+            if pk not in [field.lstrip('-') for field in ordering]:
+                ordering.append(pk)
+        if 'search_rank' in queryset.query.annotations:
+            ordering.insert(0, '-search_rank')
+        return tuple(ordering)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, self.default_count_mode)
+        self.count_mode = mode if mode in self.count_modes else self.default_count_mode
+        if self.count_mode == 'exact':
+            return queryset.count()
+        if self.count_mode == 'approximate':
+            count, exact = estimate_count(queryset)
+            if exact:
+                self.count_mode = 'exact'
+            return count
+        return None
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def keyset_filter(ordering, values):
+        """
+        rows strictly after `values` in `ordering`:
+        a >= x AND ((a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...)
+        the redundant a >= x becomes an index condition, postgres cannot
+        start an index scan from the OR alone
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        if len(ordering) > 1:
+            first = ordering[0]
+            lookup = 'lte' if first.startswith('-') else 'gte'
+            condition &= Q(**{f'{first.lstrip("-")}__{lookup}': values[0]})
+        return condition
+
+    # cursor encoding
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for field in self.ordering:
+            value = getattr(row, field.lstrip('-'))
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            values.append(value)
+        payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        """
+        (values, reverse) of the cursor sent, the values converted to the
+        types of their ordering fields: a tampered cursor is a 404, not an
+        sql error
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values, reverse = payload['v'], bool(payload['r'])
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [self.cursor_value(queryset, field, value) for field, value in zip(self.ordering, values)]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def cursor_value(queryset, field, value):
+        """
+        value of field (a model field or an annotation) from its json form,
+        the ordering columns are never null
+        """
+        if value is None:
+            raise ValueError('null cursor value')
+        name = field.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        model_field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+        return model_field.to_python(value)
+
+    def _link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        if row is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self._link(None, reverse=True)
+        return self._link(self.page[0], reverse=True)
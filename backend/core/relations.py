@@ -0,0 +1,21 @@
+from django.db.models import QuerySet
+from rest_framework import serializers
+
+
+class LoadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    primary key field that reuses the related object already loaded on the
+    instance being updated (select_related in get_object) when the submitted
+    id did not change, instead of fetching the same row again.
+    only for unfiltered querysets, the reused object skips the queryset
+    """
+
+    def to_internal_value(self, data):
+        instance = getattr(self.root, 'instance', None)
+        if instance is not None and not isinstance(instance, (list, QuerySet)):
+            field = instance._meta.get_field(self.source)
+            if field.is_cached(instance):
+                related = field.get_cached_value(instance)
+                if related is not None and str(related.pk) == str(data):
+                    return related
+        return super().to_internal_value(data)
@@ -0,0 +1,191 @@
+"""
+postgres search backend for the viewsets (drop-in for DRF SearchFilter).
+
+?search=<term>&search_mode=<mode>
+- contains (default): the classic ILIKE '%term%' over search_fields,
+  served by pg_trgm GIN indexes instead of a sequential scan
+- prefix: every word of the term is matched as a prefix of the maintained
+  search_vector (tsvector) column, ranked by ts_rank
+- fulltext: websearch syntax ("quoted phrases", -exclusions, or) against
+  the search_vector column, ranked by ts_rank
+- fuzzy: pg_trgm similarity over search_fields (typos), ranked by similarity
+
+the search_vector column is filled by a database trigger and the indexes
+are created by install_search_support (post_migrate), so every write path
+(save, bulk import, COPY) keeps it current without extra queries.
+on other databases, or without pg_trgm, the modes fall back to contains.
+"""
+import logging
+import re
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Greatest, Upper
+from rest_framework import filters
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'simple'  # names and emails, no stemming
+SEARCH_MODES = ('contains', 'prefix', 'fulltext', 'fuzzy')
+
+_trigram_available = {}
+
+
+def trigram_available(using):
+    """
+    whether pg_trgm is installed on the database (cached per alias)
+    """
+    if using not in _trigram_available:
+        connection = connections[using]
+        available = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                available = cursor.fetchone() is not None
+        _trigram_available[using] = available
+    return _trigram_available[using]
+
+
+def install_search_support(connection, model, weighted_columns, trigram_columns):
+    """
+    create (idempotently) for model:
+    - the trigger maintaining model.search_vector from weighted_columns
+      ({column: 'A' | 'B' | 'C' | 'D'})
+    - pg_trgm GIN indexes on trigram_columns when the extension is available.
+      they are built on UPPER(column::text), the exact expression django
+      emits for icontains, so both the contains and the fuzzy modes use them
+    the GIN index on search_vector itself is declared in the model Meta
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    table = model._meta.db_table
+    quote = connection.ops.quote_name
+    document = " || ".join(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.{quote(column)}, '')), '{weight}')"
+        for column, weight in weighted_columns.items()
+    )
+    function = f'{table}_search_vector_update'
+    trigger = f'{table}_search_vector_trigger'
+    columns = ', '.join(quote(column) for column in weighted_columns)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {document};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger} ON {quote(table)}')
+        cursor.execute(f"""
+            CREATE TRIGGER {trigger}
+            BEFORE INSERT OR UPDATE OF {columns} ON {quote(table)}
+            FOR EACH ROW EXECUTE FUNCTION {function}()
+        """)
+        # backfill rows written before the trigger existed
+        first = quote(next(iter(weighted_columns)))
+        cursor.execute(f'UPDATE {quote(table)} SET {first} = {first} WHERE search_vector IS NULL')
+
+    if not _install_trigram(connection):
+        logger.warning('pg_trgm is not available, %s search falls back to sequential ILIKE', table)
+        return
+    with connection.cursor() as cursor:
+        for column in trigram_columns:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_idx '
+                f'ON {quote(table)} USING gin ((UPPER({quote(column)}::text)) gin_trgm_ops)'
+            )
+
+
+def _install_trigram(connection):
+    _trigram_available.pop(connection.alias, None)
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return False
+    return True
+
+
+def prefix_query(term):
+    """
+    'jo sm' -> 'jo:* & sm:*' (only word characters are kept, so the raw
+    tsquery can never be malformed)
+    """
+    words = re.findall(r'\w+', term)
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def ranked(expression):
+    """
+    ts_rank / similarity return float4, cast to float8 so the rank survives
+    the round trip through a pagination cursor exactly
+    """
+    return Cast(expression, output_field=FloatField())
+
+
+class PostgresSearchFilter(filters.SearchFilter):
+    """
+    search backend with contains / prefix / fulltext / fuzzy modes,
+    relevance ranked (the rank is exposed as the search_rank annotation,
+    which keyset pagination orders by first)
+    """
+    search_mode_param = 'search_mode'
+    default_mode = 'contains'
+
+    def get_search_mode(self, request):
+        mode = request.query_params.get(self.search_mode_param, self.default_mode)
+        return mode if mode in SEARCH_MODES else self.default_mode
+
+    def filter_queryset(self, request, queryset, view):
+        term = ' '.join(self.get_search_terms(request))
+        mode = self.get_search_mode(request)
+        search_fields = self.get_search_fields(view, request)
+        if not term or not search_fields or mode == 'contains':
+            return super().filter_queryset(request, queryset, view)
+
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        if mode == 'fuzzy':
+            if not trigram_available(queryset.db):
+                return super().filter_queryset(request, queryset, view)
+            return self.fuzzy(queryset, search_fields, term)
+        return self.fulltext(queryset, term, prefix=mode == 'prefix')
+
+    @staticmethod
+    def fulltext(queryset, term, prefix=False):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        if prefix:
+            raw = prefix_query(term)
+            if not raw:
+                return queryset.none()
+            query = SearchQuery(raw, search_type='raw', config=SEARCH_CONFIG)
+        else:
+            query = SearchQuery(term, search_type='websearch', config=SEARCH_CONFIG)
+        return (queryset
+                .filter(search_vector=query)
+                .annotate(search_rank=ranked(SearchRank(F('search_vector'), query)))
+                .order_by('-search_rank', 'pk'))
+
+    @staticmethod
+    def fuzzy(queryset, search_fields, term):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        # UPPER(field) matches the trigram index expression
+        fields = [field.lstrip('^=@$') for field in search_fields]
+        aliases = {f'_upper_{field}': Upper(field) for field in fields}
+        condition = Q()
+        for alias in aliases:
+            condition |= Q(**{f'{alias}__trigram_similar': term.upper()})
+        similarities = [TrigramSimilarity(alias, term.upper()) for alias in aliases]
+        rank = similarities[0] if len(similarities) == 1 else Greatest(*similarities)
+        return (queryset
+                .alias(**aliases)
+                .filter(condition)
+                .annotate(search_rank=ranked(rank))
+                .order_by('-search_rank', 'pk'))
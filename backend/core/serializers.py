@@ -0,0 +1,140 @@
+"""
+sparse fieldsets and opt-in expansion for the model serializers.
+
+?fields=id,name,company_details.name   only these fields (dotted names reach
+                                       into nested objects)
+?expand=department_details.company_details
+                                       nested objects to embed
+
+without either parameter a serializer keeps its full legacy shape. as soon
+as one is sent, the nested objects declared in Meta.expandable_fields are
+only embedded when named in ?expand= or ?fields=, and fields that are not
+requested are dropped before anything is computed. only reads are shaped:
+a write keeps every input field, whatever its query string says.
+SparseFieldsViewMixin narrows the queryset (select_related / only()) to
+the requested shape.
+"""
+from rest_framework import permissions, serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_field_tree(value):
+    """
+    'id,company_details.name' -> {'id': {}, 'company_details': {'name': {}}}
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def requested_shape(request):
+    """
+    (fields tree or None, expand tree) of a request, None when the request
+    asks for the full shape (every write does)
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return None
+    params = request.query_params
+    if FIELDS_PARAM not in params and EXPAND_PARAM not in params:
+        return None
+    fields = parse_field_tree(params[FIELDS_PARAM]) if FIELDS_PARAM in params else None
+    return fields, parse_field_tree(params.get(EXPAND_PARAM, ''))
+
+
+class SparseFieldsMixin:
+    """
+    serializer side of ?fields= / ?expand=.
+    Meta.expandable_fields: nested fields only embedded on request
+    Meta.field_dependencies: {field: (model fields it is computed from)}
+    for the fields whose source is not a model field (properties)
+    """
+
+    def get_shape(self):
+        if hasattr(self, '_sparse_shape'):
+            return self._sparse_shape  # assigned by the parent serializer
+        parent = self.parent
+        if parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return requested_shape(self.context.get('request'))
+        return None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        shape = self.get_shape()
+        if shape is None:
+            return fields
+
+        requested, expand = shape
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        kept = {}
+        for name, field in fields.items():
+            if name in expandable:
+                wanted = name in expand or (requested is not None and name in requested)
+            else:
+                wanted = requested is None or name in requested
+            if not wanted:
+                continue
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, SparseFieldsMixin):
+                subfields = requested.get(name) if requested is not None else None
+                nested._sparse_shape = (subfields or None, expand.get(name, {}))
+            kept[name] = field
+        return kept
+
+    def query_plan(self, prefix=''):
+        """
+        (select_related paths, only() paths) needed to render the kept fields
+        """
+        related, columns = set(), set()
+        model = self.Meta.model
+        dependencies = getattr(self.Meta, 'field_dependencies', {})
+        for name, field in self.fields.items():
+            if name in dependencies:
+                columns.update(prefix + column for column in dependencies[name])
+                continue
+            if field.source == '*':
+                continue
+            path = field.source.split('.')
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, SparseFieldsMixin):
+                related.add(prefix + '__'.join(path))
+                nested_related, nested_columns = nested.query_plan(prefix + '__'.join(path) + '__')
+                related.update(nested_related)
+                columns.add(prefix + '__'.join(path))
+                columns.update(nested_columns)
+            elif len(path) > 1:
+                # company.name -> join company, read company__name
+                related.add(prefix + '__'.join(path[:-1]))
+                columns.add(prefix + path[0])
+                columns.add(prefix + '__'.join(path))
+            elif path[0] in {model_field.name for model_field in model._meta.concrete_fields}:
+                columns.add(prefix + path[0])
+        columns.add(prefix + model._meta.pk.name)
+        return related, columns
+
+
+class SparseFieldsViewMixin:
+    """
+    viewset side of ?fields= / ?expand=: list / retrieve querysets only
+    join and read what the requested shape renders (plus the pagination keys)
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.sparse_actions or requested_shape(self.request) is None:
+            return queryset
+        serializer = self.get_serializer()
+        if not isinstance(serializer, SparseFieldsMixin):
+            return queryset
+        related, columns = serializer.query_plan()
+        columns.update(field.lstrip('-') for field in getattr(self, 'keyset_ordering', ()))
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
@@ -3,10 +3,12 @@ Django settings for core project.
 """
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 import os
 from xml.dom.xmlbuilder import Options
 
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 # this line loads the environment variables
@@ -35,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     # Third party apps
     'rest_framework',
@@ -44,9 +47,15 @@ INSTALLED_APPS = [
     'apps.companies.apps.CompaniesConfig',
     'apps.employees.apps.EmployeesConfig',
     'apps.departments.apps.DepartmentsConfig',
+    'apps.reports.apps.ReportsConfig',
+    'apps.changes.apps.ChangesConfig',
 ]
 
 MIDDLEWARE = [
+    # first, so it sees every query of the request (no-op unless SQL_INSTRUMENTATION)
+    'core.instrumentation.QueryInstrumentationMiddleware',
+    # reads of the opted in views go to a replica unless the client just wrote (no-op without replicas)
+    'core.dbrouter.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Added CORS middleware
@@ -89,17 +98,132 @@ DATABASES = {
     }
 }
 
+# database connections (DB_CONNECTIONS):
+# direct: one new connection per request (default)
+# persistent: one connection per worker thread, reused for DB_CONN_MAX_AGE seconds, health checked
+# pool: per process pool shared by the threads (core.dbpool), at most DB_POOL_MAX_SIZE
+#       connections, a request waits up to DB_POOL_TIMEOUT seconds for one
+DB_CONNECTIONS = os.getenv('DB_CONNECTIONS', 'direct')
+if DB_CONNECTIONS == 'persistent':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    })
+elif DB_CONNECTIONS == 'pool':
+    DATABASES['default'].update({
+        'ENGINE': 'core.dbpool',
+        'CONN_MAX_AGE': 0,  # connections go back to the pool at the end of the request
+        'OPTIONS': {'pool': {
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 0)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 600)),
+            'check': os.getenv('DB_POOL_CHECK', 'True') == 'True',
+            'check_idle': float(os.getenv('DB_POOL_CHECK_IDLE', 1)),
+        }},
+    })
+elif DB_CONNECTIONS != 'direct':
+    raise ImproperlyConfigured(f'DB_CONNECTIONS must be direct, persistent or pool, not {DB_CONNECTIONS!r}')
+
+# async views (core.asyncviews) read the independent parts of a response at the same
+# time, each on a connection of its own: on by default when connections are reused
+ASYNC_CONCURRENT_QUERIES = os.getenv('ASYNC_CONCURRENT_QUERIES', str(DB_CONNECTIONS != 'direct')) == 'True'
+
+# read replicas (core.dbrouter): DB_REPLICA_HOSTS=host[:port],... adds a replica_<n> alias per
+# host with the settings of default (DB_REPLICA_HOSTS=localhost tries it against a single server).
+# GETs of the viewsets read from a replica, a client that wrote reads from the primary for
+# DB_REPLICA_PIN_SECONDS. in tests the replicas mirror default
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['core.dbrouter.ReplicaRouter']
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 10))
+
+# employee table partitioning by company (apps.employees.partitioning), applied post_migrate or by
+# python manage.py partition_employees. '' (off) | hash: EMPLOYEE_PARTITIONS partitions |
+# list: a partition per company, dropped with the company (EMPLOYEE_DELETED_PARTITIONS=detach keeps it)
+EMPLOYEE_PARTITIONING = os.getenv('EMPLOYEE_PARTITIONING', '')
+if EMPLOYEE_PARTITIONING not in ('', 'hash', 'list'):
+    raise ImproperlyConfigured(f'EMPLOYEE_PARTITIONING must be hash, list or empty, not {EMPLOYEE_PARTITIONING!r}')
+EMPLOYEE_PARTITIONS = int(os.getenv('EMPLOYEE_PARTITIONS', 16))
+EMPLOYEE_DELETED_PARTITIONS = os.getenv('EMPLOYEE_DELETED_PARTITIONS', 'drop')
+
+# change stream (apps.changes): GET /api/v1/changes/stream/ polls the change outbox every
+# CHANGES_POLL_INTERVAL seconds per process. a stream ends after CHANGES_STREAM_SECONDS or when
+# CHANGES_STREAM_BUFFER changes wait for it, the client resumes with its Last-Event-ID.
+# python manage.py prune_changes deletes the changes older than CHANGES_RETENTION_HOURS
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', 1))
+CHANGES_HEARTBEAT_SECONDS = float(os.getenv('CHANGES_HEARTBEAT_SECONDS', 15))
+CHANGES_STREAM_SECONDS = float(os.getenv('CHANGES_STREAM_SECONDS', 300))
+CHANGES_STREAM_BUFFER = int(os.getenv('CHANGES_STREAM_BUFFER', 1000))
+CHANGES_RETRY_MILLISECONDS = int(os.getenv('CHANGES_RETRY_MILLISECONDS', 3000))
+CHANGES_RETENTION_HOURS = int(os.getenv('CHANGES_RETENTION_HOURS', 24))
+
+# user provisioning outbox (apps.employees.provisioning): a task whose batch failed is retried
+# PROVISIONING_MAX_ATTEMPTS times, PROVISIONING_RETRY_SECONDS * 2 ** (attempts - 1) apart, then FAILED
+PROVISIONING_MAX_ATTEMPTS = int(os.getenv('PROVISIONING_MAX_ATTEMPTS', 5))
+PROVISIONING_RETRY_SECONDS = float(os.getenv('PROVISIONING_RETRY_SECONDS', 10))
+
+# Cache config based on the .env file
+# CACHE_BACKEND: locmem (per process, default) | file | redis (any redis protocol server)
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',  # needs the redis package
+}
+CACHE_DEFAULT_LOCATIONS = {
+    'locmem': 'brainwise',
+    'file': str(BASE_DIR / '.cache'),
+    'redis': 'redis://127.0.0.1:6379/0',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION') or CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND],
+    }
+}
+# seconds a cached company / department response is kept (writes invalidate it earlier)
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 300))
+
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
+# stateless jwt authentication and its auth state cache
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', 'True') == 'True'
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', 10000))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 30))  # per process layer, seconds
+AUTH_USER_CACHE_SHARED_TTL = int(os.getenv('AUTH_USER_CACHE_SHARED_TTL', 600))  # django cache layer
+
+# per request sql instrumentation (Server-Timing header, N+1 and query budget logs)
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'False') == 'True'
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+QUERY_BUDGET_ENFORCE = False  # raise instead of log, turned on by core.testing
+
+# reports (apps.reports): employee changes show up in the rollups within this many seconds
+REPORTS_MAX_STALENESS = int(os.getenv('REPORTS_MAX_STALENESS', 60))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # stateless mode builds request.user from the token claims (no user query per request)
+        'apps.accounts.authentication.StatelessJWTAuthentication'
+        if JWT_STATELESS_AUTH else
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # opt-in keyset pagination (?cursor= / ?page_size=) on every list endpoint
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
 }
 
 # JWT Settings
@@ -108,11 +232,15 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_LIFETIME', 1))),
     'SIGNING_KEY': os.getenv('JWT_SECRET_KEY', SECRET_KEY),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_USER_CLASS': 'apps.accounts.authentication.ClaimsUser',
 }
 
 # CORS Settings
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', '').split(',')
 CORS_ALLOW_CREDENTIALS = True
+# the read-your-writes pin of core.dbrouter goes back and forth as a header
+CORS_ALLOW_HEADERS = (*default_headers, 'x-db-pinned-until')
+CORS_EXPOSE_HEADERS = ['X-DB-Pinned-Until']
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
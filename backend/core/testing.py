@@ -0,0 +1,59 @@
+"""
+test helpers: query budgets and the fixtures shared by the app tests
+"""
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from apps.accounts.serializers import CustomTokenObtainPairSerializer
+from apps.companies.models import Company
+from apps.departments.models import Department
+from apps.employees.models import Employee
+
+
+def enforce_query_budgets(test):
+    """
+    class or method decorator: every request made by the test runs with
+    sql instrumentation and fails the test (QueryBudgetExceeded) when the
+    view exceeds the budget declared with core.instrumentation.query_budget
+    """
+    return override_settings(SQL_INSTRUMENTATION=True, QUERY_BUDGET_ENFORCE=True)(test)
+
+
+def create_admin(username='admin'):
+    return get_user_model().objects.create_user(
+        username=username, email=f'{username}@example.com', password='x', is_staff=True
+    )
+
+
+def bearer_headers(user):
+    """
+    headers of an api request authenticated as user (the async client has no force_authenticate)
+    """
+    token = CustomTokenObtainPairSerializer.get_token(user).access_token
+    return {'authorization': f'Bearer {token}'}
+
+
+def create_departments(*names, company='Acme'):
+    """
+    departments of a new company (Engineering without names)
+    """
+    company = Company.objects.create(name=company)
+    return [Department.objects.create(company=company, name=name) for name in names or ('Engineering',)]
+
+
+def employee_fields(number=0, **fields):
+    """
+    the fields of a valid employee (Employee {number} <employee{number}@example.com>)
+    """
+    return {
+        'name': f'Employee {number}', 'email': f'employee{number}@example.com',
+        'mobile_number': '+123456789', 'address': '1 main st', 'designation': 'engineer',
+        **fields,
+    }
+
+
+def create_employee(department, number=0, **fields):
+    """
+    an employee of department and of its company, fields override the defaults
+    """
+    return Employee.objects.create(company_id=department.company_id, department=department,
+                                   **employee_fields(number, **fields))
@@ -0,0 +1,521 @@
+import base64
+import json
+import time
+from unittest import mock, skipUnless
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from apps.companies.models import Company
+from apps.departments.models import Department
+from apps.employees.models import Employee, EmployeeStatus
+from apps.employees.views import EmployeeViewSet
+from core.cache import GLOBAL_SCOPE, CacheStatsView, company_scope, get_generation
+from core.dbpool.pool import ConnectionPool, PoolTimeout
+from core.dbrouter import PIN_COOKIE, PIN_HEADER, ReplicaRouter, ReplicaRoutingMiddleware
+from core.indexaudit import IndexAudit, Suggestion, condition_columns
+from core.pagination import estimate_count
+from core.search import trigram_available
+from core.testing import bearer_headers, create_admin, create_departments, create_employee, employee_fields
+
+
+class IndexAuditTests(TestCase):
+    """
+    manage.py audit_indexes reads the plans of the list endpoint queries
+    """
+
+    def test_condition_columns(self):
+        condition = ("((company_id = 12) AND ((status)::text = 'HIRED'::text) AND "
+                     "(hired_on <= (statement_timestamp() - '365 days'::interval)) AND "
+                     "((created_at < '2026-01-01'::timestamp with time zone) OR (id > 4)))")
+        self.assertEqual(condition_columns(condition), (['company_id', 'status'], ['hired_on']))
+
+    def test_backward_scan_serves_a_suggestion(self):
+        suggestion = Suggestion('employees_employee', ('company_id', 'status'), (('hired_on', True),))
+        self.assertTrue(suggestion.served_by((('status', False), ('company_id', False), ('hired_on', False))))
+        self.assertFalse(suggestion.served_by((('status', False), ('hired_on', False))))
+
+    def test_audit_runs_every_combination(self):
+        [department] = create_departments()
+        company = department.company
+        create_employee(department, name='Jane Doe', email='jane@example.com', status=EmployeeStatus.HIRED)
+        audit = IndexAudit(max_filters=1, min_rows=0, endpoints=['/api/v1/employees/']).run()
+        self.assertEqual(audit.errors, [])
+        combinations = {str(combination) for query in audit.queries.values()
+                        for combination in query.combinations}
+        self.assertIn('/api/v1/employees/?min_days_employed=365&ordering=days_employed', combinations)
+        self.assertIn(f'/api/v1/employees/?company={company.pk}&search=Jane&search_mode=fulltext',
+                      combinations)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """
+    the DB_CONNECTIONS=pool pool (core.dbpool) against the test database
+    """
+
+    def setUp(self):
+        params = connection.get_connection_params()
+        self.connect = lambda: psycopg2.connect(**params)
+
+    def pool(self, **options):
+        pool = ConnectionPool('test', **{'timeout': 0.05, **options})
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_max_size_and_timeout(self):
+        pool = self.pool(max_size=1)
+        first = pool.getconn(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(self.connect)
+        pool.putconn(first)
+        self.assertIs(pool.getconn(self.connect), first)
+        stats = pool.stats()
+        self.assertEqual((stats['connections_opened'], stats['timeouts'], stats['in_use']), (1, 1, 1))
+
+    def test_checkin_rolls_back(self):
+        pool = self.pool()
+        conn = pool.getconn(self.connect)
+        conn.cursor().execute('SELECT 1')
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_INTRANS)
+        pool.putconn(conn)
+        self.assertEqual(conn.info.transaction_status, TRANSACTION_STATUS_IDLE)
+
+    def test_dead_connection_is_replaced(self):
+        pool = self.pool(check_idle=0)
+        conn = pool.getconn(self.connect)
+        pool.putconn(conn)
+        killer = self.connect()
+        killer.autocommit = True
+        killer.cursor().execute('SELECT pg_terminate_backend(%s)', [conn.info.backend_pid])
+        killer.close()
+        replacement = pool.getconn(self.connect)
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(pool.stats()['connections_closed'], {'health_check': 1})
+
+    def test_recycled_after_max_lifetime(self):
+        pool = self.pool(max_lifetime=0)
+        conn = pool.getconn(self.connect)
+        pool.putconn(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['connections_closed'], {'lifetime': 1})
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'], DB_REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    GETs of the opted in views read from a replica, unless the client wrote recently
+    """
+
+    def route(self, method, view, status=200, **extra):
+        decisions = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            decisions.append((router.db_for_read(Employee), router.db_for_write(Employee)))
+            return HttpResponse(status=status)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        request = getattr(RequestFactory(), method)('/', **extra)
+        response = middleware(request)
+        return decisions[0], response
+
+    def test_reads(self):
+        (read, write), _response = self.route('get', EmployeeViewSet.as_view({'get': 'list'}))
+        self.assertIn(read, ['replica_a', 'replica_b'])
+        self.assertEqual(write, 'default')
+        (read, _write), _response = self.route('get', CacheStatsView.as_view())
+        self.assertEqual(read, 'default')
+        self.assertEqual(router.db_for_read(Employee), 'default')
+
+    def test_writes_pin_to_the_primary(self):
+        (read, _write), response = self.route('post', EmployeeViewSet.as_view({'post': 'create'}))
+        self.assertEqual(read, 'default')
+        until = response[PIN_HEADER]
+        self.assertEqual(response.cookies[PIN_COOKIE].value, until)
+        self.assertAlmostEqual(float(until), time.time() + 10, delta=2)
+
+        view = EmployeeViewSet.as_view({'get': 'list'})
+        (read, _write), _response = self.route('get', view, HTTP_X_DB_PINNED_UNTIL=until)
+        self.assertEqual(read, 'default')
+        (read, _write), _response = self.route('get', view, HTTP_COOKIE=f'{PIN_COOKIE}={until}')
+        self.assertEqual(read, 'default')
+        (read, _write), _response = self.route('get', view, HTTP_X_DB_PINNED_UNTIL=str(time.time() - 1))
+        self.assertIn(read, ['replica_a', 'replica_b'])
+
+    def test_failed_writes_do_not_pin(self):
+        _decision, response = self.route('post', EmployeeViewSet.as_view({'post': 'create'}), status=400)
+        self.assertFalse(response.has_header(PIN_HEADER))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a'])
+class CachedReplicaReadTests(TransactionTestCase):
+    """
+    a response stored by the response cache is read from the primary, a
+    replica behind the generation bump would cache a stale body for everyone
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.headers = bearer_headers(create_admin())
+        [self.department] = create_departments()
+        self.url = f'/api/v1/departments/?company={self.department.company_id}'
+
+    def test_misses_read_the_primary(self):
+        decisions = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            if model is Department:
+                decisions.append(alias)
+            return 'default'  # replica_a only exists in this test
+        with mock.patch.object(ReplicaRouter, 'db_for_read', record):
+            self.client.get(self.url, headers=self.headers)
+            # the ETag version on the replica, the cached body on the primary
+            self.assertEqual(decisions, ['replica_a', 'default'])
+            decisions.clear()
+            self.assertEqual(self.client.get(self.url, headers=self.headers).data[0]['name'], 'Engineering')
+            self.assertEqual(decisions, ['replica_a'])
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'needs DB_REPLICA_HOSTS (the replicas mirror the test database)')
+class LaggingReplicaCacheTests(TransactionTestCase):
+    """
+    a writer reads its write despite a replica that lags behind it and the
+    response cache in front of it
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        admin = create_admin()
+        self.writer, self.reader = APIClient(), APIClient()
+        self.writer.force_authenticate(admin)
+        self.reader.force_authenticate(admin)
+        [self.department] = create_departments()
+        self.url = f'/api/v1/departments/?company={self.department.company_id}'
+
+    def test_pinned_writer_reads_its_write(self):
+        replica = settings.DATABASE_REPLICAS[0]
+        with override_settings(DATABASE_REPLICAS=[replica]), transaction.atomic(using=replica):
+            with connections[replica].cursor() as cursor:
+                # the replica keeps the snapshot of before the write
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                cursor.execute('SELECT count(*) FROM departments_department')
+            response = self.writer.patch(f'/api/v1/departments/{self.department.pk}/',
+                                         {'name': 'Research'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            # another client fills the cache of the new generation
+            self.assertEqual(self.reader.get(self.url).data[0]['name'], 'Research')
+            # the writer (pinned by the cookie of its write) gets the cached body
+            self.assertEqual(self.writer.get(self.url).data[0]['name'], 'Research')
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    ?page_size= / ?cursor= pages (core.pagination) over the employee list,
+    ordered by ('-created_at', 'id')
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [department] = create_departments()
+        for number in range(5):
+            create_employee(department, number)
+        cls.ordered = list(Employee.objects.order_by('-created_at', 'id').values_list('pk', flat=True))
+        cls.headers = bearer_headers(create_admin())
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_next_and_previous(self):
+        pages, url = [], '/api/v1/employees/?page_size=2'
+        while url:
+            page = self.get(url)
+            pages.append([row['id'] for row in page['results']])
+            url = page['next']
+        self.assertEqual(pages, [self.ordered[0:2], self.ordered[2:4], self.ordered[4:]])
+        self.assertIsNone(self.get('/api/v1/employees/?page_size=2')['previous'])
+
+        backwards, url = [], page['previous']
+        while url:
+            page = self.get(url)
+            backwards.append([row['id'] for row in page['results']])
+            url = page['previous']
+        self.assertEqual(backwards, [self.ordered[2:4], self.ordered[0:2]])
+
+    def test_invalid_cursor(self):
+        def cursor(*values):
+            return base64.urlsafe_b64encode(json.dumps({'v': values, 'r': 0}).encode()).decode()
+        # wrong length, then well formed but tampered values ('-created_at', 'id')
+        for value in ('garbage', cursor(1), cursor('zzz', 'abc'), cursor(None, 1),
+                      cursor('2024-01-01T00:00:00+00:00', {'id': 1})):
+            with self.subTest(cursor=value):
+                response = self.client.get(f'/api/v1/employees/?page_size=5&cursor={value}', headers=self.headers)
+                self.assertEqual(response.status_code, 404)
+        valid = cursor('2000-01-01T00:00:00+00:00', 1)
+        response = self.client.get(f'/api/v1/employees/?page_size=5&cursor={valid}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_count_modes(self):
+        page = self.get('/api/v1/employees/?page_size=2')
+        # a small estimate is confirmed, the count is exact
+        self.assertEqual((page['count'], page['count_is_approximate']), (5, False))
+        self.assertIsNone(self.get('/api/v1/employees/?page_size=2&count=none')['count'])
+        with mock.patch('core.pagination.planner_estimate', return_value=5000):
+            page = self.get('/api/v1/employees/?page_size=2')
+        self.assertEqual((page['count'], page['count_is_approximate']), (5000, True))
+
+    def test_stale_estimate_is_not_counted_in_full(self):
+        # the table grew since the planner statistics: the confirming count stops at exact_below
+        with mock.patch('core.pagination.planner_estimate', return_value=1), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(estimate_count(Employee.objects.all(), exact_below=3), (3, False))
+            self.assertIn('LIMIT 3', queries[-1]['sql'])
+            self.assertEqual(estimate_count(Employee.objects.all(), exact_below=10), (5, True))
+
+
+class SearchModeTests(TestCase):
+    """
+    ?search= with ?search_mode=contains|prefix|fulltext|fuzzy (core.search)
+    over the employee list
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [department] = create_departments()
+        cls.johnson, cls.john, cls.jane = [
+            create_employee(department, number, name=name).pk
+            for number, name in enumerate(('Johnson Smith', 'John Smithers', 'Jane Doe'), 1)
+        ]
+        cls.headers = bearer_headers(create_admin())
+
+    def search(self, term, mode=None):
+        query = f'?search={term}' + (f'&search_mode={mode}' if mode else '')
+        response = self.client.get(f'/api/v1/employees/{query}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.data}
+
+    def test_contains(self):
+        self.assertEqual(self.search('mith'), {self.johnson, self.john})
+        # an unknown mode is the default one
+        self.assertEqual(self.search('mith', 'bogus'), {self.johnson, self.john})
+
+    def test_prefix(self):
+        self.assertEqual(self.search('jo smith', 'prefix'), {self.johnson, self.john})
+        self.assertEqual(self.search('smithe', 'prefix'), {self.john})
+        self.assertEqual(self.search('mith', 'prefix'), set())
+        self.assertEqual(self.search('*:!', 'prefix'), set())  # no words, no malformed tsquery
+
+    def test_fulltext(self):
+        self.assertEqual(self.search('"john smithers"', 'fulltext'), {self.john})
+        self.assertEqual(self.search('jane or johnson', 'fulltext'), {self.jane, self.johnson})
+        self.assertEqual(self.search('smith -johnson', 'fulltext'), set())
+
+    def test_fuzzy(self):
+        if not trigram_available('default'):
+            # without pg_trgm the mode is contains
+            self.assertEqual(self.search('Smith', 'fuzzy'), {self.johnson, self.john})
+            self.skipTest('pg_trgm is not installed')
+        self.assertEqual(self.search('Jonson Smith', 'fuzzy'), {self.johnson})
+
+    def test_ranked_pages(self):
+        """
+        the rank is part of the pagination cursor, paging a ranked search
+        returns every match once
+        """
+        ids, url = [], '/api/v1/employees/?search=jo&search_mode=prefix&page_size=1'
+        while url:
+            page = self.client.get(url, headers=self.headers).data
+            ids += [row['id'] for row in page['results']]
+            url = page['next']
+        self.assertCountEqual(ids, [self.johnson, self.john])
+
+
+class SparseFieldsTests(TestCase):
+    """
+    ?fields= / ?expand= (core.serializers) shape the reads of the employee
+    api, the writes ignore them
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [cls.department] = create_departments()
+        cls.employee = create_employee(cls.department, 1)
+        cls.headers = bearer_headers(create_admin())
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, query):
+        response = self.client.get(f'/api/v1/employees/{self.employee.pk}/{query}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get('?fields=id,name'), {'id': self.employee.pk, 'name': 'Employee 1'})
+        [select] = [query['sql'] for query in queries if '"employees_employee"."name"' in query['sql']]
+        self.assertNotIn('"address"', select)
+        self.assertEqual(self.get('?fields=id,department_details.name'),
+                         {'id': self.employee.pk, 'department_details': {'name': 'Engineering'}})
+
+    def test_expand(self):
+        self.assertIn('company_details', self.get(''))  # the full shape embeds everything
+        data = self.get('?expand=department_details.company_details')
+        self.assertNotIn('company_details', data)
+        self.assertEqual(data['department_details']['company_details']['name'], 'Acme')
+        self.assertEqual(data['email'], self.employee.email)
+
+    def test_writes_keep_every_field(self):
+        url = f'/api/v1/employees/{self.employee.pk}/?fields=id'
+        response = self.client.patch(url, {'name': 'Renamed', 'designation': 'lead'},
+                                     content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.employee.refresh_from_db()
+        self.assertEqual((self.employee.name, self.employee.designation), ('Renamed', 'lead'))
+        self.assertEqual(response.data['name'], 'Renamed')
+
+        fields = employee_fields(2, company=self.department.company_id, department=self.department.pk)
+        response = self.client.post('/api/v1/employees/?fields=id', fields,
+                                    content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Employee.objects.get(pk=response.data['id']).email, 'employee2@example.com')
+
+
+class ResponseCacheTests(TestCase):
+    """
+    writes to companies, departments and employees invalidate the cached
+    responses of their company (and the global lists) once they commit
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.engineering, cls.research = create_departments('Engineering', 'Research')
+        [cls.sales] = create_departments('Sales', company='Globex')
+        cls.company, cls.other = cls.engineering.company, cls.sales.company
+        cls.employee = create_employee(cls.engineering, 1)
+        cls.headers = bearer_headers(create_admin())
+
+    def setUp(self):
+        cache.clear()
+
+    def generations(self):
+        return [get_generation(company_scope(self.company.pk)), get_generation(company_scope(self.other.pk)),
+                get_generation(GLOBAL_SCOPE)]
+
+    def assertBumped(self, write, company=True, other=False):
+        """
+        write() bumps the generations of the company / the other company
+        and the global one, when its transaction commits
+        """
+        before = self.generations()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            write()
+        self.assertEqual(self.generations(), before)
+        for callback in callbacks:
+            callback()
+        changed = [after != previous for after, previous in zip(self.generations(), before)]
+        self.assertEqual(changed, [company, other, True])
+
+    def test_company_writes(self):
+        def save():
+            self.company.name = 'Acme Corp'
+            self.company.save()
+        self.assertBumped(save)
+        self.assertBumped(lambda: Company.objects.get(pk=self.other.pk).delete(), company=False, other=True)
+
+    def test_department_writes(self):
+        def save():
+            self.research.name = 'Lab'
+            self.research.save()
+        self.assertBumped(save)
+        self.assertBumped(lambda: Department.objects.get(pk=self.research.pk).delete())
+
+    def test_employee_writes(self):
+        def move():
+            self.employee.department, self.employee.company = self.sales, self.other
+            self.employee.save()
+        self.assertBumped(lambda: create_employee(self.engineering, 2))
+        self.assertBumped(move, other=True)
+        self.assertBumped(lambda: Employee.objects.get(pk=self.employee.pk).delete(), company=False, other=True)
+
+    def test_hits_until_a_write(self):
+        url = f'/api/v1/companies/{self.company.pk}/'
+        self.assertEqual(self.client.get(url, headers=self.headers).data['name'], 'Acme')
+        # the cached body is served, a stale row would show
+        Company.objects.filter(pk=self.company.pk).update(name='Renamed quietly')
+        self.assertEqual(self.client.get(url, headers=self.headers).data['name'], 'Acme')
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.get(pk=self.company.pk).save()
+        self.assertEqual(self.client.get(url, headers=self.headers).data['name'], 'Renamed quietly')
+        stats = self.client.get('/api/v1/cache/stats/', headers=self.headers).data['endpoints']['companies']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+
+class ConditionalGetTests(TestCase):
+    """
+    ETag / Last-Modified on the read endpoints (core.conditional): 304 while
+    the client copy is current, 200 with new validators after a write
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        [cls.department] = create_departments()
+        cls.company = cls.department.company
+        cls.employee = create_employee(cls.department, 1)
+        cls.headers = bearer_headers(create_admin())
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers={**self.headers, **headers})
+
+    def test_not_modified_until_a_write(self):
+        url = f'/api/v1/companies/{self.company.pk}/'
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        # a miss, then a cache hit: same validators
+        self.assertEqual(self.get(url)['ETag'], etag)
+
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(self.get(url, **{'If-Modified-Since': last_modified}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'name': 'Acme Corp'}, content_type='application/json',
+                                         headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.data['name']), (200, 'Acme Corp'))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(url, **{'If-None-Match': response['ETag']}).status_code, 304)
+
+    def test_list_follows_the_related_rows(self):
+        url = f'/api/v1/employees/?company={self.company.pk}'
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, **{'If-None-Match': etag}).status_code, 304)
+        # the list shows the department name
+        self.department.name = 'Research'
+        self.department.save()
+        response = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.data[0]['department_name']), (200, 'Research'))
+        # and a query string of its own is a representation of its own
+        self.assertNotEqual(self.get(f'{url}&status=HIRED')['ETag'], response['ETag'])
+
+    def test_writes_are_not_conditional(self):
+        url = f'/api/v1/companies/{self.company.pk}/'
+        etag = self.get(url)['ETag']
+        response = self.client.patch(url, {'name': 'Acme Corp'}, content_type='application/json',
+                                     headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
@@ -17,6 +17,21 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.documentation import include_docs_urls #  to include DRF's auto-generated API documentation.
+from apps.companies.views import AsyncCompanyListView, AsyncCompanyOverviewView
+from apps.departments.views import AsyncDepartmentListView
+from apps.employees.views import AsyncEmployeeDetailView, AsyncEmployeeListView, AsyncHiredReportView
+from core.cache import CacheStatsView
+from core.dbpool.views import PoolStatsView
+
+# async versions of the read endpoints (core.asyncviews), for ASGI servers (core.asgi)
+async_patterns = [
+    path('companies/', AsyncCompanyListView.as_view(), name='async_company_list'),
+    path('companies/<str:pk>/overview/', AsyncCompanyOverviewView.as_view(), name='async_company_overview'),
+    path('departments/', AsyncDepartmentListView.as_view(), name='async_department_list'),
+    path('employees/', AsyncEmployeeListView.as_view(), name='async_employee_list'),
+    path('employees/hired_report/', AsyncHiredReportView.as_view(), name='async_hired_report'),
+    path('employees/<str:pk>/', AsyncEmployeeDetailView.as_view(), name='async_employee_detail'),
+]
 
 # api url patterns with versioning
 api_patterns = [
@@ -25,6 +40,11 @@ api_patterns = [
     path('companies/', include('apps.companies.urls')),
     path('departments/', include('apps.departments.urls')),
     path('employees/', include('apps.employees.urls')),
+    path('reports/', include('apps.reports.urls')),
+    path('changes/', include('apps.changes.urls')),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('db/pool/stats/', PoolStatsView.as_view(), name='db_pool_stats'),
+    path('async/', include(async_patterns)),
 ]
 
 urlpatterns = [
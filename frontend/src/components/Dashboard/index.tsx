@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import {
   Box,
   Button,
@@ -26,6 +26,8 @@ import DeleteIcon from '@mui/icons-material/Delete';
 import AddIcon from '@mui/icons-material/Add';
 import LogoutIcon from '@mui/icons-material/Logout';
 import { api } from '../../services/api';
+import { subscribeToChanges } from '../../services/changes.service';
+import { Change } from '../../types/change.types';
 import { useAuth } from '../../hooks/useAuth'; 
 
 interface Employee {
@@ -64,6 +66,45 @@ export const Dashboard: React.FC = () => {
     fetchDepartments();
   }, []);
 
+  // live updates (GET /changes/stream/): name / status changes are patched in
+  // place, anything else reloads the list once the burst of changes is over
+  const refetchTimer = useRef<ReturnType<typeof setTimeout>>();
+  const employeesRef = useRef(employees);
+  employeesRef.current = employees;
+  useEffect(() => {
+    const refetchSoon = () => {
+      clearTimeout(refetchTimer.current);
+      refetchTimer.current = setTimeout(fetchEmployees, 500);
+    };
+    const applyChange = (change: Change) => {
+      if (change.model !== 'employee') {
+        refetchSoon();
+        return;
+      }
+      if (change.action === 'moved') {
+        return; // we list every company, the update of the new one follows
+      }
+      if (change.action === 'deleted') {
+        setEmployees((current) => current.filter((employee) => employee.id !== change.object_id));
+        return;
+      }
+      const { department, ...fields } = change.data;
+      const shown = employeesRef.current.find((employee) => employee.id === change.object_id);
+      if (!shown || (department !== undefined && department !== shown.department)) {
+        refetchSoon(); // new rows and department names come with the list
+        return;
+      }
+      setEmployees((current) => current.map((employee) => (
+        employee.id === change.object_id ? { ...employee, ...fields } : employee
+      )));
+    };
+    const unsubscribe = subscribeToChanges({ onChange: applyChange, onReset: refetchSoon });
+    return () => {
+      unsubscribe();
+      clearTimeout(refetchTimer.current);
+    };
+  }, []);
+
   const fetchEmployees = async () => {
     try {
       console.log('Fetching employees...');
@@ -75,20 +75,19 @@ export const EmployeeProfile: React.FC = () => {
   useEffect(() => {
     const fetchEmployeeDetails = async () => {
       try {
-        if (!currentUser?.employee_id) {
-          setError('No employee ID found for this user');
+        setLoading(true);
+
+        // the user and their employee profile in one (cached) request
+        const response = await api.get('/auth/me/');
+        const employeeData = response.data.employee;
+        console.log('Employee data:', employeeData);
+
+        if (!employeeData) {
+          setError('No employee profile found for this user');
           setLoading(false);
           return;
         }
 
-        setLoading(true);
-        console.log('Fetching employee details for ID:', currentUser.employee_id);
-        
-        // Fetch employee details directly using the ID
-        const response = await api.get(`/employees/${currentUser.employee_id}/`);
-        const employeeData = response.data;
-        console.log('Employee data:', employeeData);
-
         setEmployee({
           name: employeeData.name,
           email: employeeData.email,
@@ -98,10 +97,10 @@ export const EmployeeProfile: React.FC = () => {
           status: employeeData.status || 'PENDING',
           hired_on: employeeData.hired_on || null,
           company: {
-            name: employeeData.company_details?.name || 'N/A'
+            name: employeeData.company_name || 'N/A'
           },
           department: {
-            name: employeeData.department_details?.name || 'N/A'
+            name: employeeData.department_name || 'N/A'
           }
         });
         setLoading(false);
@@ -1,5 +1,10 @@
 import axios from 'axios';
 
+// read-your-writes: after a write the api pins us to the primary database
+// for a few seconds, the pin is sent back with the following requests
+const PIN_HEADER = 'X-DB-Pinned-Until';
+let pinnedUntil = 0;
+
 export const api = axios.create({
   baseURL: 'http://localhost:8000/api/v1',
   headers: {
@@ -12,7 +17,18 @@ api.interceptors.request.use((config) => {
   if (token) {
     config.headers.Authorization = `Bearer ${token}`;
   }
+  if (pinnedUntil > Date.now() / 1000) {
+    config.headers[PIN_HEADER] = String(pinnedUntil);
+  }
   return config;
 });
 
-export default api;
\ No newline at end of file
+api.interceptors.response.use((response) => {
+  const pin = Number(response.headers[PIN_HEADER.toLowerCase()]);
+  if (pin) {
+    pinnedUntil = pin;
+  }
+  return response;
+});
+
+export default api;
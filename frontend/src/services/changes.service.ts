@@ -0,0 +1,85 @@
+import api from './api';
+import { Change } from '../types/change.types';
+
+// server-sent events of GET /changes/stream/, read with fetch: EventSource
+// cannot send the Authorization header. the server ends a stream every few
+// minutes, we reconnect with the Last-Event-ID and get what we missed
+export interface ChangeHandlers {
+  onChange: (change: Change) => void;
+  // the server could not resume (changes pruned): reload what is shown
+  onReset?: () => void;
+}
+
+const parseEvent = (block: string) => {
+  const event: { type?: string; id?: string; data?: string; retry?: number } = {};
+  for (const line of block.split('\n')) {
+    if (!line || line.startsWith(':')) continue; // heartbeat
+    const separator = line.indexOf(':');
+    const field = separator < 0 ? line : line.slice(0, separator);
+    const value = separator < 0 ? '' : line.slice(separator + 1).replace(/^ /, '');
+    if (field === 'event') event.type = value;
+    else if (field === 'id') event.id = value;
+    else if (field === 'data') event.data = event.data === undefined ? value : `${event.data}\n${value}`;
+    else if (field === 'retry') event.retry = Number(value);
+  }
+  return event;
+};
+
+export const subscribeToChanges = (handlers: ChangeHandlers, company?: number) => {
+  const controller = new AbortController();
+  let lastEventId: string | undefined;
+  let retry = 3000;
+
+  const connect = async () => {
+    const token = localStorage.getItem('token');
+    const query = company ? `?company=${company}` : '';
+    const response = await fetch(`${api.defaults.baseURL}/changes/stream/${query}`, {
+      headers: {
+        Accept: 'text/event-stream',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
+        ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {}),
+      },
+      signal: controller.signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`change stream answered ${response.status}`);
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) return;
+      buffer += value.replace(/\r\n?/g, '\n');
+      let end;
+      while ((end = buffer.indexOf('\n\n')) >= 0) {
+        const event = parseEvent(buffer.slice(0, end));
+        buffer = buffer.slice(end + 2);
+        if (event.retry) retry = event.retry;
+        if (event.id) lastEventId = event.id;
+        if (event.type === 'change' && event.data) {
+          handlers.onChange(JSON.parse(event.data));
+        } else if (event.type === 'reset') {
+          handlers.onReset?.();
+        }
+      }
+    }
+  };
+
+  const run = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        await connect();
+      } catch (error) {
+        if (controller.signal.aborted) return;
+        console.error('Change stream error:', error);
+      }
+      await new Promise((resolve) => setTimeout(resolve, retry));
+    }
+  };
+  run();
+
+  // unsubscribe
+  return () => controller.abort();
+};
+
+export default subscribeToChanges;
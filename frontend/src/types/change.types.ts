@@ -0,0 +1,10 @@
+export interface Change {
+    id: number;
+    model: 'employee' | 'department' | 'company';
+    action: 'created' | 'updated' | 'moved' | 'deleted';
+    object_id: number;
+    company: number;
+    // the fields a dashboard shows (name, status, department), {} for deletes
+    data: Record<string, any>;
+    at: string;
+}